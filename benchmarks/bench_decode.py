@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Per-photo decode and resize timings for the thumbnail pipeline.
+
+Compares strict quality decoding (full resolution decode) with the default
+fast path (JPEG draft mode).  Pass JPEG files to benchmark real photos,
+otherwise a synthetic 24 MP JPEG is generated.
+
+    python benchmarks/bench_decode.py [photo.jpg ...] [--runs N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from fussel.generator.config import DEFAULT_PHOTO_SIZES  # noqa: E402
+from fussel.generator.util import calculate_new_size, resize_cascade  # noqa: E402
+
+
+def _synthetic_photo(path, size=(6000, 4000)):
+    # A gradient compresses like a real photo far better than flat colour
+    im = Image.linear_gradient("L").resize(size).convert("RGB")
+    im.save(path, quality=90)
+    return path
+
+
+def _time_photo(path, fast_decode, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        with Image.open(path) as im:
+            sizes = [calculate_new_size(im.size, size) for size in DEFAULT_PHOTO_SIZES]
+            for _size, resized in resize_cascade(im, sizes, fast_decode=fast_decode):
+                resized.load()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("photos", nargs="*", help="JPEG files to benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="runs per photo, best time is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        photos = args.photos or [_synthetic_photo(os.path.join(tmpdir, "synthetic.jpg"))]
+
+        print(f"{'photo':<40} {'strict (ms)':>12} {'fast (ms)':>12} {'speedup':>8}")
+        for photo in photos:
+            strict = _time_photo(photo, False, args.runs)
+            fast = _time_photo(photo, True, args.runs)
+            print(f"{os.path.basename(photo):<40} {strict * 1000:>12.1f} {fast * 1000:>12.1f} {strict / fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
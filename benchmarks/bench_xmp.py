@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Microbenchmark of XMP face and date parsing.
+
+Compares the streaming parser in fussel.generator.xmp with the previous
+BeautifulSoup based approach (one tree per packet plus repeated find_all
+calls).  BeautifulSoup is only needed for the comparison column.
+
+    python benchmarks/bench_xmp.py [--regions N] [--number N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from fussel.generator.xmp import parse_xmp  # noqa: E402
+
+try:
+    from bs4 import BeautifulSoup, XMLParsedAsHTMLWarning
+except ImportError:
+    BeautifulSoup = None
+
+REGION = """<rdf:li><rdf:Description mwg-rs:Name="Person {i}" mwg-rs:Type="Face">
+<mwg-rs:Area stArea:x="0.{i}" stArea:y="0.5" stArea:w="0.1" stArea:h="0.1" stArea:unit="normalized"/>
+</rdf:Description></rdf:li>"""
+
+PACKET = """<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+<rdf:Description rdf:about="" xmlns:xmp="http://ns.adobe.com/xap/1.0/"
+ xmlns:mwg-rs="http://www.metadataworkinggroup.com/schemas/regions/"
+ xmlns:stArea="http://ns.adobe.com/xmp/sType/Area#" xmp:CreateDate="2021-05-04T10:20:30">
+<mwg-rs:Regions rdf:parseType="Resource"><mwg-rs:RegionList><rdf:Bag>{regions}</rdf:Bag></mwg-rs:RegionList>
+</mwg-rs:Regions></rdf:Description></rdf:RDF></x:xmpmeta>{padding}<?xpacket end="w"?>"""
+
+
+def _soup(body):
+    try:
+        return BeautifulSoup(body, "xml")
+    except Exception:
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
+            return BeautifulSoup(body, "html.parser")
+
+
+def _bs4_faces_and_date(body):
+    # The previous implementation parsed the packet once for the date and once for faces
+    results = []
+    for _ in range(2):
+        soup = _soup(body)
+        descriptions = soup.find_all("rdf:description") or soup.find_all("description")
+        for desc in descriptions:
+            areas = desc.find_all("mwg-rs:area", recursive=False) or desc.find_all("area", recursive=False)
+            if not areas:
+                areas = desc.find_all("mwg-rs:area") or desc.find_all("area")
+            results.append((desc.get("mwg-rs:name") or desc.get("name"), len(areas)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--regions", type=int, default=5, help="face regions per packet")
+    parser.add_argument("--number", type=int, default=500, help="parses per measurement")
+    args = parser.parse_args()
+
+    regions = "".join(REGION.format(i=i) for i in range(args.regions))
+    # Real packets carry a few KB of whitespace padding for in-place editing
+    body = PACKET.format(regions=regions, padding=" " * 2048)
+
+    fast = min(timeit.repeat(lambda: parse_xmp(body), number=args.number, repeat=5)) / args.number
+    print(f"packet: {len(body)} bytes, {args.regions} regions")
+    print(f"xmp.parse_xmp      {fast * 1e6:10.1f} us/photo")
+    if BeautifulSoup is None:
+        print("BeautifulSoup      not installed, skipping comparison")
+        return
+    slow = min(timeit.repeat(lambda: _bs4_faces_and_date(body), number=args.number, repeat=5)) / args.number
+    print(f"BeautifulSoup      {slow * 1e6:10.1f} us/photo  ({slow / fast:.1f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
 import pathlib
 import shutil
@@ -7,6 +8,7 @@ import shutil
 import yaml
 
 from .generator import SiteGenerator
+from .generator.util import sync_file
 
 
 class YamlConfig:
@@ -50,13 +52,28 @@ class YamlConfig:
         return cursor.get(k, default)
 
 
-def main():
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description="Generate a static photo gallery.")
+    parser.add_argument(
+        "--preview",
+        action="store_true",
+        help="quick throwaway build with the fastest resize settings, kept apart from the real gallery",
+    )
+    args = parser.parse_args(argv)
 
     cfg = YamlConfig()
+    if args.preview:
+        # Flat keys take precedence in getKey and travel with the config to the workers
+        cfg.cfg["gallery.preview"] = True
 
     generator = SiteGenerator(cfg)
     generator.generate()
 
+    if args.preview:
+        print("Preview generated, to browse it run: \n   make dev")
+        return
+
     http_root = cfg.getKey("site.http_root", "/")
     web_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "web")
 
@@ -83,6 +100,7 @@ def main():
         )
     print("Copying site to output location...")
     print(f"  {site_location}  --->  {new_site_location}")
+    # The build leaves the photos out, they are published from where they were generated, below
     shutil.copytree(
         site_location,
         new_site_location,
@@ -92,6 +110,17 @@ def main():
         dirs_exist_ok=True,
     )
 
+    # Unchanged photos are skipped, the others are linked when gallery.originals.link allows it
+    link = str(cfg.getKey("gallery.originals.link", "copy")).lower()
+    gallery_location = os.path.join(os.path.dirname(os.path.realpath(__file__)), "web", "public", "static", "_gallery")
+    if os.path.isdir(gallery_location):
+        shutil.copytree(
+            gallery_location,
+            os.path.join(new_site_location, "static", "_gallery"),
+            copy_function=lambda src, dst: sync_file(src, dst, link),
+            dirs_exist_ok=True,
+        )
+
     # Prevent GitHub Pages Jekyll processing from ignoring _gallery
     with open(os.path.join(new_site_location, ".nojekyll"), "w") as f:
         pass
@@ -6,6 +6,10 @@ DEFAULT_RECURSIVE_ALBUMS_NAME_PATTERN = "{parent_album} > {album}"
 DEFAULT_OUTPUT_PHOTOS_PATH = "site/"
 DEFAULT_SITE_TITLE = "Fussel Gallery"
 DEFAULT_PHOTO_SIZES = [(500, 500), (800, 800), (1024, 1024), (1600, 1600)]
+DEFAULT_VALIDATION = "on-decode"
+DEFAULT_MEMORY_BUDGET_MB = 2048
+DEFAULT_RESIZE_QUALITY = "balanced"
+MB = 1024 * 1024
 
 
 class Config:
@@ -55,6 +59,33 @@ class Config:
         cls._instance.parallel_tasks = int(yaml_config.getKey("gallery.parallel_tasks", _parallel_tasks))
 
         cls._instance.exif_transpose = bool(yaml_config.getKey("gallery.exif_transpose", False))
+        cls._instance.fast_decode = bool(yaml_config.getKey("gallery.fast_decode", True))
+        cls._instance.resize_quality = str(yaml_config.getKey("gallery.resize_quality", DEFAULT_RESIZE_QUALITY)).lower()
+
+        # Set by `fussel --preview`: throwaway build with the fastest settings
+        cls._instance.preview = bool(yaml_config.getKey("gallery.preview", False))
+        if cls._instance.preview:
+            cls._instance.fast_decode = True
+            cls._instance.resize_quality = "fast"
+
+        _validation = yaml_config.getKey("gallery.validation", DEFAULT_VALIDATION)
+        if _validation is False:  # YAML reads a bare `off` as a boolean
+            _validation = "off"
+        cls._instance.validation = str(_validation).lower()
+
+        cls._instance.manifest_content_hash = bool(yaml_config.getKey("gallery.manifest.content_hash", False))
+        cls._instance.metadata_cache_enabled = bool(yaml_config.getKey("gallery.metadata_cache", True))
+        cls._instance.memory_budget = int(yaml_config.getKey("gallery.memory.budget_mb", DEFAULT_MEMORY_BUDGET_MB)) * MB
+        cls._instance.worker_max_tasks = int(yaml_config.getKey("gallery.memory.max_tasks_per_worker", 500))
+        cls._instance.worker_trim_above = int(yaml_config.getKey("gallery.memory.trim_above_mb", 1024)) * MB
+        cls._instance.content_addressed = bool(yaml_config.getKey("gallery.content_addressed", False))
+        cls._instance.duplicates_enabled = bool(yaml_config.getKey("gallery.duplicates.enable", False))
+        cls._instance.duplicates_verify = bool(yaml_config.getKey("gallery.duplicates.verify", False))
+        cls._instance.output_sharding = bool(yaml_config.getKey("gallery.output_sharding", False))
+        cls._instance.originals_link = str(yaml_config.getKey("gallery.originals.link", "copy")).lower()
+        cls._instance.io_threads = int(yaml_config.getKey("gallery.io_threads", 4))
+        cls._instance.cleanup_enabled = bool(yaml_config.getKey("gallery.cleanup.enable", True))
+        cls._instance.cleanup_dry_run = bool(yaml_config.getKey("gallery.cleanup.dry_run", False))
 
         cls._instance.allow_download = bool(yaml_config.getKey("gallery.allow_download", True))
 
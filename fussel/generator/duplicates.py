@@ -0,0 +1,74 @@
+import hashlib
+
+from .manifest import file_hash
+
+# Bytes read from each end of a file for the quick hash
+QUICK_HASH_CHUNK = 64 * 1024
+
+
+def quick_hash(path, size):
+    """Digest of the size and both ends of a file, enough to tell photos apart
+    in practice while reading at most 2 * QUICK_HASH_CHUNK bytes."""
+    h = hashlib.blake2b(str(size).encode("ascii"), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(QUICK_HASH_CHUNK))
+        if size > 2 * QUICK_HASH_CHUNK:
+            f.seek(-QUICK_HASH_CHUNK, 2)
+        h.update(f.read())
+    return h.hexdigest()
+
+
+class DuplicateFinder:
+    """Recognises sources with the same content as one listed earlier in the build.
+
+    Only files sharing their size with an earlier one are hashed.  A match of
+    the quick hash is a duplicate, with ``verify`` the full contents are
+    compared as well (reusing the hash recorded in ``manifest`` when the file
+    did not change).  ``duplicates`` maps every duplicate found to
+    ``(original, filename, slug)``.
+    """
+
+    def __init__(self, verify=False, manifest=None):
+        self.verify = verify
+        self.manifest = manifest
+        self.by_size = {}
+        self.quick = {}
+        self.full = {}
+        self.duplicates = {}
+
+    def _quick(self, path, size):
+        if path not in self.quick:
+            self.quick[path] = quick_hash(path, size)
+        return self.quick[path]
+
+    def _full(self, path, st):
+        if path not in self.full:
+            record = self.manifest.get(path) if self.manifest is not None else None
+            if (
+                record is not None
+                and record.get("hash")
+                and record.get("size") == st.st_size
+                and record.get("mtime_ns") == st.st_mtime_ns
+            ):
+                self.full[path] = record["hash"]
+            else:
+                self.full[path] = file_hash(path)
+        return self.full[path]
+
+    def original_of(self, path, st):
+        """The earlier source ``path`` duplicates, None when its content is new."""
+        candidates = self.by_size.setdefault(st.st_size, [])
+        try:
+            for candidate, candidate_st in candidates:
+                if self._quick(candidate, st.st_size) != self._quick(path, st.st_size):
+                    continue
+                if not self.verify or self._full(candidate, candidate_st) == self._full(path, st):
+                    return candidate
+        except OSError:
+            # Unreadable files are reported by the worker processing them
+            return None
+        candidates.append((path, st))
+        return None
+
+    def add(self, path, original, filename, slug):
+        self.duplicates[path] = (original, filename, slug)
@@ -1,33 +1,58 @@
 #!/usr/bin/env python3
 
+import copy
+import itertools
 import json
 import os
 import shutil
+import time
+from contextlib import nullcontext
 from dataclasses import dataclass
 from datetime import datetime
-from multiprocessing import Pool, Queue
-from threading import RLock
+from multiprocessing import Pool
+from threading import RLock, Semaphore
 from urllib.parse import quote
 
-from bs4 import BeautifulSoup
-from PIL import Image, ImageFile, ImageOps, UnidentifiedImageError
-from PIL.ExifTags import TAGS
+from PIL import Image, ImageFile, UnidentifiedImageError
+from PIL.ExifTags import IFD, TAGS
 from rich import print
 
-from .config import Config
+from .config import DEFAULT_RESIZE_QUALITY, Config
+from .duplicates import DuplicateFinder
+from .iopool import IOPool
+from .manifest import Manifest, fingerprint, is_fresh, source_record, watermark_fingerprint
+from .memory import MemoryBudget, estimate_decode_bytes, resident_bytes, trim_memory
+from .metadata_cache import MetadataCache
+from .probe import PhotoProbe, probe_photo
+from .scheduling import BASE_COST, SMALL_JOB_BATCH, Scheduler, job_cost
 from .util import (
-    apply_watermark,
+    DirectoryIndex,
+    atomic_write,
     calculate_face_crop_dimensions,
     calculate_new_size,
+    crop_faces,
+    draft_size,
     extract_extension,
     find_unique_slug,
-    is_supported_album,
     is_supported_photo,
+    link_file,
+    load_watermark,
     pick_album_thumbnail,
+    remove_orphans,
+    resize_cascade,
+    save_image,
+    shard_dir,
 )
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
+# Folder under the albums output shared by content addressed photos
+STORE_DIR = "_store"
+# Tasks queued per worker process while streaming albums through the pool
+IN_FLIGHT_PER_WORKER = 4
+# Seconds between two progress reports
+PROGRESS_INTERVAL = 10
+
 
 class SimpleEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -69,6 +94,8 @@ class FaceGeometry:
 class Face:
     name: str
     geometry: FaceGeometry
+    crop: bytes = None  # Encoded person thumbnail, filled in by the worker that resized the photo
+    source: str = None  # Largest photo size on disk, to crop from when the worker did not
 
 
 class People:
@@ -89,6 +116,7 @@ class People:
         self.people_lock = RLock()
         self.slugs = set()
         self.slugs_lock = RLock()
+        self.face_crops = set()
 
     def json_dump_obj(self):
         r = {}
@@ -96,10 +124,13 @@ class People:
             r[v.slug] = v
         return r
 
-    def detect_faces(self, photo, original_src, largest_src, output_path, external_path):
+    def detect_faces(self, photo, original_src, output_path, external_path, faces=None):
 
         print(f"Searching in [magenta]{original_src}[/magenta]...")
-        faces = self.extract_faces(original_src)
+        if faces is None:
+            faces = self.extract_faces(original_src)
+            for face in faces:
+                face.source = original_src
 
         # Store face data on the photo object
         photo.faces = []
@@ -129,107 +160,56 @@ class People:
             )
 
             if not person.has_thumbnail():
-                with Image.open(largest_src) as im:
-                    face_size = face.geometry.w, face.geometry.h
-                    face_position = face.geometry.x, face.geometry.y
-                    new_face_photo = os.path.join(output_path, "%s_%s" % (person.slug, os.path.basename(original_src)))
-                    box = calculate_face_crop_dimensions(im.size, face_size, face_position)
-                    im_cropped = im.crop(box)
-                    im_cropped.save(new_face_photo)
-                    person.src = "%s/%s" % (external_path, os.path.basename(new_face_photo))
+                new_face_photo = os.path.join(output_path, "%s_%s" % (person.slug, os.path.basename(original_src)))
+                try:
+                    self.write_face_crop(face, new_face_photo)
+                except Exception as e:
+                    # The person keeps looking for a thumbnail in their next photos
+                    print(f"[yellow]Could not crop[/yellow] [cyan]{face.name}[/cyan] Reason: [red]{str(e)}[/red]")
+                    continue
+                self.face_crops.add(new_face_photo)
+                person.src = "%s/%s" % (external_path, os.path.basename(new_face_photo))
 
         return faces
 
-    def extract_faces(self, photo_path):
+    def write_face_crop(self, face, path):
+        """Write the person thumbnail of ``face`` to ``path``.
+
+        Workers crop the faces of the photos they resize.  A photo that was
+        not resized in this build keeps a thumbnail newer than its largest
+        size, or has it cut from that size here.
+        """
+        if face.crop is not None:
+            with atomic_write(path) as f:
+                f.write(face.crop)
+            return
+        try:
+            if os.path.getmtime(path) >= os.path.getmtime(face.source):
+                return
+        except OSError:
+            pass
+        with Image.open(face.source) as im:
+            face_size = face.geometry.w, face.geometry.h
+            face_position = face.geometry.x, face.geometry.y
+            box = calculate_face_crop_dimensions(im.size, face_size, face_position)
+            save_image(im.crop(box), path)
+
+    def extract_faces(self, photo_path, probe=None):
         """Extract face tags from image XMP metadata (MWG format).
         Handles variations in namespace prefixes and XML structure."""
         faces = []
         seen_faces = set()  # Track (name, x, y) to avoid duplicates
 
-        with Image.open(photo_path) as im:
-            if not hasattr(im, "applist"):
-                return faces
-
-            for segment, content in im.applist:
-                try:
-                    # XMP format can be either:
-                    # 1. \x00http://ns.adobe.com/xap/1.0/\x00<body> (starts with null)
-                    # 2. http://ns.adobe.com/xap/1.0/\x00<body> (doesn't start with null)
-                    parts = content.split(bytes("\x00", "utf-8"), 2)
-
-                    # Determine marker and body based on format
-                    if len(parts) >= 3:
-                        # Format 1: starts with null, parts[0] is empty, parts[1] is marker, parts[2] is body
-                        marker = parts[1].decode("utf-8", errors="ignore") if len(parts) > 1 else ""
-                        body_bytes = parts[2] if len(parts) > 2 else b""
-                    elif len(parts) == 2:
-                        # Format 2: doesn't start with null, parts[0] is marker, parts[1] is body
-                        marker = parts[0].decode("utf-8", errors="ignore")
-                        body_bytes = parts[1]
-                    else:
-                        continue
-
-                    if segment != "APP1" or marker != "http://ns.adobe.com/xap/1.0/":
-                        continue
+        if probe is None:
+            probe = probe_photo(photo_path)
 
-                    body_str = body_bytes.decode("utf-8")
-                    # Use 'xml' parser for better namespace handling
-                    try:
-                        soup = BeautifulSoup(body_str, "xml")
-                    except Exception:
-                        # Fallback to html.parser if xml parser not available
-                        import warnings
-
-                        from bs4 import XMLParsedAsHTMLWarning
-
-                        with warnings.catch_warnings():
-                            warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
-                            soup = BeautifulSoup(body_str, "html.parser")
-
-                    # Find all description elements (try both with and without namespace)
-                    descriptions = soup.find_all("rdf:description")
-                    if not descriptions:
-                        descriptions = soup.find_all("description")
-
-                    # Process each description element
-                    for desc in descriptions:
-                        # Get type and name (try both namespace formats)
-                        desc_type = desc.get("mwg-rs:type") or desc.get("type")
-                        name = (desc.get("mwg-rs:name") or desc.get("name") or "").strip()
-
-                        # Find areas (try both namespace formats and recursive search)
-                        areas = desc.find_all("mwg-rs:area", recursive=False)
-                        if not areas:
-                            areas = desc.find_all("area", recursive=False)
-                        if not areas:
-                            areas = desc.find_all("mwg-rs:area")
-                            if not areas:
-                                areas = desc.find_all("area")
-
-                        # Process if it's a Face type OR if it has a name and areas (some formats don't set type)
-                        if desc_type == "Face" or (name and areas):
-                            for area in areas:
-                                # Get area attributes (try both namespace formats)
-                                w = area.get("starea:w") or area.get("w") or ""
-                                h = area.get("starea:h") or area.get("h") or ""
-                                x = area.get("starea:x") or area.get("x") or ""
-                                y = area.get("starea:y") or area.get("y") or ""
-
-                                # Only add if we have valid coordinates and haven't seen this face before
-                                if w and h and x and y:
-                                    face_key = (name, x, y)
-                                    if face_key not in seen_faces:
-                                        seen_faces.add(face_key)
-                                        faces.append(Face(name=name, geometry=FaceGeometry(w=w, h=h, x=x, y=y)))
-
-                except (ValueError, UnicodeDecodeError, AttributeError, KeyError):
-                    # Skip segments that don't match expected format
-                    # Silently continue to next segment
-                    continue
-                except Exception:
-                    # Log unexpected errors but continue processing
-                    # This prevents one bad segment from breaking entire face detection
-                    continue
+        for xmp in probe.xmp:
+            for name, w, h, x, y in xmp.regions:
+                # Only add if we haven't seen this face before
+                face_key = (name, x, y)
+                if face_key not in seen_faces:
+                    seen_faces.add(face_key)
+                    faces.append(Face(name=name, geometry=FaceGeometry(w=w, h=h, x=x, y=y)))
 
         return faces
 
@@ -262,165 +242,125 @@ class Photo:
         self.exif = {}
 
     @classmethod
-    def _extract_date(cls, photo):
+    def _probe(cls, photo, metadata_cache=None, st=None):
+        """Read the photo's headers once and run every metadata extractor on the result.
+
+        With a ``metadata_cache`` and the photo's ``st`` (os.stat result), an
+        unchanged photo is not opened at all.
+        """
+        cached = None
+        if metadata_cache is not None and st is not None:
+            cached = metadata_cache.get(photo, st.st_size, st.st_mtime_ns)
+
+        if cached is not None:
+            probe = PhotoProbe(photo, cached["format"], cached["width"], cached["height"])
+            probe.date = cached["date"]
+            probe.exif_data = cached["exif_data"]
+            faces = [Face(name=name, geometry=FaceGeometry(w=w, h=h, x=x, y=y)) for name, w, h, x, y in cached["faces"]]
+        else:
+            probe = probe_photo(photo)
+            probe.date = cls._extract_date(photo, probe)
+            probe.exif_data = cls._extract_exif(photo, probe)
+            # Faces are cached even when people are disabled, so enabling them needs no re-read
+            faces = People.instance().extract_faces(photo, probe)
+            if metadata_cache is not None and st is not None and probe.format is not None:
+                metadata_cache.put(
+                    photo,
+                    st.st_size,
+                    st.st_mtime_ns,
+                    {
+                        "format": probe.format,
+                        "width": probe.width,
+                        "height": probe.height,
+                        "date": probe.date,
+                        "exif_data": probe.exif_data,
+                        "faces": [(f.name, f.geometry.w, f.geometry.h, f.geometry.x, f.geometry.y) for f in faces],
+                    },
+                )
+
+        if Config.instance().people_enabled:
+            probe.faces = faces
+        return probe
+
+    @classmethod
+    def _extract_date(cls, photo, probe=None):
         """Extract the capture date from a photo file.
 
-        Tries four methods in order: getexif(), _getexif(), XMP APP1 segment,
-        and finally the file modification time.  Returns an ISO-format date
+        Tries four methods in order: EXIF IFD0, the Exif sub-IFD, XMP APP1
+        segment, and finally the file modification time.  Returns an ISO-format date
         string, or None if nothing could be found.
         """
         date_str = None
 
+        if probe is None:
+            probe = probe_photo(photo)
+        exif = probe.exif
+
         # Method 1: Try getexif() (PIL 8.0+)
         try:
-            with Image.open(photo) as im:
-                if hasattr(im, "getexif"):
-                    exif = im.getexif()
-                    if exif is not None and len(exif) > 0:
-                        # 36867 = DateTimeOriginal, 36868 = DateTimeDigitized, 306 = DateTime
-                        for tag_id in [36867, 36868, 306]:
-                            if tag_id in exif:
-                                value = exif[tag_id]
-                                if value and isinstance(value, str):
-                                    try:
-                                        date_str = datetime.strptime(value, "%Y:%m:%d %H:%M:%S").isoformat()
-                                        break
-                                    except (ValueError, TypeError):
-                                        pass
-
-                        if not date_str:
-                            for tag_id, value in exif.items():
-                                if not value or not isinstance(value, str):
-                                    continue
-                                tag_name = TAGS.get(tag_id, "")
-                                if tag_name in ["DateTimeOriginal", "DateTimeDigitized", "DateTime"]:
-                                    try:
-                                        date_str = datetime.strptime(value, "%Y:%m:%d %H:%M:%S").isoformat()
-                                        break
-                                    except (ValueError, TypeError):
-                                        pass
+            if exif is not None and len(exif) > 0:
+                # 36867 = DateTimeOriginal, 36868 = DateTimeDigitized, 306 = DateTime
+                for tag_id in [36867, 36868, 306]:
+                    if tag_id in exif:
+                        value = exif[tag_id]
+                        if value and isinstance(value, str):
+                            try:
+                                date_str = datetime.strptime(value, "%Y:%m:%d %H:%M:%S").isoformat()
+                                break
+                            except (ValueError, TypeError):
+                                pass
+
+                if not date_str:
+                    for tag_id, value in exif.items():
+                        if not value or not isinstance(value, str):
+                            continue
+                        tag_name = TAGS.get(tag_id, "")
+                        if tag_name in ["DateTimeOriginal", "DateTimeDigitized", "DateTime"]:
+                            try:
+                                date_str = datetime.strptime(value, "%Y:%m:%d %H:%M:%S").isoformat()
+                                break
+                            except (ValueError, TypeError):
+                                pass
         except Exception:
             pass
 
-        # Method 2: Fallback to _getexif()
+        # Method 2: Fallback to the Exif sub-IFD (what _getexif() merges into IFD0)
         if not date_str:
             try:
-                with Image.open(photo) as im:
-                    if hasattr(im, "_getexif"):
-                        exif_old = im._getexif()
-                        if exif_old is not None:
-                            for tag_id in [36867, 36868, 306]:
-                                if tag_id in exif_old:
-                                    value = exif_old[tag_id]
-                                    if value and isinstance(value, str):
-                                        try:
-                                            date_str = datetime.strptime(value, "%Y:%m:%d %H:%M:%S").isoformat()
-                                            break
-                                        except (ValueError, TypeError):
-                                            pass
+                if exif is not None:
+                    exif_old = dict(exif)
+                    exif_old.update(exif.get_ifd(IFD.Exif))
+                    for tag_id in [36867, 36868, 306]:
+                        if tag_id in exif_old:
+                            value = exif_old[tag_id]
+                            if value and isinstance(value, str):
+                                try:
+                                    date_str = datetime.strptime(value, "%Y:%m:%d %H:%M:%S").isoformat()
+                                    break
+                                except (ValueError, TypeError):
+                                    pass
             except Exception:
                 pass
 
         # Method 3: Try XMP metadata
         if not date_str:
-            try:
-                with Image.open(photo) as im:
-                    if hasattr(im, "applist"):
-                        for segment, content in im.applist:
-                            try:
-                                # XMP can be: \x00<marker>\x00<body>  or  <marker>\x00<body>
-                                parts = content.split(bytes("\x00", "utf-8"), 2)
-                                if len(parts) >= 3:
-                                    marker = parts[1].decode("utf-8", errors="ignore")
-                                    body_bytes = parts[2]
-                                elif len(parts) == 2:
-                                    marker = parts[0].decode("utf-8", errors="ignore")
-                                    body_bytes = parts[1]
-                                else:
-                                    continue
-
-                                if segment != "APP1" or marker != "http://ns.adobe.com/xap/1.0/":
-                                    continue
-
-                                body_str = body_bytes.decode("utf-8")
-
-                                try:
-                                    soup = BeautifulSoup(body_str, "xml")
-                                except Exception:
-                                    import warnings
-
-                                    from bs4 import XMLParsedAsHTMLWarning
-
-                                    with warnings.catch_warnings():
-                                        warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
-                                        soup = BeautifulSoup(body_str, "html.parser")
-
-                                descriptions = soup.find_all("rdf:description")
-                                if not descriptions:
-                                    descriptions = soup.find_all("description")
-
-                                date_fields = [
-                                    "photoshop:DateCreated",
-                                    "DateCreated",
-                                    "xmp:CreateDate",
-                                    "CreateDate",
-                                    "exif:DateTimeOriginal",
-                                    "DateTimeOriginal",
-                                    "xmp:ModifyDate",
-                                    "ModifyDate",
-                                    "xmp:MetadataDate",
-                                    "MetadataDate",
-                                    "dc:date",
-                                    "date",
-                                ]
-
-                                for desc in descriptions:
-                                    for field in date_fields:
-                                        date_value = (
-                                            desc.get(field)
-                                            or desc.get(field.split(":")[-1] if ":" in field else field)
-                                            or None
-                                        )
-                                        if date_value:
-                                            date_value_str = str(date_value).strip()
-                                            if date_value_str.endswith("Z"):
-                                                date_value_str = date_value_str[:-1] + "+00:00"
-                                            try:
-                                                date_str = datetime.fromisoformat(
-                                                    date_value_str.replace("Z", "+00:00")
-                                                ).isoformat()
-                                                break
-                                            except (ValueError, TypeError):
-                                                try:
-                                                    date_str = datetime.strptime(
-                                                        date_value_str, "%Y:%m:%d %H:%M:%S"
-                                                    ).isoformat()
-                                                    break
-                                                except (ValueError, TypeError):
-                                                    for fmt in [
-                                                        "%Y-%m-%d %H:%M:%S",
-                                                        "%Y-%m-%dT%H:%M:%S",
-                                                        "%Y/%m/%d %H:%M:%S",
-                                                    ]:
-                                                        try:
-                                                            date_str = datetime.strptime(
-                                                                date_value_str, fmt
-                                                            ).isoformat()
-                                                            break
-                                                        except (ValueError, TypeError):
-                                                            continue
-                                        if date_str:
-                                            break
-                                    if date_str:
-                                        break
-                                if date_str:
-                                    break
-                            except (ValueError, UnicodeDecodeError, AttributeError, KeyError):
-                                continue
-                            except Exception:
-                                continue
-            except Exception:
-                pass
+            for date_value in (value for xmp in probe.xmp for value in xmp.dates):
+                date_value_str = str(date_value).strip()
+                if date_value_str.endswith("Z"):
+                    date_value_str = date_value_str[:-1] + "+00:00"
+                try:
+                    date_str = datetime.fromisoformat(date_value_str).isoformat()
+                    break
+                except (ValueError, TypeError):
+                    pass
+                for fmt in ["%Y:%m:%d %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y/%m/%d %H:%M:%S"]:
+                    try:
+                        date_str = datetime.strptime(date_value_str, fmt).isoformat()
+                        break
+                    except (ValueError, TypeError):
+                        continue
+                if date_str:
+                    break
 
         # Method 4: Fallback to file modification time
         if not date_str:
@@ -433,7 +373,7 @@ class Photo:
         return date_str
 
     @classmethod
-    def _extract_exif(cls, photo):
+    def _extract_exif(cls, photo, probe=None):
         """Extract camera and shot metadata from a photo's EXIF data."""
         result = {}
 
@@ -474,262 +414,529 @@ class Photo:
             0x47: "Flash fired, red-eye, return",
         }
 
+        if probe is None:
+            probe = probe_photo(photo)
+        exif = probe.exif
+        if not exif:
+            return result
+
         try:
-            with Image.open(photo) as im:
-                if not hasattr(im, "getexif"):
-                    return result
-                exif = im.getexif()
-                if not exif:
-                    return result
-
-                # Camera
-                camera = {}
-                for tag_id, field in [(271, "make"), (272, "model"), (42036, "lens"), (305, "software")]:
-                    val = exif.get(tag_id)
-                    if val and isinstance(val, str) and val.strip():
-                        camera[field] = val.strip()
-                if camera:
-                    result["camera"] = camera
-
-                # Shot
-                shot = {}
-
-                exp = exif.get(33434)
-                if exp is not None:
-                    try:
-                        f = float(exp)
-                        if 0 < f < 1:
-                            shot["exposure"] = f"1/{round(1 / f)}s"
-                        elif f >= 1:
-                            shot["exposure"] = f"{f:.1f}s"
-                    except Exception:
-                        pass
+            # Camera
+            camera = {}
+            for tag_id, field in [(271, "make"), (272, "model"), (42036, "lens"), (305, "software")]:
+                val = exif.get(tag_id)
+                if val and isinstance(val, str) and val.strip():
+                    camera[field] = val.strip()
+            if camera:
+                result["camera"] = camera
+
+            # Shot
+            shot = {}
+
+            exp = exif.get(33434)
+            if exp is not None:
+                try:
+                    f = float(exp)
+                    if 0 < f < 1:
+                        shot["exposure"] = f"1/{round(1 / f)}s"
+                    elif f >= 1:
+                        shot["exposure"] = f"{f:.1f}s"
+                except Exception:
+                    pass
 
-                fnumber = exif.get(33437)
-                if fnumber is not None:
-                    try:
-                        shot["aperture"] = f"f/{float(fnumber):.1f}"
-                    except Exception:
-                        pass
+            fnumber = exif.get(33437)
+            if fnumber is not None:
+                try:
+                    shot["aperture"] = f"f/{float(fnumber):.1f}"
+                except Exception:
+                    pass
 
-                iso = exif.get(34855)
-                if iso is not None:
-                    shot["iso"] = str(iso)
+            iso = exif.get(34855)
+            if iso is not None:
+                shot["iso"] = str(iso)
 
-                fl = exif.get(37386)
-                if fl is not None:
-                    try:
-                        shot["focal_length"] = f"{float(fl):.0f}mm"
-                    except Exception:
-                        pass
+            fl = exif.get(37386)
+            if fl is not None:
+                try:
+                    shot["focal_length"] = f"{float(fl):.0f}mm"
+                except Exception:
+                    pass
 
-                ep = exif.get(34850)
-                if ep is not None:
-                    shot["exposure_program"] = exposure_programs.get(ep, str(ep))
+            ep = exif.get(34850)
+            if ep is not None:
+                shot["exposure_program"] = exposure_programs.get(ep, str(ep))
 
-                ec = exif.get(37380)
-                if ec is not None:
-                    try:
-                        shot["exposure_compensation"] = f"{float(ec):+.1f} EV"
-                    except Exception:
-                        pass
-
-                mm = exif.get(37383)
-                if mm is not None:
-                    shot["metering_mode"] = metering_modes.get(mm, str(mm))
-
-                wb = exif.get(41987)
-                if wb is not None:
-                    shot["white_balance"] = "Auto" if wb == 0 else "Manual"
-
-                flash = exif.get(37385)
-                if flash is not None:
-                    shot["flash"] = flash_values.get(flash, f"0x{flash:02x}")
-
-                if shot:
-                    result["shot"] = shot
-
-                # Image
-                cs = exif.get(40961)
-                if cs is not None:
-                    if cs == 1:
-                        result["image"] = {"color_space": "sRGB"}
-                    elif cs == 65535:
-                        result["image"] = {"color_space": "Uncalibrated"}
-                    else:
-                        result["image"] = {"color_space": str(cs)}
-
-                # Rights
-                rights = {}
-                artist = exif.get(315)
-                if artist and isinstance(artist, str) and artist.strip():
-                    rights["artist"] = artist.strip()
-                copyright_val = exif.get(33432)
-                if copyright_val and isinstance(copyright_val, str) and copyright_val.strip():
-                    rights["copyright"] = copyright_val.strip()
-                if rights:
-                    result["rights"] = rights
-
-                # GPS
+            ec = exif.get(37380)
+            if ec is not None:
                 try:
-                    gps_ifd = exif.get_ifd(34853)
-                    if gps_ifd:
-                        gps = {}
-                        lat_ref = gps_ifd.get(1)
-                        lat = gps_ifd.get(2)
-                        lon_ref = gps_ifd.get(3)
-                        lon = gps_ifd.get(4)
-                        alt_ref = gps_ifd.get(5)
-                        alt = gps_ifd.get(6)
-
-                        if lat and lon and lat_ref and lon_ref:
-
-                            def _dms(dms, ref):
-                                dec = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
-                                return -dec if ref in ("S", "W") else dec
-
-                            lat_dec = _dms(lat, lat_ref)
-                            lon_dec = _dms(lon, lon_ref)
-                            gps["latitude"] = f"{abs(lat_dec):.6f}° {'N' if lat_dec >= 0 else 'S'}"
-                            gps["longitude"] = f"{abs(lon_dec):.6f}° {'E' if lon_dec >= 0 else 'W'}"
-
-                        if alt is not None:
-                            try:
-                                gps["altitude"] = f"{float(alt):.0f}m {'below' if alt_ref else 'above'} sea level"
-                            except Exception:
-                                pass
-
-                        if gps:
-                            result["gps"] = gps
+                    shot["exposure_compensation"] = f"{float(ec):+.1f} EV"
                 except Exception:
                     pass
 
+            mm = exif.get(37383)
+            if mm is not None:
+                shot["metering_mode"] = metering_modes.get(mm, str(mm))
+
+            wb = exif.get(41987)
+            if wb is not None:
+                shot["white_balance"] = "Auto" if wb == 0 else "Manual"
+
+            flash = exif.get(37385)
+            if flash is not None:
+                shot["flash"] = flash_values.get(flash, f"0x{flash:02x}")
+
+            if shot:
+                result["shot"] = shot
+
+            # Image
+            cs = exif.get(40961)
+            if cs is not None:
+                if cs == 1:
+                    result["image"] = {"color_space": "sRGB"}
+                elif cs == 65535:
+                    result["image"] = {"color_space": "Uncalibrated"}
+                else:
+                    result["image"] = {"color_space": str(cs)}
+
+            # Rights
+            rights = {}
+            artist = exif.get(315)
+            if artist and isinstance(artist, str) and artist.strip():
+                rights["artist"] = artist.strip()
+            copyright_val = exif.get(33432)
+            if copyright_val and isinstance(copyright_val, str) and copyright_val.strip():
+                rights["copyright"] = copyright_val.strip()
+            if rights:
+                result["rights"] = rights
+
+            # GPS
+            try:
+                gps_ifd = exif.get_ifd(34853)
+                if gps_ifd:
+                    gps = {}
+                    lat_ref = gps_ifd.get(1)
+                    lat = gps_ifd.get(2)
+                    lon_ref = gps_ifd.get(3)
+                    lon = gps_ifd.get(4)
+                    alt_ref = gps_ifd.get(5)
+                    alt = gps_ifd.get(6)
+
+                    if lat and lon and lat_ref and lon_ref:
+
+                        def _dms(dms, ref):
+                            dec = float(dms[0]) + float(dms[1]) / 60 + float(dms[2]) / 3600
+                            return -dec if ref in ("S", "W") else dec
+
+                        lat_dec = _dms(lat, lat_ref)
+                        lon_dec = _dms(lon, lon_ref)
+                        gps["latitude"] = f"{abs(lat_dec):.6f}° {'N' if lat_dec >= 0 else 'S'}"
+                        gps["longitude"] = f"{abs(lon_dec):.6f}° {'E' if lon_dec >= 0 else 'W'}"
+
+                    if alt is not None:
+                        try:
+                            gps["altitude"] = f"{float(alt):.0f}m {'below' if alt_ref else 'above'} sea level"
+                        except Exception:
+                            pass
+
+                    if gps:
+                        result["gps"] = gps
+            except Exception:
+                pass
+
         except Exception:
             pass
 
         return result
 
     @classmethod
-    def process_photo(cls, external_path, photo, filename, slug, output_path, people_q: Queue):
-        new_original_photo = os.path.join(
-            output_path, "original_%s%s" % (os.path.basename(slug), extract_extension(photo))
-        )
+    def process_photo(
+        cls,
+        external_path,
+        photo,
+        filename,
+        slug,
+        output_path,
+        manifest_record=None,
+        metadata_cache=None,
+        memory_budget=None,
+        io_pool=None,
+        existing=None,
+        st=None,
+    ):
+        """Generate the original copy and every photo size for one source photo.
+
+        ``manifest_record`` is what the previous build recorded for this source,
+        ``metadata_cache`` an optional MetadataCache to read headers from,
+        ``memory_budget`` an optional MemoryBudget decodes are admitted against,
+        ``io_pool`` an optional IOPool the copy and writes are handed to, the
+        caller waits for them, and
+        ``existing`` the outputs of ``manifest_record`` found on disk when the
+        album was listed, which spares a stat per output, and ``st`` the
+        os.stat result of ``photo`` taken while it was listed.
+        Returns the Photo, the new manifest record describing its outputs and
+        the faces found in the photo, each with its thumbnail crop.
+        """
+        original_name = "original_%s%s" % (os.path.basename(slug), extract_extension(photo))
 
-        # Extract date and EXIF metadata from ORIGINAL file (before copying/modifying)
-        date_str = cls._extract_date(photo)
-        exif_data = cls._extract_exif(photo)
+        if st is None:
+            try:
+                st = os.stat(photo)
+            except OSError:
+                # Unreadable sources are reported when they are opened below
+                st = None
 
-        # Verify original first to avoid PIL errors later when generating thumbnails etc
-        try:
-            with Image.open(photo) as im:
-                im.verify()
-            # Unfortunately verify only catches a few defective images, this transpose catches more. Verify requires subsequent reopen according to Pillow docs.
-            with Image.open(photo) as im2:
-                im2.transpose(Image.FLIP_TOP_BOTTOM)
-        except Exception as e:
-            raise PhotoProcessingFailure(message="Image Verification: " + str(e))
+        # Read all metadata from the ORIGINAL file in one pass (before copying/modifying)
+        probe = cls._probe(photo, metadata_cache, st)
 
-        # Only copy if overwrite explicitly asked for or if doesn't exist
-        if Config.instance().overwrite or not os.path.exists(new_original_photo):
-            print(f" ----> Copying to [magenta]{new_original_photo}[/magenta]")
-            shutil.copyfile(photo, new_original_photo)
+        validation = Config.instance().validation
 
-        try:
-            with Image.open(new_original_photo) as im:
-                original_size = im.size
-                width, height = im.size
-        except UnidentifiedImageError as e:
+        # Strict mode verifies the original up front, before anything is copied.
+        # Otherwise broken files are caught by the first real decode below.
+        if validation == "strict":
+            try:
+                with Image.open(photo) as im:
+                    im.verify()
+                # Unfortunately verify only catches a few defective images, this transpose catches more. Verify requires subsequent reopen according to Pillow docs.
+                with Image.open(photo) as im2:
+                    im2.transpose(Image.FLIP_TOP_BOTTOM)
+            except Exception as e:
+                raise PhotoProcessingFailure(message="Image Verification: " + str(e))
+
+        # Compare the source with what the manifest recorded for it on the previous build
+        content_addressed = Config.instance().content_addressed
+        if st is not None:
+            record, source_changed = source_record(
+                photo, manifest_record, Config.instance().manifest_content_hash or content_addressed, st
+            )
+        else:
+            record, source_changed = {"outputs": {}}, True
+        outputs = record["outputs"]
+
+        # Content addressed files live in a store shared by all albums and are named
+        # after what they are rendered from, so renames and moves reuse them as they are
+        source_hash = record.get("hash") if content_addressed else None
+        if source_hash:
+            output_path = os.path.join(os.path.dirname(output_path), STORE_DIR)
+            external_path = os.path.join(os.path.dirname(external_path), STORE_DIR)
+            original_name = source_hash + extract_extension(photo)
+
+        sharded = Config.instance().output_sharding
+        # Discovery only creates the album folder, shards and the store are created on write
+        nested = sharded or source_hash
+        recorded = manifest_record.get("outputs", {}) if manifest_record is not None else {}
+
+        def exists(path):
+            # Outputs the manifest knows about were looked up in the listing of their directory
+            if existing is not None and path in recorded:
+                return path in existing
+            return os.path.exists(path)
+
+        # Every output of the photo goes to the same shard
+        shard = shard_dir(source_hash or os.path.basename(slug)) if sharded else None
+
+        def place(name):
+            if shard:
+                return os.path.join(output_path, shard, name)
+            return os.path.join(output_path, name)
+
+        def url(path):
+            return "%s/%s" % (quote(external_path), quote(os.path.relpath(path, output_path).replace(os.sep, "/")))
+
+        def reusable(path, params):
+            if source_hash:
+                return exists(path)
+            return is_fresh(path, params, manifest_record, source_changed, exists)
+
+        def fresh(path, params):
+            if Config.instance().overwrite:
+                return False
+            if reusable(path, params):
+                return True
+            if sharded:
+                # Adopt the file of a flat layout instead of generating it again
+                flat = os.path.join(output_path, os.path.basename(path))
+                if reusable(flat, params):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(flat, path)
+                    return True
+            return False
+
+        new_original_photo = place(original_name)
+        # What this photo handed to the I/O pool, its task waits for it
+        submitted = []
+
+        def discard_original():
+            # Do not leave a copy of a broken original behind, a copy still
+            # running in the I/O pool would put it back after the removal
+            if io_pool is not None:
+                io_pool.discard(submitted)
             if os.path.exists(new_original_photo):
                 os.remove(new_original_photo)
-            raise PhotoProcessingFailure(message=str(e))
 
-        sizes = Config.instance().photo_sizes
-        largest_src = None
-        smallest_src = None
+        def reject(e):
+            discard_original()
+            raise PhotoProcessingFailure(message="Image Verification: " + str(e))
 
-        srcSet = {}
+        def open_source():
+            # Broken files can already fail to open, not only to decode
+            try:
+                return Image.open(photo)
+            except Exception as e:
+                if validation == "off":
+                    raise
+                reject(e)
+
+        # Only copy if overwrite explicitly asked for or if missing or stale
+        link = Config.instance().originals_link
+        original_params = fingerprint({"link": link} if link != "copy" else {})
+        outputs[new_original_photo] = original_params
+        copied = not fresh(new_original_photo, original_params)
+        if copied:
+            print(f" ----> Copying to [magenta]{new_original_photo}[/magenta]")
+            if nested:
+                os.makedirs(os.path.dirname(new_original_photo), exist_ok=True)
+            if io_pool is not None:
+                # Decoding reads the source, the copy runs alongside it
+                submitted.append(io_pool.copy(photo, new_original_photo, link))
+            else:
+                link_file(photo, new_original_photo, link)
 
-        msg = " ------> Generating photo sizes: "
-        for i, size in enumerate(sizes):
-            new_size = calculate_new_size(original_size, size)
-            new_sub_photo = os.path.join(
-                output_path, "%sx%s_%s%s" % (new_size[0], new_size[1], os.path.basename(slug), extract_extension(photo))
-            )
-            largest_src = new_sub_photo
-            if smallest_src is None:
-                smallest_src = new_sub_photo
-
-            # Only generate if overwrite explicitly asked for or if doesn't exist
-            msg += f"[cyan]{new_size[0]}x{new_size[1]}[/cyan] "
-            if Config.instance().overwrite or not os.path.exists(new_sub_photo):
-                with Image.open(new_original_photo) as im:
-                    im.thumbnail(new_size)
-                    if Config.instance().exif_transpose:
-                        im = ImageOps.exif_transpose(im)
-                    im.save(new_sub_photo)
-            srcSet[str(size) + "w"] = ["%s/%s" % (quote(external_path), quote(os.path.basename(new_sub_photo)))]
+        try:
+            if probe.width and probe.height:
+                original_size = probe.size
+            else:
+                with open_source() as im:
+                    original_size = im.size
+            width, height = original_size
+
+            sizes = Config.instance().photo_sizes
+            largest_src = None
+            smallest_src = None
+            srcSet = {}
+            # Derivatives to produce, one entry per distinct file: sizes larger than
+            # the original all come out at the original size and share one file,
+            # which is the watermarked largest one when the watermark is on
+            plan = {}
+            # An original that needs no resize, rotation or watermark is served as is
+            passthrough = not Config.instance().exif_transpose and not Config.instance().watermark_enabled
+            served_original = False
+
+            for i, size in enumerate(sizes):
+                new_size = calculate_new_size(original_size, size)
+                watermarked = i == len(sizes) - 1 and Config.instance().watermark_enabled
+                if passthrough and new_size == original_size:
+                    new_sub_photo = new_original_photo
+                    served_original = True
+                else:
+                    inputs = {
+                        # The actual size, several configured sizes can produce the same file
+                        "size": list(new_size),
+                        "exif_transpose": Config.instance().exif_transpose,
+                        "fast_decode": Config.instance().fast_decode,
+                    }
+                    if Config.instance().resize_quality != DEFAULT_RESIZE_QUALITY:
+                        # Left out by default so existing outputs keep their fingerprint
+                        inputs["resize_quality"] = Config.instance().resize_quality
+                    if watermarked:
+                        # The watermark is only stamped onto the largest size
+                        inputs["watermark"] = watermark_fingerprint(
+                            Config.instance().watermark_path, Config.instance().watermark_ratio
+                        )
+                    if source_hash:
+                        # What the file holds: the source, the actual size and how it was rendered
+                        name = fingerprint(dict(inputs, source=source_hash))
+                    else:
+                        name = "%sx%s_%s" % (new_size[0], new_size[1], os.path.basename(slug))
+                    new_sub_photo = place(name + extract_extension(photo))
+                    plan[new_sub_photo] = (new_size, fingerprint(inputs))
+                largest_src = new_sub_photo
+                if smallest_src is None:
+                    smallest_src = new_sub_photo
+                srcSet[str(size) + "w"] = [url(new_sub_photo)]
+
+            # Only generate if overwrite explicitly asked for or if missing or stale
+            msg = " ------> Generating photo sizes: "
+            pending = []
+            for new_sub_photo, (new_size, params) in plan.items():
+                msg += f"[cyan]{new_size[0]}x{new_size[1]}[/cyan] "
+                outputs[new_sub_photo] = params
+                if not fresh(new_sub_photo, params):
+                    pending.append((new_size, new_sub_photo))
+                    if nested:
+                        os.makedirs(os.path.dirname(new_sub_photo), exist_ok=True)
+
+            if not pending and served_original and copied and validation == "on-decode":
+                # Nothing else decodes a photo served as is, check it once when it is published
+                try:
+                    with Image.open(photo) as im:
+                        im.load()
+                except Exception as e:
+                    reject(e)
+
+            if pending:
+                # Wait for enough decode memory when other workers hold large images,
+                # JPEGs are decoded at the draft scale the cascade requests
+                estimate = estimate_decode_bytes(
+                    width,
+                    height,
+                    probe.format,
+                    draft_size(
+                        max(s for s, _ in pending), Config.instance().fast_decode, Config.instance().resize_quality
+                    ),
+                )
+                reservation = memory_budget.reserve(estimate) if memory_budget is not None else nullcontext()
+                with reservation, open_source() as im:
+                    # Decode the original once and derive every missing size from it, largest first
+                    cascade = resize_cascade(
+                        im,
+                        [s for s, _ in pending],
+                        Config.instance().exif_transpose,
+                        Config.instance().fast_decode,
+                        Config.instance().resize_quality,
+                    )
+                    try:
+                        # The first step decodes the source, which is where broken files show up
+                        first = next(cascade)
+                    except Exception as e:
+                        if validation == "off":
+                            raise
+                        reject(e)
+
+                    for new_size, resized in itertools.chain([first], cascade):
+                        for target, new_sub_photo in pending:
+                            if target == new_size:
+                                output = resized
+                                if new_sub_photo == largest_src:
+                                    # Crop faces from the image in memory, before the watermark
+                                    crop_faces(resized, probe.faces, largest_src)
+                                    if Config.instance().watermark_enabled:
+                                        # Loaded once per worker and stamped before the first save.
+                                        # On a copy, smaller sizes are derived from the unmarked image.
+                                        print(" ------> Adding watermark")
+                                        watermark = load_watermark(
+                                            Config.instance().watermark_path, Config.instance().watermark_ratio
+                                        )
+                                        output = watermark.apply(resized)
+                                if io_pool is not None:
+                                    submitted.append(io_pool.save(output, new_sub_photo))
+                                else:
+                                    save_image(output, new_sub_photo)
+        except UnidentifiedImageError as e:
+            discard_original()
+            raise PhotoProcessingFailure(message=str(e))
+        except BaseException:
+            if io_pool is not None:
+                # Nothing a failed photo submitted is left for its task to wait on
+                io_pool.discard(submitted)
+            raise
 
         print(msg)
 
-        if Config.instance().watermark_enabled and (Config.instance().overwrite or not os.path.exists(largest_src)):
-            with Image.open(Config.instance().watermark_path) as watermark_im:
-                print(" ------> Adding watermark")
-                apply_watermark(largest_src, watermark_im, Config.instance().watermark_ratio)
-
         # Construct original photo path for downloads
-        original_filename = "original_%s%s" % (os.path.basename(slug), extract_extension(photo))
-        original_src = "%s/%s" % (quote(external_path), quote(original_filename))
+        original_src = url(new_original_photo)
 
         photo_obj = Photo(
             filename,
             width,
             height,
-            "%s/%s" % (quote(external_path), quote(os.path.basename(largest_src))),
-            "%s/%s" % (quote(external_path), quote(os.path.basename(smallest_src))),
+            url(largest_src),
+            url(smallest_src),
             slug,
             srcSet,
             original_src,
-            date_str,
+            probe.date,
         )
-        photo_obj.exif = exif_data
+        photo_obj.exif = probe.exif_data
 
-        # Faces
-        if Config.instance().people_enabled:
-            # Use original photo file for face detection to preserve all metadata
-            people_q.put(
-                (
-                    photo_obj,
-                    photo,  # Use original photo instead of new_original_photo
-                    largest_src,
-                    output_path,
-                    external_path,
-                )
-            )
+        for face in probe.faces:
+            if face.crop is None:
+                face.source = largest_src
 
-        return photo_obj
+        return photo_obj, record, probe.faces
 
 
 def _process_photo(t):
-    (external_path, photo_file, filename, unique_slug, album_folder) = t
+    (external_path, photo_file, filename, unique_slug, album_folder, manifest_record, existing, st) = t
     print(f" --> Processing [magenta]{photo_file}[/magenta]...")
     try:
-        return (
+        photo_obj, record, faces = Photo.process_photo(
+            external_path,
             photo_file,
-            Photo.process_photo(
-                external_path, photo_file, filename, unique_slug, album_folder, _process_photo.people_q
-            ),
+            filename,
+            unique_slug,
+            album_folder,
+            manifest_record,
+            getattr(_process_photo, "metadata_cache", None),
+            getattr(_process_photo, "memory_budget", None),
+            getattr(_process_photo, "io_pool", None),
+            existing,
+            st,
         )
+        return (photo_file, photo_obj, record, faces)
     except PhotoProcessingFailure as e:
         print(
             f"[yellow]Skipping processing of image file[/yellow] [magenta]{photo_file}[/magenta] Reason: [red]{str(e)}[/red]"
         )
-        return (photo_file, None)
-
-
-def _proces_photo_init(people_q, yaml_config):
-    _process_photo.people_q = people_q
+        return (photo_file, None, None, [])
+    finally:
+        # Long runs fragment the heap, hand freed memory back once the worker grows too large
+        trim_above = getattr(_process_photo, "trim_above", 0)
+        if trim_above and resident_bytes() > trim_above:
+            trim_memory()
+
+
+def _process_photos(jobs):
+    # One pool task, batches of small photos save a round trip per photo
+    results = [_process_photo(job) for job in jobs]
+    io_pool = getattr(_process_photo, "io_pool", None)
+    if io_pool is not None:
+        # The parent journals and publishes what a task returns, so its files must be
+        # on disk by then. Within a batch, writes overlap the decoding of the next photo.
+        io_pool.wait()
+    return results
+
+
+class _InFlight:
+    """Bounds the number of tasks handed to a pool but not yet returned.
+
+    ``feed`` wraps the task iterable given to ``imap_unordered``, each task
+    being a list of jobs; the pool's task thread blocks in it until ``done``
+    is called for a finished task, which hands back the jobs of its photos.
+    """
+
+    def __init__(self, limit):
+        self.slots = Semaphore(limit)
+        self.closed = False
+        self.jobs = {}
+
+    def feed(self, tasks):
+        for task in tasks:
+            self.slots.acquire()
+            if self.closed:
+                return
+            for job in task:
+                self.jobs[job[1]] = job
+            yield task
+
+    def done(self, photo_files):
+        jobs = [self.jobs.pop(photo_file, None) for photo_file in photo_files]
+        self.slots.release()
+        return jobs
+
+    def close(self):
+        # Unblock the task thread so the pool can shut down
+        self.closed = True
+        self.slots.release()
+
+
+def _proces_photo_init(yaml_config, metadata_cache=None, memory_budget=None):
     # Re-initialize Config in worker process
     Config.init(yaml_config)
+    # Each worker opens its own connection on first use
+    _process_photo.metadata_cache = metadata_cache
+    _process_photo.memory_budget = memory_budget
+    _process_photo.trim_above = Config.instance().worker_trim_above
+    _process_photo.io_pool = IOPool(Config.instance().io_threads) if Config.instance().io_threads > 0 else None
 
 
 class Albums:
@@ -759,18 +966,77 @@ class Albums:
     def __getitem__(self, item):
         return list(self.albums.values())[item]
 
-    def process_path(self, root_path, output_albums_photos_path, external_root, yaml_config):
-
-        entries = list(map(lambda e: os.path.join(root_path, e), os.listdir(root_path)))
-        paths = list(filter(lambda e: is_supported_album(e), entries))
-
-        for album_path in paths:
-            album_name = os.path.basename(album_path)
-            if not album_name.startswith("."):  # skip dotfiles
-                self.process_album_path(album_path, album_name, output_albums_photos_path, external_root, yaml_config)
-
-    def process_album_path(self, album_dir, album_name, output_albums_photos_path, external_root, yaml_config):
+    def process_path(
+        self, root_path, output_albums_photos_path, external_root, yaml_config, manifest=None, metadata_cache=None
+    ):
+
+        with os.scandir(root_path) as it:
+            entries = sorted((e for e in it if not e.name.startswith(".") and e.is_dir()), key=lambda e: e.name)
+
+        # Jobs are produced while the tree is listed, so processing starts with the first album
+        albums = []
+        index = DirectoryIndex() if manifest is not None else None
+        duplicates = self._duplicate_finder(manifest)
+
+        def jobs():
+            for entry in entries:
+                yield from self.discover_album(
+                    entry.path,
+                    entry.name,
+                    output_albums_photos_path,
+                    external_root,
+                    albums,
+                    manifest,
+                    index,
+                    duplicates,
+                )
 
+        self.process_albums(jobs(), albums, yaml_config, manifest, metadata_cache, duplicates)
+
+    def process_album_path(
+        self,
+        album_dir,
+        album_name,
+        output_albums_photos_path,
+        external_root,
+        yaml_config,
+        manifest=None,
+        metadata_cache=None,
+    ):
+        albums = []
+        index = DirectoryIndex() if manifest is not None else None
+        duplicates = self._duplicate_finder(manifest)
+        jobs = self.discover_album(
+            album_dir, album_name, output_albums_photos_path, external_root, albums, manifest, index, duplicates
+        )
+        self.process_albums(jobs, albums, yaml_config, manifest, metadata_cache, duplicates)
+
+    @staticmethod
+    def _duplicate_finder(manifest):
+        if not Config.instance().duplicates_enabled:
+            return None
+        return DuplicateFinder(Config.instance().duplicates_verify, manifest)
+
+    def discover_album(
+        self,
+        album_dir,
+        album_name,
+        output_albums_photos_path,
+        external_root,
+        albums,
+        manifest=None,
+        index=None,
+        duplicates=None,
+    ):
+        """Yield the photo jobs of ``album_dir`` and its sub-albums as they are listed.
+
+        Each album is appended to ``albums`` as ``(album, photo_files)`` when
+        it is listed, ``photo_files`` being its photos in listing order.  With
+        a DirectoryIndex the outputs the manifest recorded for each photo are
+        looked up in the listing of their directory and sent with the job.
+        Photos a DuplicateFinder recognises as copies of an earlier one get
+        no job, they are listed in the album and share its results.
+        """
         unique_album_slug = find_unique_slug(self.slugs, self.slugs_lock, album_name)
         print(
             f"Importing [magenta]{album_dir}[/magenta] as [green]{album_name}[/green] ([yellow]{unique_album_slug}[/yellow])"
@@ -784,76 +1050,156 @@ class Albums:
         external_path = os.path.join(external_root, album_name_folder)
         os.makedirs(album_folder, exist_ok=True)
 
-        entries = list(map(lambda e: os.path.join(album_dir, e), sorted(os.listdir(album_dir))))
-        dirs = list(filter(lambda e: is_supported_album(e), entries))
-        files = list(filter(lambda e: is_supported_photo(e), entries))
+        # scandir gives the entry types without a stat per file
+        with os.scandir(album_dir) as it:
+            entries = sorted((e for e in it if not e.name.startswith(".")), key=lambda e: e.name)  # skip dotfiles
+        dirs = [e for e in entries if e.is_dir()]
+        files = [e for e in entries if is_supported_photo(e.path)]
 
         unique_slugs_lock = RLock()
         unique_slugs = set()
 
-        jobs = []
+        photo_files = []
+        albums.append((album_obj, photo_files))
 
-        for album_file in files:
-            if os.path.basename(album_file).startswith("."):  # skip dotfiles
-                continue
-            photo_file = album_file  # album_file is already the full path from entries
-            filename = os.path.basename(photo_file)
+        print(f"Found [cyan]{len(files)}[/cyan] photos to process")
+        if len(files) == 0:
+            print("[yellow]No photos found in this album[/yellow]")
+
+        for entry in files:
+            photo_file = entry.path
+            filename = entry.name
 
             # Get a unique slug
             unique_slug = find_unique_slug(unique_slugs, unique_slugs_lock, filename)
 
-            jobs.append((external_path, photo_file, filename, unique_slug, album_folder))
-
-        print(f"Found [cyan]{len(jobs)}[/cyan] photos to process")
-        results = []
-        people_q = Queue()
-        if len(jobs) > 0:
-            with Pool(
-                processes=Config.instance().parallel_tasks,
-                initializer=_proces_photo_init,
-                initargs=[people_q, yaml_config],
-            ) as P:
-                results = P.map(_process_photo, jobs)
-        else:
-            print("[yellow]No photos found in this album[/yellow]")
+            photo_files.append(photo_file)
 
-        people = People.instance()
-        print("Detecting Faces...")
-        # Create a mapping from photo slug to photo object for face detection
-        photo_by_slug = {}
-        for photo_file, result in results:
-            if result is not None:
-                photo_by_slug[result.slug] = result
-
-        # Process face detection and update the photo objects in results
-        while not people_q.empty():
-            (photo_obj, new_original_photo, largest_src, output_path, external_path) = people_q.get()
-            # Find the corresponding photo object in results by matching slug
-            # The photo_obj from queue might be a different instance due to multiprocessing
-            if photo_obj.slug in photo_by_slug:
-                actual_photo = photo_by_slug[photo_obj.slug]
-                people.detect_faces(actual_photo, new_original_photo, largest_src, output_path, external_path)
-
-        for photo_file, result in results:
-            if result is not None:
-                album_obj.add_photo(result)
-
-        if len(album_obj.photos) > 0:
-            album_obj.src = pick_album_thumbnail(album_obj.photos)  # TODO internalize
-            self.add_album(album_obj)
-
-        # Recursively process sub-dirs
+            try:
+                # Stat once while listing, the cost model and the worker reuse it
+                st = entry.stat()
+            except OSError:
+                st = None
+
+            if duplicates is not None:
+                original = duplicates.original_of(photo_file, st) if st is not None else None
+                if original is not None:
+                    print(f" --> [magenta]{photo_file}[/magenta] is a duplicate of [magenta]{original}[/magenta]")
+                    duplicates.add(photo_file, original, filename, unique_slug)
+                    continue
+
+            manifest_record = manifest.get(photo_file) if manifest is not None else None
+            existing = None
+            if index is not None and manifest_record is not None:
+                existing = frozenset(p for p in manifest_record.get("outputs", {}) if index.exists(p))
+            yield (external_path, photo_file, filename, unique_slug, album_folder, manifest_record, existing, st)
+
+        if index is not None:
+            # Every job of this album has been listed, its outputs are not looked up again
+            index.forget(album_folder)
+
+        # Recursively discover sub-dirs
         if Config.instance().recursive_albums:
             for sub_album_dir in dirs:
-                if os.path.basename(sub_album_dir).startswith("."):  # skip dotfiles
-                    continue
                 sub_album_name = "%s" % Config.instance().recursive_albums_name_pattern
                 sub_album_name = sub_album_name.replace("{parent_album}", album_name)
-                sub_album_name = sub_album_name.replace("{album}", os.path.basename(sub_album_dir))
-                self.process_album_path(
-                    sub_album_dir, sub_album_name, output_albums_photos_path, external_root, yaml_config
+                sub_album_name = sub_album_name.replace("{album}", sub_album_dir.name)
+                yield from self.discover_album(
+                    sub_album_dir.path,
+                    sub_album_name,
+                    output_albums_photos_path,
+                    external_root,
+                    albums,
+                    manifest,
+                    index,
+                    duplicates,
                 )
 
+    def process_albums(self, jobs, albums, yaml_config, manifest=None, metadata_cache=None, duplicates=None):
+        """Stream ``jobs`` through one worker pool and assemble ``albums`` from the results.
+
+        At most IN_FLIGHT_PER_WORKER tasks per worker are queued at any time, so
+        memory does not grow with the size of the tree.  Expensive photos are
+        dispatched first so that no large image is left running alone at the
+        end, cheap ones are batched.  Duplicates found by ``duplicates`` point
+        at the files generated for their original.
+        """
+        people = People.instance()
+        photo_by_file = {}
+        faces_by_file = {}
+        window = _InFlight(Config.instance().parallel_tasks * IN_FLIGHT_PER_WORKER)
+        sizes = len(Config.instance().photo_sizes)
+        scheduler = Scheduler(lambda job: job_cost(job[1], job[5], metadata_cache, sizes, job[7]))
+        reported = time.monotonic()
+        # Read sources ahead of the workers so they rarely wait on the input storage
+        prefetch = IOPool(Config.instance().io_threads)
+
+        def dispatch(tasks):
+            for task in tasks:
+                for job in task:
+                    # Unchanged sources only cost the fixed overhead, their worker decodes nothing
+                    if scheduler.costs.get(job[1], 0) > BASE_COST:
+                        prefetch.prefetch(job[1])
+                yield task
+
+        memory_budget = None
+        if Config.instance().memory_budget > 0:
+            memory_budget = MemoryBudget(Config.instance().memory_budget)
+        with Pool(
+            processes=Config.instance().parallel_tasks,
+            initializer=_proces_photo_init,
+            initargs=[yaml_config, metadata_cache, memory_budget],
+            # Recycle workers regularly, Pillow's allocations fragment the heap over long runs.
+            # The pool counts tasks and a task can be a batch of photos.
+            maxtasksperchild=max(Config.instance().worker_max_tasks // SMALL_JOB_BATCH, 1)
+            if Config.instance().worker_max_tasks
+            else None,
+        ) as P:
+            try:
+                for results in P.imap_unordered(_process_photos, dispatch(window.feed(scheduler.tasks(jobs)))):
+                    task = window.done([r[0] for r in results])
+                    for (photo_file, result, record, faces), job in zip(results, task):
+                        (external_path, _, _, _, album_folder, _, _, _) = job
+                        scheduler.done(photo_file)
+                        if manifest is not None:
+                            manifest.update(photo_file, record)
+                        if result is not None:
+                            photo_by_file[photo_file] = result
+                            if faces:
+                                # Merged with the albums below, in listing order
+                                faces_by_file[photo_file] = (faces, album_folder, external_path)
+                    if time.monotonic() - reported > PROGRESS_INTERVAL:
+                        reported = time.monotonic()
+                        print(f"[green]Progress:[/green] {scheduler.progress()}")
+            finally:
+                window.close()
+                prefetch.shutdown()
+
+        # Results arrive in completion order, albums and people keep their listing order
+        # so that person photos and thumbnails are the same from one build to the next
+        for album_obj, photo_files in albums:
+            for photo_file in photo_files:
+                if photo_file in photo_by_file:
+                    album_obj.add_photo(photo_by_file[photo_file])
+                    if photo_file in faces_by_file:
+                        # Faces were read and cropped by the worker, only people are merged here
+                        faces, album_folder, external_path = faces_by_file.pop(photo_file)
+                        people.detect_faces(photo_by_file[photo_file], photo_file, album_folder, external_path, faces)
+                elif duplicates is not None and photo_file in duplicates.duplicates:
+                    original, filename, slug = duplicates.duplicates[photo_file]
+                    if manifest is not None:
+                        # Seen in this build, the files it had of its own are stale
+                        manifest.update(photo_file, None)
+                    if original in photo_by_file:
+                        photo = copy.copy(photo_by_file[original])
+                        photo.name = filename
+                        photo.slug = slug
+                        album_obj.add_photo(photo)
+
+            if len(album_obj.photos) > 0:
+                album_obj.src = pick_album_thumbnail(album_obj.photos)  # TODO internalize
+                self.add_album(album_obj)
+
 
 class Album:
     def __init__(self, name, slug):
@@ -940,16 +1286,25 @@ class SiteGenerator:
     def generate(self):
 
         print(f"[bold]Generating site from [magenta]{Config.instance().input_photos_dir}[magenta][/bold]")
-        output_photos_path = os.path.normpath(
-            os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "web", "public", "static", "_gallery")
+        # Previews get their own photos and cache so they never mix with production outputs
+        gallery_dir = "_preview" if Config.instance().preview else "_gallery"
+        static_path = os.path.normpath(
+            os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "web", "public", "static")
         )
+        output_photos_path = os.path.join(static_path, gallery_dir)
         output_data_path = os.path.normpath(
             os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "web", "src", "_gallery")
         )
-        external_root = os.path.normpath(os.path.join(Config.instance().http_root, "static", "_gallery", "albums"))
+        external_root = os.path.normpath(os.path.join(Config.instance().http_root, "static", gallery_dir, "albums"))
         generated_site_path = os.path.normpath(
             os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "web", "build")
         )
+        cache_path = os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "cache"))
+        if Config.instance().preview:
+            cache_path = os.path.join(cache_path, "preview")
+        else:
+            # Everything under public/ ends up in the site, drop leftovers of a preview
+            shutil.rmtree(os.path.join(static_path, "_preview"), ignore_errors=True)
 
         # Paths
         output_albums_data_file = os.path.join(output_data_path, "albums_data.js")
@@ -966,10 +1321,31 @@ class SiteGenerator:
         shutil.rmtree(output_data_path, ignore_errors=True)
         os.makedirs(output_data_path, exist_ok=True)
 
+        # Build manifest, used to skip photos whose sources and settings did not change
+        manifest = Manifest.load(os.path.join(cache_path, "manifest.json"))
+        # Finished photos are journaled as they come in, an interrupted build resumes from them
+        manifest.open_journal()
+
+        # Header metadata of unchanged photos, shared by the workers
+        metadata_cache = None
+        if Config.instance().metadata_cache_enabled:
+            metadata_cache = MetadataCache(os.path.join(cache_path, "metadata.sqlite"))
+
         Albums.instance().process_path(
-            Config.instance().input_photos_dir, output_albums_photos_path, external_root, self.yaml_config
+            Config.instance().input_photos_dir,
+            output_albums_photos_path,
+            external_root,
+            self.yaml_config,
+            manifest,
+            metadata_cache,
         )
 
+        manifest.prune()
+        manifest.save()
+
+        if Config.instance().cleanup_enabled:
+            self.cleanup(output_albums_photos_path, manifest)
+
         with open(output_albums_data_file, "w") as outfile:
             output_str = "export const albums_data = "
             output_str += json.dumps(Albums.instance(), sort_keys=True, indent=3, cls=SimpleEncoder)
@@ -1003,6 +1379,22 @@ class SiteGenerator:
             output_str += ";"
             outfile.write(output_str)
 
+    def cleanup(self, output_albums_photos_path, manifest):
+        """Remove generated files that no photo of this build produced anymore."""
+        if not manifest.seen:
+            # An empty or unmounted input tree would otherwise wipe the whole gallery
+            print("[yellow]No photos processed, skipping cleanup of stale files[/yellow]")
+            return
+
+        dry_run = Config.instance().cleanup_dry_run
+        expected = manifest.expected_outputs() | People.instance().face_crops
+        orphans, total_size = remove_orphans(output_albums_photos_path, expected, dry_run)
+        if dry_run:
+            for orphan in orphans:
+                print(f" --> Stale: [magenta]{orphan}[/magenta]")
+        verb = "Found" if dry_run else "Removed"
+        print(f"{verb} [cyan]{len(orphans)}[/cyan] stale files ([cyan]{total_size / 1024 / 1024:.1f}[/cyan] MB)")
+
 
 class PhotoProcessingFailure(Exception):
     def __init__(self, message="Failed to process photo"):
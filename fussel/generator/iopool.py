@@ -0,0 +1,93 @@
+import io
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Semaphore
+
+from PIL import Image
+
+from .util import atomic_write, extract_extension, link_file
+
+# Read size used to pull sources into the page cache
+PREFETCH_CHUNK = 1024 * 1024
+# Sources read ahead at most at once, further requests are dropped
+PREFETCH_AHEAD = 8
+
+
+def prefetch(path):
+    """Read ``path`` once so that the worker decoding it hits the page cache."""
+    try:
+        with open(path, "rb", buffering=0) as f:
+            while f.read(PREFETCH_CHUNK):
+                pass
+    except OSError:
+        # The worker reports unreadable sources
+        pass
+
+
+def write_file(path, data):
+    with atomic_write(path) as f:
+        f.write(data)
+
+
+class IOPool:
+    """Threads running the I/O stages of photo processing.
+
+    Copies, writes and read-ahead run here so that a process blocked on slow
+    storage (NFS, SMB) keeps decoding and encoding in the meantime.  With no
+    threads every operation runs inline.  ``wait`` blocks until everything
+    submitted so far is done and raises the first error, ``discard`` drops
+    the operations of one photo without waiting on the others.
+    """
+
+    def __init__(self, threads):
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="fussel-io") if threads > 0 else None
+        self.pending = []
+        self.prefetch_slots = Semaphore(PREFETCH_AHEAD)
+
+    def submit(self, fn, *args):
+        if self.executor is not None:
+            future = self.executor.submit(fn, *args)
+        else:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        self.pending.append(future)
+        return future
+
+    def copy(self, src, dst, strategy="copy"):
+        return self.submit(link_file, src, dst, strategy)
+
+    def save(self, im, path):
+        """Encode ``im`` here and write it to ``path`` in the background."""
+        buffer = io.BytesIO()
+        im.save(buffer, format=Image.registered_extensions().get(extract_extension(path)))
+        return self.submit(write_file, path, buffer.getvalue())
+
+    def prefetch(self, path):
+        # Fire and forget, nothing waits for read-ahead and it never queues up
+        if self.executor is None or not self.prefetch_slots.acquire(blocking=False):
+            return
+        future = self.executor.submit(prefetch, path)
+        future.add_done_callback(lambda _: self.prefetch_slots.release())
+
+    def wait(self):
+        pending, self.pending = self.pending, []
+        error = None
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def discard(self, futures):
+        """Wait for ``futures`` and stop tracking them, ignoring their errors."""
+        wait(futures)
+        futures = set(futures)
+        self.pending = [future for future in self.pending if future not in futures]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
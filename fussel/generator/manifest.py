@@ -0,0 +1,179 @@
+import functools
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 2
+# Appended to the manifest path for the journal of the running build
+JOURNAL_SUFFIX = ".journal"
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def fingerprint(inputs):
+    """Short stable digest of the settings that produced a derivative."""
+    encoded = json.dumps(inputs, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def watermark_fingerprint(path, ratio):
+    """Fingerprint inputs of the watermark, hashed once per process."""
+    try:
+        digest = file_hash(path)
+    except OSError:
+        digest = None
+    return {"hash": digest, "ratio": ratio}
+
+
+class Manifest:
+    """Persistent record of the derivatives generated for every source photo.
+
+    Records are keyed by source path and look like::
+
+        {
+            "size": 123456,
+            "mtime_ns": 1700000000000000000,
+            "hash": "..." or None,
+            "outputs": {"<derivative path>": "<fingerprint of the settings used>"},
+        }
+
+    Workers receive the record of their photo with the job and hand back a
+    new one; the parent merges them and saves the manifest once per build.
+    Once ``open_journal`` is called every update is also appended to a
+    journal, which ``load`` replays when a build was interrupted before
+    saving, so the next one resumes where it stopped.
+    """
+
+    def __init__(self, path, records=None):
+        self.path = path
+        self.records: dict = records or {}
+        self.seen = set()
+        self.journal = None
+
+    @property
+    def journal_path(self):
+        return self.path + JOURNAL_SUFFIX
+
+    @classmethod
+    def load(cls, path):
+        records = {}
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                records = data.get("sources", {})
+        except (OSError, ValueError):
+            pass
+        manifest = cls(path, records)
+        manifest.replay()
+        return manifest
+
+    def replay(self):
+        """Apply the updates journaled by a build that did not finish."""
+        try:
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        version, source, record = json.loads(line)
+                    except ValueError:
+                        # Cut short by an interrupted build, later lines are from the next one
+                        continue
+                    if version != MANIFEST_VERSION:
+                        continue
+                    if record is None:
+                        self.records.pop(source, None)
+                    else:
+                        self.records[source] = record
+        except OSError:
+            pass
+
+    def open_journal(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.journal = open(self.journal_path, "a")
+        if self.journal.tell():
+            # Never continue a line cut short by an interrupted build
+            self.journal.write("\n")
+
+    def get(self, source):
+        return self.records.get(source)
+
+    def update(self, source, record):
+        self.seen.add(source)
+        if record is None:
+            self.records.pop(source, None)
+        else:
+            self.records[source] = record
+        if self.journal is not None:
+            # Flushed per photo, a killed build loses at most the photos in flight
+            self.journal.write(json.dumps([MANIFEST_VERSION, source, record]) + "\n")
+            self.journal.flush()
+
+    def expected_outputs(self):
+        """Every derivative produced for the sources seen in this build."""
+        return {path for source in self.seen if source in self.records for path in self.records[source]["outputs"]}
+
+    def prune(self):
+        """Forget sources that were not part of this build."""
+        self.records = {k: v for k, v in self.records.items() if k in self.seen}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = "%s.tmp" % self.path
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "sources": self.records}, f)
+        os.replace(tmp_path, self.path)
+        # Everything journaled is in the manifest now
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        try:
+            os.remove(self.journal_path)
+        except OSError:
+            pass
+
+
+def source_record(photo, previous=None, content_hash=False, st=None):
+    """Describe the current state of ``photo`` for the manifest.
+
+    Returns ``(record, changed)``.  ``changed`` is False when there is no
+    previous record: existing derivatives from builds without a manifest are
+    trusted and adopted.  With ``content_hash`` a source whose mtime changed
+    but whose content did not is also considered unchanged.  ``st`` saves a
+    stat call when the caller already has one.
+    """
+    if st is None:
+        st = os.stat(photo)
+    record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": None, "outputs": {}}
+    if previous is None:
+        if content_hash:
+            record["hash"] = file_hash(photo)
+        return record, False
+
+    if previous.get("size") == st.st_size and previous.get("mtime_ns") == st.st_mtime_ns:
+        record["hash"] = previous.get("hash")
+        if content_hash and record["hash"] is None:
+            record["hash"] = file_hash(photo)
+        return record, False
+
+    if content_hash:
+        record["hash"] = file_hash(photo)
+        return record, record["hash"] != previous.get("hash")
+    return record, True
+
+
+def is_fresh(path, params, previous, changed, exists=os.path.exists):
+    """True when ``path`` can be reused: it exists, its source did not change
+    and it was generated with the same settings fingerprint.  ``exists``
+    replaces the stat, e.g. with a lookup in a directory listing."""
+    if changed or not exists(path):
+        return False
+    if previous is None:
+        return True
+    return previous.get("outputs", {}).get(path) == params
@@ -0,0 +1,67 @@
+import ctypes
+import ctypes.util
+import multiprocessing
+import os
+from contextlib import contextmanager
+
+# Bytes per decoded pixel (RGB(A)/CMYK are stored on 4 bytes by Pillow)
+BYTES_PER_PIXEL = 4
+
+
+def estimate_decode_bytes(width, height, image_format=None, target=None, fast_decode=True):
+    """Rough peak memory needed to decode an image and resize it to ``target``.
+
+    JPEG sources decoded in draft mode are scaled down by up to 8x while
+    staying at least as large as ``target``, like Image.draft() does.
+    """
+    if fast_decode and image_format == "JPEG" and target:
+        scale = 1
+        while scale < 8 and width // (scale * 2) >= target[0] and height // (scale * 2) >= target[1]:
+            scale *= 2
+        width, height = width // scale, height // scale
+    # The decoded image plus the reduced copy made by the first resize step
+    return width * height * BYTES_PER_PIXEL * 5 // 4
+
+
+class MemoryBudget:
+    """Decode memory shared by the pool workers.
+
+    Created in the parent and handed to the workers through the pool
+    initializer.  A job larger than the whole budget is admitted alone.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = multiprocessing.Value("q", 0, lock=False)
+        self.condition = multiprocessing.Condition()
+
+    @contextmanager
+    def reserve(self, amount):
+        amount = min(amount, self.limit)
+        with self.condition:
+            self.condition.wait_for(lambda: self.used.value + amount <= self.limit)
+            self.used.value += amount
+        try:
+            yield amount
+        finally:
+            with self.condition:
+                self.used.value -= amount
+                self.condition.notify_all()
+
+
+def trim_memory():
+    """Return freed heap memory to the system (glibc only)."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"))
+        libc.malloc_trim(0)
+    except (OSError, AttributeError, TypeError):
+        pass
+
+
+def resident_bytes():
+    """Current resident size of this process, 0 where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
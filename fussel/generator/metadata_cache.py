@@ -0,0 +1,77 @@
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA_VERSION = 1
+
+
+class MetadataCache:
+    """SQLite store of the metadata read from photo headers.
+
+    Entries are keyed by source path and only returned while the file still
+    has the size and mtime it had when it was probed.  Every process opens its
+    own connection on first use, so the cache can be handed to pool workers;
+    WAL mode lets them write concurrently while others read.  Within a process
+    the connection is shared by its threads, the pool's task handler thread
+    reads it to estimate job costs.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def _connect(self):
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS photos ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, version INTEGER, data TEXT)"
+            )
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, path, size, mtime_ns):
+        """Return the cached metadata of ``path``, or None if missing or stale."""
+        try:
+            with self._lock:
+                row = (
+                    self._connect()
+                    .execute(
+                        "SELECT data FROM photos WHERE path = ? AND size = ? AND mtime_ns = ? AND version = ?",
+                        (path, size, mtime_ns, SCHEMA_VERSION),
+                    )
+                    .fetchone()
+                )
+            return json.loads(row[0]) if row else None
+        except (OSError, sqlite3.Error, ValueError):
+            return None
+
+    def put(self, path, size, mtime_ns, data):
+        try:
+            with self._lock:
+                self._connect().execute(
+                    "INSERT OR REPLACE INTO photos (path, size, mtime_ns, version, data) VALUES (?, ?, ?, ?, ?)",
+                    (path, size, mtime_ns, SCHEMA_VERSION, json.dumps(data, default=str)),
+                )
+        except (OSError, sqlite3.Error):
+            # A cache that cannot be written only costs a re-read next build
+            pass
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
@@ -0,0 +1,237 @@
+import mmap
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from PIL import Image
+
+from .xmp import parse_xmp
+
+XMP_MARKER = "http://ns.adobe.com/xap/1.0/"
+
+XMP_PREFIX = XMP_MARKER.encode("ascii") + b"\x00"
+EXIF_HEADER = b"Exif\x00\x00"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+PNG_XMP_KEYWORD = b"XML:com.adobe.xmp"
+# Start of frame markers, holding the image dimensions (not DHT, JPG or DAC)
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# Markers without a length field
+JPEG_STANDALONE_MARKERS = frozenset([0x01, 0xD8, *range(0xD0, 0xD8)])
+
+
+@dataclass
+class PhotoProbe:
+    """Everything read from a photo's headers in a single open.
+
+    ``exif`` holds the raw Pillow Exif (IFD0, sub-IFDs through get_ifd()) and
+    ``xmp`` the parsed XMP packets as xmp.XmpData.  ``date``, ``exif_data`` and
+    ``faces`` are filled in by the extractors that consume the probe.
+    """
+
+    path: str
+    format: str = None
+    width: int = 0
+    height: int = 0
+    exif: Image.Exif = None
+    xmp: list = field(default_factory=list)
+    date: str = None
+    exif_data: dict = field(default_factory=dict)
+    faces: list = field(default_factory=list)
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+
+def split_xmp_segment(segment, content):
+    """Return the XMP body of an APPn segment, or None if it is not an XMP packet."""
+    # XMP format can be either:
+    # 1. \x00http://ns.adobe.com/xap/1.0/\x00<body> (starts with null)
+    # 2. http://ns.adobe.com/xap/1.0/\x00<body> (doesn't start with null)
+    parts = content.split(b"\x00", 2)
+    if len(parts) >= 3:
+        marker = parts[1].decode("utf-8", errors="ignore")
+        body_bytes = parts[2]
+    elif len(parts) == 2:
+        marker = parts[0].decode("utf-8", errors="ignore")
+        body_bytes = parts[1]
+    else:
+        return None
+
+    if segment != "APP1" or marker != XMP_MARKER:
+        return None
+    return body_bytes.decode("utf-8")
+
+
+@dataclass
+class ContainerHeader:
+    """Metadata found by walking the segments of a JPEG or PNG file.
+
+    ``exif`` is the TIFF structure of the EXIF block and ``xmp`` the XMP
+    packets.  Both are memoryviews into the mapped file, only valid inside
+    scan_headers().
+    """
+
+    format: str
+    width: int = 0
+    height: int = 0
+    exif: memoryview = None
+    xmp: list = field(default_factory=list)
+
+
+def _scan_jpeg(data):
+    header = ContainerHeader("JPEG")
+    pos, end = 2, len(data)
+    while pos + 4 <= end:
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        if marker in JPEG_STANDALONE_MARKERS:
+            pos += 2
+            continue
+        if marker in (0xDA, 0xD9):
+            # Entropy coded data follows, there is no metadata after it
+            break
+        length = int.from_bytes(data[pos + 2 : pos + 4], "big")
+        start, pos = pos + 4, pos + 2 + length
+        if length < 2 or pos > end:
+            return None
+        if marker == 0xE1:
+            payload = data[start:pos]
+            if payload[:6] == EXIF_HEADER:
+                if header.exif is None:
+                    header.exif = payload[6:]
+                continue
+            # Same layouts as split_xmp_segment(), with or without a leading null
+            for prefix in (XMP_PREFIX, b"\x00" + XMP_PREFIX):
+                if payload[: len(prefix)] == prefix:
+                    header.xmp.append(payload[len(prefix) :])
+                    break
+        elif marker in JPEG_SOF_MARKERS and length >= 7:
+            header.height = int.from_bytes(data[start + 1 : start + 3], "big")
+            header.width = int.from_bytes(data[start + 3 : start + 5], "big")
+    return header if header.width and header.height else None
+
+
+def _scan_png(data):
+    header = ContainerHeader("PNG")
+    pos, end = len(PNG_SIGNATURE), len(data)
+    while pos + 8 <= end:
+        length = int.from_bytes(data[pos : pos + 4], "big")
+        chunk_type = bytes(data[pos + 4 : pos + 8])
+        start, stop = pos + 8, pos + 8 + length
+        if stop > end:
+            return None
+        if chunk_type in (b"IDAT", b"IEND"):
+            break
+        if chunk_type == b"IHDR" and length >= 8:
+            header.width = int.from_bytes(data[start : start + 4], "big")
+            header.height = int.from_bytes(data[start + 4 : start + 8], "big")
+        elif chunk_type == b"eXIf" and header.exif is None:
+            header.exif = data[start:stop]
+        elif (
+            chunk_type == b"iTXt" and bytes(data[start : start + len(PNG_XMP_KEYWORD) + 1]) == PNG_XMP_KEYWORD + b"\x00"
+        ):
+            # keyword, compression flag and method, language tag, translated keyword, text
+            flag = start + len(PNG_XMP_KEYWORD) + 1
+            text = data[flag + 2 : stop]
+            for _ in range(2):
+                text = text[bytes(text).index(b"\x00") + 1 :]
+            header.xmp.append(zlib.decompress(text) if data[flag] else text)
+        pos = stop + 4  # CRC
+    return header if header.width and header.height else None
+
+
+@contextmanager
+def scan_headers(path):
+    """Map ``path`` and yield its ContainerHeader, or None if it is not a JPEG or PNG.
+
+    Only the segments before the image data are touched, so reading the
+    metadata of a large file costs a few pages instead of the whole file.
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        data = memoryview(mapped)
+        header = None
+        try:
+            if data[:2] == b"\xff\xd8":
+                header = _scan_jpeg(data)
+            elif data[: len(PNG_SIGNATURE)] == PNG_SIGNATURE:
+                header = _scan_png(data)
+            yield header
+        finally:
+            # Views into the map must be gone before it is closed
+            if header is not None:
+                for view in [header.exif, *header.xmp]:
+                    if isinstance(view, memoryview):
+                        view.release()
+            data.release()
+
+
+def _probe_headers(probe):
+    """Fill ``probe`` from the raw segments, False when the file needs Pillow."""
+    with scan_headers(probe.path) as header:
+        if header is None:
+            return False
+        probe.format = header.format
+        probe.width, probe.height = header.width, header.height
+        probe.exif = Image.Exif()
+        try:
+            if header.exif is not None:
+                probe.exif.load(bytes(header.exif))
+        except Exception:
+            pass
+        for packet in header.xmp:
+            try:
+                probe.xmp.append(parse_xmp(bytes(packet).decode("utf-8")))
+            except Exception:
+                continue
+    return True
+
+
+def probe_photo(path):
+    """Open ``path`` once and read its dimensions, EXIF and XMP.
+
+    JPEG and PNG headers are scanned directly, other formats go through
+    Image.open.  Each part is read independently so that a broken EXIF block
+    does not hide the XMP packet (or vice versa).  A file that cannot be opened
+    at all yields an empty probe; decoding problems are reported by the resize
+    stage.
+    """
+    probe = PhotoProbe(path)
+    try:
+        if _probe_headers(probe):
+            return probe
+    except Exception:
+        # Unusual layouts are left to Pillow
+        probe = PhotoProbe(path)
+    try:
+        with Image.open(path) as im:
+            try:
+                probe.format = im.format
+                probe.width, probe.height = im.size
+            except Exception:
+                pass
+
+            try:
+                if hasattr(im, "getexif"):
+                    probe.exif = im.getexif()
+            except Exception:
+                pass
+
+            if hasattr(im, "applist"):
+                for segment, content in im.applist:
+                    try:
+                        body_str = split_xmp_segment(segment, content)
+                        if body_str is not None:
+                            probe.xmp.append(parse_xmp(body_str))
+                    except Exception:
+                        # Skip segments that don't match expected format
+                        continue
+    except Exception:
+        pass
+
+    return probe
@@ -0,0 +1,135 @@
+import heapq
+import itertools
+import os
+import time
+
+# Fixed cost of a job, in decoded pixel equivalents: stat, probe, copy check
+BASE_COST = 200_000
+
+# Relative decode and resize cost per pixel
+FORMAT_FACTORS = {
+    ".jpg": 1.0,
+    ".jpeg": 1.0,
+    ".gif": 1.0,
+    ".tif": 1.2,
+    ".tiff": 1.2,
+    ".png": 1.5,
+    ".webp": 1.5,
+    ".heic": 2.5,
+    ".heif": 2.5,
+    ".avif": 3.0,
+}
+
+# Typical pixels per byte of a photo file, used when its dimensions are unknown
+PIXELS_PER_BYTE = {
+    ".jpg": 3.0,
+    ".jpeg": 3.0,
+    ".gif": 1.0,
+    ".tif": 0.33,
+    ".tiff": 0.33,
+    ".png": 0.5,
+    ".webp": 6.0,
+    ".heic": 8.0,
+    ".heif": 8.0,
+    ".avif": 10.0,
+}
+
+# Jobs considered at once when picking the most expensive one
+LOOKAHEAD = 256
+# Jobs cheaper than this are sent to the workers in batches
+SMALL_JOB_COST = BASE_COST + 2_000_000
+SMALL_JOB_BATCH = 16
+
+
+def job_cost(photo_file, manifest_record=None, metadata_cache=None, sizes=1, st=None):
+    """Estimate the work needed for a photo, in decoded pixel equivalents.
+
+    Unchanged sources (same size and mtime as in the manifest) reuse their
+    derivatives and only cost the fixed overhead.  Otherwise the cost grows
+    with the pixel count, from the metadata cache or guessed from the file
+    size, the format and the number of sizes to generate.  ``st`` is the
+    os.stat result taken when the photo was listed, if any.
+    """
+    if st is None:
+        try:
+            st = os.stat(photo_file)
+        except OSError:
+            return BASE_COST
+
+    if (
+        manifest_record is not None
+        and manifest_record.get("size") == st.st_size
+        and manifest_record.get("mtime_ns") == st.st_mtime_ns
+    ):
+        return BASE_COST
+
+    ext = os.path.splitext(photo_file)[1].lower()
+    cached = metadata_cache.get(photo_file, st.st_size, st.st_mtime_ns) if metadata_cache is not None else None
+    if cached is not None:
+        pixels = cached["width"] * cached["height"]
+    else:
+        pixels = st.st_size * PIXELS_PER_BYTE.get(ext, 1.0)
+
+    # Decoding dominates, each additional size adds a cheaper resize
+    return BASE_COST + int(pixels * FORMAT_FACTORS.get(ext, 1.0) * (1 + 0.1 * max(sizes - 1, 0)))
+
+
+class Scheduler:
+    """Orders jobs longest first within a lookahead window and tracks progress.
+
+    ``tasks`` turns a job iterable into pool tasks: lists holding either one
+    expensive job or a batch of cheap ones.  ``done`` records finished jobs;
+    ``progress`` reports completion and an ETA based on the cost model.
+    """
+
+    def __init__(self, cost, lookahead=LOOKAHEAD):
+        self.cost = cost
+        self.lookahead = lookahead
+        self.costs = {}
+        self.total_cost = 0
+        self.done_cost = 0
+        self.total_jobs = 0
+        self.done_jobs = 0
+        self.listed = False
+        self.started = time.monotonic()
+
+    def tasks(self, jobs):
+        heap = []
+        order = itertools.count()
+        jobs = iter(jobs)
+
+        while True:
+            while not self.listed and len(heap) < self.lookahead:
+                job = next(jobs, None)
+                if job is None:
+                    self.listed = True
+                    break
+                cost = self.cost(job)
+                self.costs[job[1]] = cost
+                self.total_cost += cost
+                self.total_jobs += 1
+                heapq.heappush(heap, (-cost, next(order), job))
+            if not heap:
+                return
+
+            cost, _, job = heapq.heappop(heap)
+            task = [job]
+            if -cost < SMALL_JOB_COST:
+                # Everything left in the buffer is at most as expensive
+                while heap and len(task) < SMALL_JOB_BATCH:
+                    task.append(heapq.heappop(heap)[2])
+            yield task
+
+    def done(self, photo_file):
+        self.done_jobs += 1
+        self.done_cost += self.costs.pop(photo_file, 0)
+
+    def progress(self):
+        """Human readable progress with an estimated time left."""
+        msg = f"{self.done_jobs}/{self.total_jobs}{'' if self.listed else '+'} photos"
+        elapsed = time.monotonic() - self.started
+        if self.done_cost and elapsed > 0:
+            remaining = (self.total_cost - self.done_cost) / (self.done_cost / elapsed)
+            minutes, seconds = divmod(int(remaining), 60)
+            msg += f", ETA {minutes}m{seconds:02d}s" + ("" if self.listed else " (still listing)")
+        return msg
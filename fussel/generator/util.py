@@ -1,16 +1,17 @@
+import functools
+import hashlib
+import io
 import os
+import shutil
+import threading
+from contextlib import contextmanager
 
-from PIL import Image
+from PIL import Image, ImageOps
 from slugify import slugify
 
 from .config import Config
 
 
-def is_supported_album(path):
-    folder_name = os.path.basename(path)
-    return not folder_name.startswith(".") and os.path.isdir(path)
-
-
 def extract_extension(path):
     return os.path.splitext(path)[1].lower()
 
@@ -49,6 +50,68 @@ def calculate_new_size(input_size, desired_size):
     return int(input_size[0] / reduction_factor), int(input_size[1] / reduction_factor)
 
 
+# Resampling filter and reducing_gap of each gallery.resize_quality,
+# best resamples the fully decoded image
+RESIZE_QUALITIES = {
+    "fast": (Image.Resampling.BILINEAR, 1.0),
+    "balanced": (Image.Resampling.BICUBIC, 2.0),
+    "best": (Image.Resampling.LANCZOS, None),
+}
+
+
+def draft_size(size, fast_decode=True, quality="balanced"):
+    """The box a JPEG is decoded to in draft mode before being resized to ``size``.
+
+    Like Image.thumbnail(), the draft keeps ``reducing_gap`` times the target so
+    the resampling filter still has pixels to work with.  None when the source
+    is fully decoded.
+    """
+    _, reducing_gap = RESIZE_QUALITIES.get(quality, RESIZE_QUALITIES["balanced"])
+    if not fast_decode or reducing_gap is None:
+        return None
+    return int(size[0] * reducing_gap), int(size[1] * reducing_gap)
+
+
+def resize_cascade(im, sizes, exif_transpose=False, fast_decode=True, quality="balanced"):
+    """Yield ``(size, image)`` for every distinct target in ``sizes``, largest first.
+
+    The source is decoded once and each smaller size is derived from the previous
+    one instead of going back to the original.  Sizes are expressed in the stored
+    frame (as returned by calculate_new_size); when ``exif_transpose`` is set the
+    orientation is applied once, right after the first and largest resize.
+    The yielded image is reused for the next size, so save it before advancing.
+
+    With ``fast_decode`` JPEG sources are decoded in draft mode at the largest DCT
+    scale that still covers the largest size, see draft_size.  Without it every
+    source is fully decoded and resampled in a single step.
+
+    ``quality`` picks the resampling filter and how far draft() and ``reduce()``
+    may shrink the image before it is resampled, see RESIZE_QUALITIES.
+    """
+    ordered = sorted(set(sizes), key=lambda s: s[0], reverse=True)
+    if not ordered:
+        return
+
+    resample, reducing_gap = RESIZE_QUALITIES.get(quality, RESIZE_QUALITIES["balanced"])
+    box = draft_size(ordered[0], fast_decode, quality)
+    if box is not None:
+        # Only JPEG implements draft(), other formats ignore it.  Pillow applies
+        # the first draft only, so the one thumbnail() would request is made here.
+        im.draft(None, box)
+    if not fast_decode:
+        reducing_gap = None
+
+    swapped = False
+    current = im
+    for i, size in enumerate(ordered):
+        current.thumbnail((size[1], size[0]) if swapped else size, resample=resample, reducing_gap=reducing_gap)
+        if i == 0 and exif_transpose:
+            transposed = ImageOps.exif_transpose(current)
+            swapped = transposed.size != current.size
+            current = transposed
+        yield size, current
+
+
 def increase_w(left, top, right, bottom, w, h, target_ratio):
     # print("increase width")
     f_l = left
@@ -153,24 +216,236 @@ def calculate_face_crop_dimensions(input_size, face_size, face_position):
     return left, top, right, bottom
 
 
-def apply_watermark(base_image_path, watermark_image, watermark_ratio):
+def crop_faces(im, faces, path):
+    """Store on every face the encoded crop of ``im`` used as person thumbnail.
+
+    Crops are encoded in the format ``path`` would be saved with.
+    """
+    image_format = Image.registered_extensions().get(extract_extension(path))
+    for face in faces:
+        face_size = face.geometry.w, face.geometry.h
+        face_position = face.geometry.x, face.geometry.y
+        box = calculate_face_crop_dimensions(im.size, face_size, face_position)
+        buffer = io.BytesIO()
+        im.crop(box).save(buffer, format=image_format)
+        face.crop = buffer.getvalue()
+
+
+class Watermark:
+    """A watermark image loaded once and scaled to ``ratio`` of each image it is applied to.
 
-    with Image.open(base_image_path) as base_image:
+    Scaled copies are kept per target width, photos of the same orientation
+    mostly share the width of their largest size.
+    """
+
+    MAX_SCALED = 32
+
+    def __init__(self, image, ratio):
+        self.image = image
+        self.ratio = ratio
+        self.scaled = {}
+
+    def scaled_to(self, width):
+        watermark_width = int(width * self.ratio)
+        if watermark_width not in self.scaled:
+            if len(self.scaled) >= self.MAX_SCALED:
+                self.scaled.clear()
+            orig_watermark_width, orig_watermark_height = self.image.size
+            watermark_height = int(watermark_width / orig_watermark_width * orig_watermark_height)
+            self.scaled[watermark_width] = self.image.resize((watermark_width, watermark_height))
+        return self.scaled[watermark_width]
+
+    def apply(self, base_image):
+        """Return a copy of ``base_image`` with the watermark in its bottom right corner."""
         width, height = base_image.size
-        orig_watermark_width, orig_watermark_height = watermark_image.size
-        watermark_width = int(width * watermark_ratio)
-        watermark_height = int(watermark_width / orig_watermark_width * orig_watermark_height)
-        watermark_image = watermark_image.resize((watermark_width, watermark_height))
+        watermark_image = self.scaled_to(width)
+        watermark_width, watermark_height = watermark_image.size
         transparent = Image.new(base_image.mode, (width, height), (0, 0, 0, 0))
         transparent.paste(base_image, (0, 0))
 
         watermark_x = width - watermark_width
         watermark_y = height - watermark_height
         transparent.paste(watermark_image, box=(watermark_x, watermark_y), mask=watermark_image)
-        transparent.save(base_image_path)
+        return transparent
+
+
+@functools.lru_cache(maxsize=4)
+def load_watermark(path, ratio):
+    """The Watermark of ``path``, read once per process."""
+    with Image.open(path) as im:
+        im.load()
+        return Watermark(im.copy(), ratio)
 
 
 def pick_album_thumbnail(album_photos):
     if len(album_photos) > 0:
         return album_photos[0].thumb
     return ""
+
+
+def shard_dir(key):
+    """One of 256 subdirectories spreading the files of one folder evenly, e.g. ``3f``.
+
+    ``key`` identifies the photo rather than one of its files, so all the
+    outputs of a photo share a directory.
+    """
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=1).hexdigest()
+
+
+class DirectoryIndex:
+    """Names of the files found in output directories, listed once each.
+
+    ``exists`` lists a directory with scandir the first time a file in it is
+    looked up and answers from that listing afterwards, so checking many files
+    costs one listing per directory instead of one stat per file.
+    """
+
+    def __init__(self):
+        self.dirs = {}
+
+    def forget(self, root):
+        """Drop the listings of ``root`` and everything below it."""
+        root = os.path.normpath(root)
+        prefix = os.path.join(root, "")
+        self.dirs = {d: names for d, names in self.dirs.items() if d != root and not d.startswith(prefix)}
+
+    def exists(self, path):
+        directory, name = os.path.split(os.path.normpath(path))
+        if directory not in self.dirs:
+            try:
+                with os.scandir(directory) as it:
+                    self.dirs[directory] = {e.name for e in it}
+            except OSError:
+                self.dirs[directory] = set()
+        return name in self.dirs[directory]
+
+
+def remove_orphans(root, expected, dry_run=False):
+    """Remove files under ``root`` that are not in ``expected``.
+
+    Returns the orphaned paths and their total size.  With ``dry_run`` nothing
+    is removed.  Directories left empty are removed as well.
+    """
+    expected = {os.path.normpath(p) for p in expected}
+    orphans = []
+    total_size = 0
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        for filename in filenames:
+            path = os.path.normpath(os.path.join(dirpath, filename))
+            if path in expected:
+                continue
+            try:
+                total_size += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+            except OSError:
+                continue
+            orphans.append(path)
+        if not dry_run and dirpath != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return orphans, total_size
+
+
+def temp_path(path):
+    """Hidden name next to ``path``, unique to this process and thread."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, ".%s.%d.%d.tmp" % (name, os.getpid(), threading.get_ident()))
+
+
+@contextmanager
+def atomic_write(path):
+    """Open a temporary file that replaces ``path`` once completely written.
+
+    ``path`` always holds either its previous content or the new one: an
+    interrupted write leaves a hidden temporary file, which the cleanup of
+    stale files removes, but never a truncated ``path``.
+    """
+    tmp = temp_path(path)
+    try:
+        with open(tmp, "wb") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def save_image(im, path):
+    """Save ``im`` atomically in the format matching the extension of ``path``."""
+    with atomic_write(path) as f:
+        im.save(f, format=Image.registered_extensions().get(extract_extension(path)))
+
+
+# Linux ioctl cloning a whole file (copy-on-write), from linux/fs.h
+FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def link_file(src, dst, strategy="copy"):
+    """Make ``dst`` hold the content of ``src`` using ``strategy``.
+
+    ``hardlink``, ``reflink`` and ``symlink`` avoid copying any data.  When
+    the filesystem does not support them (or ``src`` and ``dst`` are on
+    different devices) the file is copied instead.  Returns the strategy that
+    was actually used.
+    """
+    # Made under a temporary name and renamed over ``dst``: an existing link
+    # is replaced, never written through into the source, and an interrupted
+    # copy never leaves a truncated ``dst``
+    tmp = temp_path(dst)
+    used = "copy"
+    try:
+        try:
+            if strategy == "hardlink":
+                os.link(src, tmp)
+                used = strategy
+            elif strategy == "symlink":
+                os.symlink(os.path.abspath(src), tmp)
+                used = strategy
+            elif strategy == "reflink":
+                _reflink(src, tmp)
+                used = strategy
+        except (OSError, ImportError):
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+        if used == "copy":
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+    return used
+
+
+def sync_file(src, dst, strategy="copy"):
+    """copytree ``copy_function`` publishing ``src`` to ``dst`` with ``strategy``.
+
+    Files already published with the same size and modification time are
+    left alone, so republishing an unchanged gallery moves no data.  Symlinks
+    are recreated rather than followed.
+    """
+    if strategy == "symlink" and os.path.islink(src):
+        target = os.readlink(src)
+        if not (os.path.islink(dst) and os.readlink(dst) == target):
+            if os.path.lexists(dst):
+                os.remove(dst)
+            os.symlink(target, dst)
+        return dst
+    try:
+        s, d = os.stat(src), os.stat(dst)
+        if s.st_size == d.st_size and s.st_mtime_ns == d.st_mtime_ns:
+            return dst
+    except OSError:
+        pass
+    # The published site must not depend on the generator's working tree
+    if link_file(src, dst, "copy" if strategy == "symlink" else strategy) != "hardlink":
+        shutil.copystat(src, dst)
+    return dst
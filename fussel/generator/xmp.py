@@ -0,0 +1,125 @@
+from dataclasses import dataclass, field
+from xml.parsers import expat
+
+# Local names of the XMP date properties, in order of preference
+DATE_FIELDS = ("datecreated", "createdate", "datetimeoriginal", "modifydate", "metadatadate", "date")
+
+AREA_FIELDS = ("w", "h", "x", "y")
+
+
+@dataclass
+class XmpData:
+    """Dates and MWG face regions found in one XMP packet.
+
+    ``dates`` holds raw date strings, best candidate first.  ``regions`` holds
+    ``(name, w, h, x, y)`` tuples for every Face region (or named region with an
+    area), in document order.  Values are kept as the strings found in the packet.
+    """
+
+    dates: list = field(default_factory=list)
+    regions: list = field(default_factory=list)
+
+
+class _Description:
+    def __init__(self, order, depth):
+        self.order = order
+        self.depth = depth
+        self.type = None
+        self.name = None
+        self.areas = []
+        self.nested_areas = []
+        self.dates = {}
+
+
+def _local(name):
+    # Prefixes vary between writers (mwg-rs, MPRI, stArea, ...) and are often
+    # undeclared, so properties are matched on their lower-cased local name.
+    return name.rpartition(":")[2].lower()
+
+
+def parse_xmp(body):
+    """Parse an XMP packet (str or bytes) in a single streaming pass.
+
+    Namespace processing is disabled so undeclared prefixes do not abort the
+    parse, and properties are accepted both as attributes and as child
+    elements.  A malformed packet yields whatever was found before the error.
+    """
+    data = XmpData()
+    descriptions = []  # Open rdf:Description elements, innermost last
+    finished = []
+    elements = []  # Local names of every open element
+    text = []
+    area = None
+
+    def start(name, attrs):
+        nonlocal area
+        local = _local(name)
+        attrs = {_local(k): v for k, v in attrs.items()}
+        depth = len(elements)
+        elements.append(local)
+        text.clear()
+
+        if local == "description":
+            desc = _Description(len(finished) + len(descriptions), depth)
+            desc.type = attrs.get("type")
+            desc.name = attrs.get("name")
+            for date_field in DATE_FIELDS:
+                if attrs.get(date_field):
+                    desc.dates.setdefault(date_field, attrs[date_field])
+            descriptions.append(desc)
+        elif local == "area" and descriptions:
+            area = {k: attrs.get(k) or "" for k in AREA_FIELDS}
+            desc = descriptions[-1]
+            (desc.areas if desc.depth == depth - 1 else desc.nested_areas).append(area)
+            for outer in descriptions[:-1]:
+                outer.nested_areas.append(area)
+
+    def end(name):
+        nonlocal area
+        local = elements.pop()
+        value = "".join(text).strip()
+        text.clear()
+
+        if local == "description" and descriptions:
+            finished.append(descriptions.pop())
+        elif local == "area":
+            area = None
+        elif value and area is not None and local in AREA_FIELDS and elements and elements[-1] == "area":
+            area[local] = area[local] or value
+        elif value and descriptions and descriptions[-1].depth == len(elements) - 1:
+            desc = descriptions[-1]
+            if local == "type" and not desc.type:
+                desc.type = value
+            elif local == "name" and not desc.name:
+                desc.name = value
+            elif local in DATE_FIELDS:
+                desc.dates.setdefault(local, value)
+
+    def chars(data):
+        text.append(data)
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = chars
+    try:
+        parser.Parse(body, True)
+    except expat.ExpatError:
+        pass
+    finished.extend(reversed(descriptions))
+    finished.sort(key=lambda d: d.order)
+
+    for desc in finished:
+        for date_field in DATE_FIELDS:
+            if date_field in desc.dates:
+                data.dates.append(desc.dates[date_field])
+
+        name = (desc.name or "").strip()
+        areas = desc.areas or desc.nested_areas
+        if desc.type == "Face" or (name and areas):
+            for a in areas:
+                if a["w"] and a["h"] and a["x"] and a["y"]:
+                    data.regions.append((name, a["w"], a["h"], a["x"], a["y"]))
+
+    return data
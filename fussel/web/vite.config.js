@@ -1,12 +1,35 @@
+import { cpSync } from 'node:fs'
+import { resolve } from 'node:path'
 import { defineConfig } from 'vite'
 import react from '@vitejs/plugin-react'
 
+// Generated photos are published by fussel straight from public/static/_gallery,
+// so the build copies everything else in public/ and leaves them out
+function copyPublicAssets() {
+  let config
+  return {
+    name: 'fussel-copy-public-assets',
+    apply: 'build',
+    configResolved(resolvedConfig) {
+      config = resolvedConfig
+    },
+    writeBundle() {
+      const gallery = resolve(config.publicDir, 'static', '_gallery')
+      cpSync(config.publicDir, resolve(config.root, config.build.outDir), {
+        recursive: true,
+        filter: (src) => resolve(src) !== gallery,
+      })
+    },
+  }
+}
+
 export default defineConfig({
-  plugins: [react()],
+  plugins: [react(), copyPublicAssets()],
   base: process.env.VITE_BASE_URL || '/',
   build: {
     outDir: 'build',
     emptyOutDir: true,
+    copyPublicDir: false,
   },
   test: {
     environment: 'jsdom',
@@ -4,6 +4,7 @@ Shared pytest fixtures for all tests.
 
 import os
 import tempfile
+from unittest.mock import patch
 
 import pytest
 import yaml
@@ -16,6 +17,13 @@ def temp_dir():
         yield tmpdir
 
 
+@pytest.fixture
+def mock_atomic_write():
+    """Discard what mocked images write through util.atomic_write."""
+    with patch("fussel.generator.util.atomic_write") as mock_write:
+        yield mock_write
+
+
 @pytest.fixture
 def sample_config_dict():
     """Sample configuration dictionary for testing."""
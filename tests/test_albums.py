@@ -2,11 +2,15 @@
 Tests for Albums class in fussel.generator.generate module.
 """
 
-from unittest.mock import MagicMock, Mock, patch
+import os
+import threading
+from unittest.mock import Mock, patch
 
 import pytest
 
-from fussel.generator.generate import Album, Albums, Photo
+from fussel.generator.generate import Album, Albums, Photo, _InFlight
+from fussel.generator.manifest import Manifest
+from fussel.generator.util import DirectoryIndex
 
 
 class TestAlbumsSingleton:
@@ -84,137 +88,286 @@ class TestAlbumsMethods:
         assert albums[1] in [album1, album2]
         assert albums[0] != albums[1]
 
-    @patch("fussel.generator.generate.find_unique_slug")
-    @patch("fussel.generator.generate.is_supported_album")
+    def _tree(self, temp_dir, *photos):
+        input_path = os.path.join(temp_dir, "input")
+        for rel in photos:
+            path = os.path.join(input_path, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "wb").close()
+        return input_path
+
+    def _mock_pool(self, mock_pool, fail=(), faces=False):
+        """Make the mocked pool process jobs in reverse, like an unordered pool could."""
+
+        def fake_imap_unordered(fn, tasks):
+            results = []
+            for task in tasks:
+                batch = []
+                for job in task:
+                    photo = None
+                    if job[2] not in fail:
+                        photo = Photo(job[2], 10, 10, job[1], job[1], job[3], {})
+                    batch.append((job[1], photo, {"outputs": {}}, [job[2]] if faces else []))
+                results.append(list(reversed(batch)))
+            return reversed(results)
+
+        pool = mock_pool.return_value.__enter__.return_value
+        pool.imap_unordered.side_effect = fake_imap_unordered
+        return pool
+
+    def _config(self, mock_config, recursive=True):
+        mock_config.instance.return_value.recursive_albums = recursive
+        mock_config.instance.return_value.recursive_albums_name_pattern = "{parent_album} > {album}"
+        mock_config.instance.return_value.parallel_tasks = 2
+        mock_config.instance.return_value.memory_budget = 0
+        mock_config.instance.return_value.worker_max_tasks = 0
+        mock_config.instance.return_value.photo_sizes = [(500, 500)]
+        mock_config.instance.return_value.io_threads = 0
+        mock_config.instance.return_value.duplicates_enabled = False
+
     @patch("fussel.generator.generate.is_supported_photo")
-    @patch("fussel.generator.generate.os.listdir")
-    @patch("fussel.generator.generate.os.path.join")
-    @patch("fussel.generator.generate.os.path.basename")
-    @patch("fussel.generator.generate.os.makedirs")
     @patch("fussel.generator.generate.Config")
     @patch("fussel.generator.generate.Pool")
     @patch("fussel.generator.generate.People")
-    def test_process_path(
-        self,
-        mock_people,
-        mock_pool,
-        mock_config,
-        mock_makedirs,
-        mock_basename,
-        mock_join,
-        mock_listdir,
-        mock_is_photo,
-        mock_is_album,
-        mock_find_slug,
-    ):
-        """Test process_path method."""
+    def test_process_path(self, mock_people, mock_pool, mock_config, mock_is_photo, temp_dir):
+        """Test process_path skips dotfiles and albums without photos."""
         albums = Albums.instance()
+        self._config(mock_config, recursive=False)
+        mock_is_photo.side_effect = lambda p: p.endswith(".jpg")
+        self._mock_pool(mock_pool)
 
-        # Setup mocks
-        mock_config.instance.return_value.recursive_albums = False
-        mock_config.instance.return_value.recursive_albums_name_pattern = "{parent_album} > {album}"
-        mock_config.instance.return_value.parallel_tasks = 2
+        input_path = self._tree(temp_dir, "album1/photo.jpg", "album2/notes.txt", ".hidden/photo.jpg")
 
-        mock_listdir.return_value = ["album1", "album2"]
-        mock_join.side_effect = lambda *args: "/".join(args)
-        mock_basename.side_effect = lambda p: p.split("/")[-1]
-        mock_is_album.return_value = True
-        mock_is_photo.return_value = False
-        mock_find_slug.return_value = "album-1"
+        albums.process_path(
+            root_path=input_path,
+            output_albums_photos_path=os.path.join(temp_dir, "output"),
+            external_root="/external",
+            yaml_config=Mock(),
+        )
 
-        mock_yaml_config = Mock()
+        assert list(albums.albums) == ["album1"]
+        assert os.path.isdir(os.path.join(temp_dir, "output", "album2"))
+        assert not os.path.exists(os.path.join(temp_dir, "output", "hidden"))
 
-        # Mock Pool to return empty results
-        mock_pool_instance = MagicMock()
-        mock_pool_instance.__enter__.return_value.map.return_value = []
-        mock_pool.return_value = mock_pool_instance
+    @patch("fussel.generator.generate.is_supported_photo")
+    @patch("fussel.generator.generate.Config")
+    @patch("fussel.generator.generate.Pool")
+    @patch("fussel.generator.generate.People")
+    def test_process_album_path_with_photos(self, mock_people, mock_pool, mock_config, mock_is_photo, temp_dir):
+        """Test process_album_path with photos."""
+        albums = Albums.instance()
+        self._config(mock_config, recursive=False)
+        mock_is_photo.side_effect = lambda p: p.endswith(".jpg")
+        pool = self._mock_pool(mock_pool)
 
-        mock_people.instance.return_value.detect_faces = Mock()
+        input_path = self._tree(temp_dir, "album1/b.jpg", "album1/a.jpg", "album1/.a.jpg")
+        manifest = Manifest("/cache/manifest.json", {os.path.join(input_path, "album1", "a.jpg"): {"outputs": {}}})
 
-        albums.process_path(
-            root_path="/input",
-            output_albums_photos_path="/output",
+        albums.process_album_path(
+            album_dir=os.path.join(input_path, "album1"),
+            album_name="Album 1",
+            output_albums_photos_path=os.path.join(temp_dir, "output"),
             external_root="/external",
-            yaml_config=mock_yaml_config,
+            yaml_config=Mock(),
+            manifest=manifest,
         )
 
-        # Verify albums were processed
-        assert mock_listdir.called
+        # Photos keep their listing order although results came back reversed
+        album = albums.albums["album-1"]
+        assert [p.name for p in album.photos] == ["a.jpg", "b.jpg"]
+        assert album.src == album.photos[0].thumb
+
+        # Workers receive the previous record and the new one is merged back
+        pool.imap_unordered.assert_called_once()
+        assert manifest.get(os.path.join(input_path, "album1", "a.jpg")) == {"outputs": {}}
+        assert manifest.seen == {os.path.join(input_path, "album1", p) for p in ("a.jpg", "b.jpg")}
+
+    @patch("fussel.generator.generate.is_supported_photo")
+    @patch("fussel.generator.generate.Config")
+    @patch("fussel.generator.generate.Pool")
+    def test_process_path_uses_one_pool_for_all_albums(self, mock_pool, mock_config, mock_is_photo, temp_dir):
+        """Test the whole tree is streamed through a single pool."""
+        albums = Albums.instance()
+        self._config(mock_config)
+        mock_is_photo.side_effect = lambda p: p.endswith(".jpg")
+        pool = self._mock_pool(mock_pool, fail=("other.jpg",))
+
+        input_path = self._tree(temp_dir, "a/img.jpg", "a/other.jpg", "a/sub/img.jpg", "b/img.jpg")
+
+        albums.process_path(input_path, os.path.join(temp_dir, "output"), "/external", Mock())
+
+        mock_pool.assert_called_once()
+        pool.imap_unordered.assert_called_once()
+        assert sorted(albums.albums) == ["a", "a-sub", "b"]
+        assert [p.name for p in albums.albums["a"].photos] == ["img.jpg"]
+        assert albums.albums["a-sub"].name == "a > sub"
+        assert albums.albums["a-sub"].photos[0].src == os.path.join(input_path, "a", "sub", "img.jpg")
+        assert albums.albums["b"].photos[0].src == os.path.join(input_path, "b", "img.jpg")
+
+    @patch("fussel.generator.generate.is_supported_photo")
+    @patch("fussel.generator.generate.Config")
+    @patch("fussel.generator.generate.Pool")
+    def test_workers_are_recycled_by_photo_count(self, mock_pool, mock_config, mock_is_photo, temp_dir):
+        """Test a worker never handles more photos than max_tasks_per_worker when small photos are batched."""
+        albums = Albums.instance()
+        self._config(mock_config)
+        mock_config.instance.return_value.worker_max_tasks = 32
+        mock_is_photo.side_effect = lambda p: p.endswith(".jpg")
+        pool = self._mock_pool(mock_pool)
+        tasks = []
+        fake_imap_unordered = pool.imap_unordered.side_effect
+        pool.imap_unordered.side_effect = lambda fn, it: fake_imap_unordered(fn, (tasks.append(t) or t for t in it))
+
+        input_path = self._tree(temp_dir, *["a/%02d.jpg" % i for i in range(40)])
+
+        albums.process_path(input_path, os.path.join(temp_dir, "output"), "/external", Mock())
+
+        maxtasksperchild = mock_pool.call_args.kwargs["maxtasksperchild"]
+        assert max(len(task) for task in tasks) > 1
+        assert maxtasksperchild * max(len(task) for task in tasks) <= 32
+        assert len(albums.albums["a"].photos) == 40
 
-    @patch("fussel.generator.generate.find_unique_slug")
-    @patch("fussel.generator.generate.is_supported_album")
     @patch("fussel.generator.generate.is_supported_photo")
-    @patch("fussel.generator.generate.os.listdir")
-    @patch("fussel.generator.generate.os.path.join")
-    @patch("fussel.generator.generate.os.path.basename")
-    @patch("fussel.generator.generate.os.makedirs")
     @patch("fussel.generator.generate.Config")
     @patch("fussel.generator.generate.Pool")
     @patch("fussel.generator.generate.People")
-    @patch("fussel.generator.generate.pick_album_thumbnail")
-    def test_process_album_path_with_photos(
-        self,
-        mock_pick_thumb,
-        mock_people,
-        mock_pool,
-        mock_config,
-        mock_makedirs,
-        mock_basename,
-        mock_join,
-        mock_listdir,
-        mock_is_photo,
-        mock_is_album,
-        mock_find_slug,
-    ):
-        """Test process_album_path with photos."""
+    def test_people_are_merged_in_listing_order(self, mock_people, mock_pool, mock_config, mock_is_photo, temp_dir):
+        """Test faces are merged in listing order whatever order the results come back in."""
         albums = Albums.instance()
+        self._config(mock_config)
+        mock_is_photo.side_effect = lambda p: p.endswith(".jpg")
+        self._mock_pool(mock_pool, faces=True)
 
-        # Setup mocks
-        mock_config.instance.return_value.recursive_albums = False
-        mock_config.instance.return_value.parallel_tasks = 2
+        input_path = self._tree(temp_dir, "a/a1.jpg", "a/a2.jpg", "a/sub/s1.jpg", "b/b1.jpg")
 
-        mock_listdir.return_value = ["photo1.jpg"]
-        mock_join.side_effect = lambda *args: "/".join(args)
-        mock_basename.side_effect = lambda p: p.split("/")[-1] if "/" in p else p
-        mock_is_album.return_value = False
-        mock_is_photo.return_value = True
-        mock_find_slug.return_value = "photo-1"
-        mock_pick_thumb.return_value = "/path/to/thumb.jpg"
-
-        # Mock Pool to return a processed photo
-        mock_photo = Photo(
-            name="photo1.jpg",
-            width=1000,
-            height=800,
-            src="/path/to/photo.jpg",
-            thumb="/path/to/thumb.jpg",
-            slug="photo-1",
-            srcSet={},
-        )
-        mock_pool_instance = MagicMock()
-        mock_pool_instance.__enter__.return_value.map.return_value = [("/input/photo1.jpg", mock_photo)]
-        mock_pool.return_value = mock_pool_instance
+        albums.process_path(input_path, os.path.join(temp_dir, "output"), "/external", Mock())
 
-        mock_people.instance.return_value.detect_faces = Mock()
-        mock_people.instance.return_value.detect_faces.return_value = []
+        detect_faces = mock_people.instance.return_value.detect_faces
+        assert [c.args[4] for c in detect_faces.call_args_list] == [["a1.jpg"], ["a2.jpg"], ["s1.jpg"], ["b1.jpg"]]
+        assert detect_faces.call_args_list[0].args[2] == os.path.join(temp_dir, "output", "a")
 
-        # Mock Queue
-        from unittest.mock import MagicMock as MockQueue
+    @patch("fussel.generator.generate.is_supported_photo")
+    @patch("fussel.generator.generate.Config")
+    @patch("fussel.generator.generate.Pool")
+    @patch("fussel.generator.generate.IOPool")
+    def test_only_changed_sources_are_read_ahead(self, mock_iopool, mock_pool, mock_config, mock_is_photo, temp_dir):
+        """Test unchanged photos, which the workers do not decode, are not prefetched."""
+        albums = Albums.instance()
+        self._config(mock_config)
+        mock_is_photo.side_effect = lambda p: p.endswith(".jpg")
+        self._mock_pool(mock_pool)
 
-        with patch("fussel.generator.generate.Queue") as mock_queue_class:
-            mock_queue = MockQueue()
-            mock_queue.empty.return_value = True
-            mock_queue_class.return_value = mock_queue
+        input_path = os.path.join(temp_dir, "input", "album")
+        os.makedirs(input_path)
+        for name in ("new.jpg", "same.jpg"):
+            with open(os.path.join(input_path, name), "wb") as f:
+                f.write(b"photo" * 1000)
+        same = os.path.join(input_path, "same.jpg")
+        st = os.stat(same)
+        manifest = Manifest("/cache/manifest.json", {same: {"size": st.st_size, "mtime_ns": st.st_mtime_ns}})
 
-            mock_yaml_config = Mock()
+        albums.process_path(os.path.dirname(input_path), os.path.join(temp_dir, "output"), "/ext", Mock(), manifest)
 
-            albums.process_album_path(
-                album_dir="/input/album1",
-                album_name="Album 1",
-                output_albums_photos_path="/output",
-                external_root="/external",
-                yaml_config=mock_yaml_config,
+        prefetched = [c.args[0] for c in mock_iopool.return_value.prefetch.call_args_list]
+        assert prefetched == [os.path.join(input_path, "new.jpg")]
+
+    @patch("fussel.generator.generate.is_supported_photo")
+    @patch("fussel.generator.generate.Config")
+    @patch("fussel.generator.generate.Pool")
+    def test_duplicates_share_the_original_results(self, mock_pool, mock_config, mock_is_photo, temp_dir):
+        """Test a photo found in several albums is processed once."""
+        albums = Albums.instance()
+        self._config(mock_config)
+        mock_config.instance.return_value.duplicates_enabled = True
+        mock_config.instance.return_value.duplicates_verify = False
+        mock_is_photo.side_effect = lambda p: p.endswith(".jpg")
+        pool = self._mock_pool(mock_pool)
+        dispatched = []
+        imap = pool.imap_unordered.side_effect
+        pool.imap_unordered.side_effect = lambda fn, tasks: imap(fn, (dispatched.append(t) or t for t in tasks))
+
+        # Empty files, all with the same content
+        input_path = self._tree(temp_dir, "a/img.jpg", "b/copy.jpg")
+        manifest = Manifest("/cache/manifest.json")
+
+        albums.process_path(input_path, os.path.join(temp_dir, "output"), "/external", Mock(), manifest)
+
+        assert [job[2] for task in dispatched for job in task] == ["img.jpg"]
+        original, duplicate = albums.albums["a"].photos[0], albums.albums["b"].photos[0]
+        assert (duplicate.name, duplicate.slug) == ("copy.jpg", "copy-jpg")
+        assert duplicate.src == original.src == os.path.join(input_path, "a", "img.jpg")
+        assert manifest.seen == {os.path.join(input_path, "a", "img.jpg"), os.path.join(input_path, "b", "copy.jpg")}
+
+    @patch("fussel.generator.generate.is_supported_photo")
+    @patch("fussel.generator.generate.Config")
+    def test_discover_album_sends_listed_outputs(self, mock_config, mock_is_photo, temp_dir):
+        """Test jobs carry the recorded outputs found in the listing of the album folder."""
+        albums = Albums.instance()
+        self._config(mock_config, recursive=False)
+        mock_is_photo.side_effect = lambda p: p.endswith(".jpg")
+
+        input_path = self._tree(temp_dir, "album/a.jpg", "album/b.jpg")
+        album_folder = os.path.join(temp_dir, "output", "album")
+        os.makedirs(album_folder)
+        kept, lost = os.path.join(album_folder, "kept.jpg"), os.path.join(album_folder, "lost.jpg")
+        open(kept, "wb").close()
+        manifest = Manifest(
+            "/cache/manifest.json", {os.path.join(input_path, "album", "a.jpg"): {"outputs": {kept: "x", lost: "x"}}}
+        )
+        index = DirectoryIndex()
+
+        jobs = list(
+            albums.discover_album(
+                os.path.join(input_path, "album"), "album", os.path.dirname(album_folder), "/ext", [], manifest, index
             )
+        )
 
-            # Verify album was added
-            assert len(albums.albums) > 0 or mock_find_slug.called
+        assert [job[6] for job in jobs] == [frozenset({kept}), None]
+        # The sources are stat once while listing
+        assert [job[7].st_size for job in jobs] == [0, 0]
+        # The listing is dropped once the album is done
+        assert index.dirs == {}
+
+
+class TestInFlight:
+    """Tests for the in-flight window used to stream jobs."""
+
+    def test_feed_blocks_until_done(self):
+        """Test no more than the limit of tasks is handed out before results arrive."""
+        window = _InFlight(2)
+        feed = window.feed([("/external", "/photos/%d.jpg" % i)] for i in range(5))
+
+        taken = [next(feed)[0][1], next(feed)[0][1]]
+        blocked = threading.Thread(target=lambda: taken.append(next(feed)[0][1]))
+        blocked.start()
+        blocked.join(0.1)
+        assert taken == ["/photos/0.jpg", "/photos/1.jpg"]
+
+        assert window.done(["/photos/1.jpg"]) == [("/external", "/photos/1.jpg")]
+        blocked.join(1)
+        assert taken == ["/photos/0.jpg", "/photos/1.jpg", "/photos/2.jpg"]
+
+    def test_batch_takes_one_slot(self):
+        """Test a batch of jobs counts as a single task."""
+        window = _InFlight(1)
+        feed = window.feed([[("/external", "/photos/a.jpg"), ("/external", "/photos/b.jpg")]])
+
+        assert len(next(feed)) == 2
+        assert window.done(["/photos/b.jpg", "/photos/a.jpg"]) == [
+            ("/external", "/photos/b.jpg"),
+            ("/external", "/photos/a.jpg"),
+        ]
+
+    def test_close_releases_blocked_feed(self):
+        """Test closing the window lets a blocked producer finish."""
+        window = _InFlight(1)
+        feed = window.feed([("/external", "/photos/%d.jpg" % i)] for i in range(5))
+        next(feed)
+
+        rest = []
+        blocked = threading.Thread(target=lambda: rest.extend(feed))
+        blocked.start()
+        window.close()
+        blocked.join(1)
+        assert not blocked.is_alive()
+        assert rest == []
@@ -71,6 +71,9 @@ class TestConfigInitialization:
                 "gallery.overwrite": True,
                 "gallery.parallel_tasks": 4,
                 "gallery.exif_transpose": True,
+                "gallery.fast_decode": False,
+                "gallery.validation": "strict",
+                "gallery.manifest.content_hash": True,
                 "site.http_root": "/gallery/",
                 "site.title": "My Gallery",
             }.get(key, default)
@@ -90,6 +93,9 @@ class TestConfigInitialization:
         assert instance.overwrite is True
         assert instance.parallel_tasks == 4
         assert instance.exif_transpose is True
+        assert instance.fast_decode is False
+        assert instance.validation == "strict"
+        assert instance.manifest_content_hash is True
         assert instance.http_root == "/gallery/"
         assert instance.site_name == "My Gallery"
 
@@ -113,6 +119,18 @@ class TestConfigInitialization:
         assert instance.recursive_albums is True  # Default
         assert instance.overwrite is False  # Default
         assert instance.exif_transpose is False  # Default
+        assert instance.fast_decode is True  # Default
+        assert instance.validation == "on-decode"  # Default
+        assert instance.manifest_content_hash is False  # Default
+        assert instance.metadata_cache_enabled is True  # Default
+        assert instance.memory_budget == 2048 * 1024 * 1024  # Default
+        assert instance.worker_max_tasks == 500  # Default
+        assert instance.worker_trim_above == 1024 * 1024 * 1024  # Default
+        assert instance.io_threads == 4  # Default
+        assert instance.resize_quality == "balanced"  # Default
+        assert instance.preview is False  # Default
+        assert instance.cleanup_enabled is True  # Default
+        assert instance.cleanup_dry_run is False  # Default
         assert instance.http_root == "/"  # Default
 
     def test_type_conversions(self):
@@ -187,6 +205,37 @@ class TestConfigInitialization:
 
         assert instance.supported_extensions == (".jpg", ".jpeg", ".gif", ".png")
 
+    def test_validation_yaml_off(self):
+        """A bare YAML `off` (parsed as False) selects the off mode."""
+        mock_yaml_config = Mock()
+        mock_yaml_config.getKey = Mock(
+            side_effect=lambda key, default=None: {
+                "gallery.input_path": "/test/input",
+                "gallery.validation": False,
+            }.get(key, default)
+        )
+
+        Config.init(mock_yaml_config)
+
+        assert Config.instance().validation == "off"
+
+    def test_preview_uses_fastest_settings(self):
+        """The preview flag set by `fussel --preview` overrides quality settings."""
+        mock_yaml_config = Mock()
+        mock_yaml_config.getKey = Mock(
+            side_effect=lambda key, default=None: {
+                "gallery.input_path": "/test/input",
+                "gallery.fast_decode": False,
+                "gallery.resize_quality": "Best",
+                "gallery.preview": True,
+            }.get(key, default)
+        )
+
+        Config.init(mock_yaml_config)
+
+        assert Config.instance().fast_decode is True
+        assert Config.instance().resize_quality == "fast"
+
     def test_photo_sizes_default(self):
         """Test that photo_sizes defaults to DEFAULT_PHOTO_SIZES."""
         mock_yaml_config = Mock()
@@ -0,0 +1,82 @@
+"""
+Tests for fussel.generator.duplicates module.
+"""
+
+import os
+from unittest.mock import patch
+
+from fussel.generator.duplicates import QUICK_HASH_CHUNK, DuplicateFinder, quick_hash
+from fussel.generator.manifest import Manifest
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+class TestQuickHash:
+    """Tests for the size and both ends digest."""
+
+    def test_ends_and_size(self, temp_dir):
+        data = os.urandom(3 * QUICK_HASH_CHUNK)
+        a = _write(os.path.join(temp_dir, "a"), data)
+        same = _write(os.path.join(temp_dir, "same"), data)
+        middle = _write(os.path.join(temp_dir, "middle"), data[:QUICK_HASH_CHUNK] + b"x" + data[QUICK_HASH_CHUNK + 1 :])
+        tail = _write(os.path.join(temp_dir, "tail"), data[:-1] + b"x")
+
+        assert quick_hash(a, len(data)) == quick_hash(same, len(data))
+        # The middle of large files is not read, verify catches those
+        assert quick_hash(middle, len(data)) == quick_hash(a, len(data))
+        assert quick_hash(tail, len(data)) != quick_hash(a, len(data))
+
+    def test_small_file(self, temp_dir):
+        a = _write(os.path.join(temp_dir, "a"), b"abc")
+        b = _write(os.path.join(temp_dir, "b"), b"abd")
+
+        assert quick_hash(a, 3) != quick_hash(b, 3)
+
+
+class TestDuplicateFinder:
+    """Tests for recognising sources listed twice."""
+
+    def test_finds_first_copy(self, temp_dir):
+        a = _write(os.path.join(temp_dir, "a.jpg"), b"photo")
+        b = _write(os.path.join(temp_dir, "b.jpg"), b"other")
+        c = _write(os.path.join(temp_dir, "c.jpg"), b"photo")
+        finder = DuplicateFinder()
+
+        assert [finder.original_of(p, os.stat(p)) for p in (a, b, c)] == [None, None, a]
+
+    def test_only_same_sizes_are_hashed(self, temp_dir):
+        a = _write(os.path.join(temp_dir, "a.jpg"), b"photo")
+        b = _write(os.path.join(temp_dir, "b.jpg"), b"longer photo")
+        finder = DuplicateFinder()
+
+        with patch("fussel.generator.duplicates.quick_hash") as mock_hash:
+            finder.original_of(a, os.stat(a))
+            finder.original_of(b, os.stat(b))
+
+        mock_hash.assert_not_called()
+
+    def test_verify_compares_full_content(self, temp_dir):
+        data = os.urandom(3 * QUICK_HASH_CHUNK)
+        a = _write(os.path.join(temp_dir, "a.jpg"), data)
+        b = _write(os.path.join(temp_dir, "b.jpg"), data[:QUICK_HASH_CHUNK] + b"x" + data[QUICK_HASH_CHUNK + 1 :])
+        c = _write(os.path.join(temp_dir, "c.jpg"), data)
+        finder = DuplicateFinder(verify=True)
+
+        assert [finder.original_of(p, os.stat(p)) for p in (a, b, c)] == [None, None, a]
+
+    def test_verify_reuses_manifest_hash(self, temp_dir):
+        a = _write(os.path.join(temp_dir, "a.jpg"), b"photo")
+        c = _write(os.path.join(temp_dir, "c.jpg"), b"photo")
+        st = os.stat(a)
+        manifest = Manifest("/cache/manifest.json", {a: {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": "h"}})
+        finder = DuplicateFinder(verify=True, manifest=manifest)
+
+        with patch("fussel.generator.duplicates.file_hash", return_value="h") as mock_hash:
+            finder.original_of(a, st)
+            assert finder.original_of(c, os.stat(c)) == a
+
+        mock_hash.assert_called_once_with(c)
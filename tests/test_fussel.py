@@ -161,7 +161,7 @@ class TestMain:
         mock_shutil.which.return_value = "/usr/bin/yarn"
 
         # Run main
-        main()
+        main([])
 
         # Verify SiteGenerator was created and generate called
         mock_site_generator_class.assert_called_once()
@@ -190,7 +190,7 @@ class TestMain:
         mock_shutil.which.return_value = None  # yarn not found
 
         with pytest.raises(SystemExit):
-            main()
+            main([])
 
     @patch("fussel.fussel.SiteGenerator")
     @patch("fussel.fussel.shutil")
@@ -216,4 +216,22 @@ class TestMain:
         mock_shutil.which.return_value = "/usr/bin/yarn"
 
         with pytest.raises(SystemExit):
-            main()
+            main([])
+
+    @patch("fussel.fussel.SiteGenerator")
+    @patch("fussel.fussel.shutil")
+    @patch("fussel.fussel.os")
+    @patch("fussel.fussel.YamlConfig")
+    def test_main_preview(self, mock_yaml_config_class, mock_os, mock_shutil, mock_site_generator_class):
+        """Test --preview generates with the preview flag and skips the site build."""
+        mock_config = Mock()
+        mock_config.cfg = {}
+        mock_yaml_config_class.return_value = mock_config
+
+        main(["--preview"])
+
+        assert mock_config.cfg["gallery.preview"] is True
+        mock_site_generator_class.assert_called_once_with(mock_config)
+        mock_site_generator_class.return_value.generate.assert_called_once()
+        mock_os.system.assert_not_called()
+        mock_shutil.copytree.assert_not_called()
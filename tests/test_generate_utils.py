@@ -105,6 +105,7 @@ class TestAlbum:
     # These are tested indirectly through Albums.process_album_path() which uses them.
 
 
+@pytest.mark.usefixtures("mock_atomic_write")
 class TestPhoto:
     """Tests for Photo class."""
 
@@ -113,17 +114,20 @@ class TestPhoto:
 
     @patch("fussel.generator.generate.Config")
     @patch("fussel.generator.generate.Image")
-    @patch("fussel.generator.generate.shutil")
+    @patch("fussel.generator.generate.link_file")
     @patch("fussel.generator.generate.os.path.exists")
     @patch("fussel.generator.generate.calculate_new_size")
     @patch("fussel.generator.generate.extract_extension")
-    @patch("fussel.generator.generate.apply_watermark")
+    @patch("fussel.generator.generate.load_watermark")
     def test_process_photo_success(
-        self, mock_watermark, mock_extract, mock_calc_size, mock_exists, mock_shutil, mock_image, mock_config
+        self, mock_watermark, mock_extract, mock_calc_size, mock_exists, mock_link_file, mock_image, mock_config
     ):
         """Test successful photo processing."""
         # Setup mocks
         mock_config.instance.return_value.overwrite = False
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
         mock_config.instance.return_value.watermark_enabled = False
         mock_config.instance.return_value.people_enabled = False
         mock_config.instance.return_value.exif_transpose = False
@@ -144,21 +148,14 @@ class TestPhoto:
         mock_image.open.return_value.__enter__.return_value = mock_img
         mock_image.open.return_value.__exit__.return_value = None
 
-        # Mock shutil
-        mock_shutil.copyfile.return_value = None
-
         # Test
-        from multiprocessing import Queue
-
-        people_q = Queue()
 
-        result = Photo.process_photo(
+        result, _, _ = Photo.process_photo(
             external_path="/external",
             photo="/path/to/photo.jpg",
             filename="photo.jpg",
             slug="photo",
             output_path="/output",
-            people_q=people_q,
         )
 
         assert result is not None
@@ -172,6 +169,10 @@ class TestPhoto:
     def test_process_photo_verification_failure(self, mock_image, mock_config):
         """Test photo processing with verification failure."""
         mock_config.instance.return_value.overwrite = False
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
+        mock_config.instance.return_value.validation = "strict"
 
         # Mock Image to raise exception on verify
         mock_img = MagicMock()
@@ -180,12 +181,8 @@ class TestPhoto:
         mock_image.open.return_value.__enter__.return_value = mock_img
         mock_image.open.return_value.__exit__.return_value = None
 
-        from multiprocessing import Queue
-
         from fussel.generator.generate import PhotoProcessingFailure
 
-        people_q = Queue()
-
         with pytest.raises(PhotoProcessingFailure, match="Image Verification"):
             Photo.process_photo(
                 external_path="/external",
@@ -193,17 +190,16 @@ class TestPhoto:
                 filename="bad_photo.jpg",
                 slug="bad-photo",
                 output_path="/output",
-                people_q=people_q,
             )
 
     @patch("fussel.generator.generate.Config")
     @patch("fussel.generator.generate.Image")
-    @patch("fussel.generator.generate.shutil")
+    @patch("fussel.generator.generate.link_file")
     @patch("fussel.generator.generate.os.path.exists")
     @patch("fussel.generator.generate.calculate_new_size")
     @patch("fussel.generator.generate.extract_extension")
-    @patch("fussel.generator.generate.apply_watermark")
-    @patch("fussel.generator.generate.ImageOps")
+    @patch("fussel.generator.generate.load_watermark")
+    @patch("fussel.generator.util.ImageOps")
     def test_process_photo_with_watermark_and_exif(
         self,
         mock_imageops,
@@ -211,12 +207,15 @@ class TestPhoto:
         mock_extract,
         mock_calc_size,
         mock_exists,
-        mock_shutil,
+        mock_link_file,
         mock_image,
         mock_config,
     ):
         """Test photo processing with watermark enabled and exif_transpose."""
         mock_config.instance.return_value.overwrite = False
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
         mock_config.instance.return_value.watermark_enabled = True
         mock_config.instance.return_value.watermark_path = "/path/watermark.png"
         mock_config.instance.return_value.people_enabled = False
@@ -235,65 +234,42 @@ class TestPhoto:
         mock_img.save.return_value = None
         mock_imageops.exif_transpose.return_value = mock_img
 
-        mock_watermark_img = MagicMock()
-        mock_watermark_img.size = (100, 50)
-
         # Image.open is called for:
-        # EXIF date extraction (3x original photo): method1 getexif, method2 _getexif, method3 XMP
-        # EXIF metadata extraction (1x original photo): _extract_exif
-        # Verification (2x original photo): verify, transpose
-        # Processing (1x new_original_photo): get size
-        # Thumbnails (4x new_original_photo): 500x500, 800x800, 1024x1024, 1600x1600
-        # Watermark (1x watermark_path)
-        # Total: 12 calls
+        # Size (1x new_original_photo): the probe cannot read the mocked path
+        # Processing (1x new_original_photo): decode once for every thumbnail
+        # Total: 2 calls (metadata is read by the probe module, validation happens on decode,
+        # the watermark is loaded by load_watermark)
         def cm(img):
             return MagicMock(__enter__=Mock(return_value=img), __exit__=Mock())
 
         mock_image.open.side_effect = [
-            cm(mock_img),  # method 1: getexif()
-            cm(mock_img),  # method 2: _getexif()
-            cm(mock_img),  # method 3: XMP applist
-            cm(mock_img),  # _extract_exif
-            cm(mock_img),  # verify
-            cm(mock_img),  # transpose
             cm(mock_img),  # get size
-            cm(mock_img),  # thumbnail 500x500
-            cm(mock_img),  # thumbnail 800x800
-            cm(mock_img),  # thumbnail 1024x1024
-            cm(mock_img),  # thumbnail 1600x1600
-            cm(mock_watermark_img),  # watermark
+            cm(mock_img),  # all thumbnails
         ]
 
-        mock_shutil.copyfile.return_value = None
-
-        from multiprocessing import Queue
-
-        people_q = Queue()
-
-        result = Photo.process_photo(
+        result, _, _ = Photo.process_photo(
             external_path="/external",
             photo="/path/to/photo.jpg",
             filename="photo.jpg",
             slug="photo",
             output_path="/output",
-            people_q=people_q,
         )
 
         assert result is not None
         # Verify watermark was applied
-        mock_watermark.assert_called_once()
+        mock_watermark.return_value.apply.assert_called_once()
         # Verify exif_transpose was called
         mock_imageops.exif_transpose.assert_called()
 
     @patch("fussel.generator.generate.Config")
     @patch("fussel.generator.generate.Image")
-    @patch("fussel.generator.generate.shutil")
+    @patch("fussel.generator.generate.link_file")
     @patch("fussel.generator.generate.os.path.exists")
     @patch("fussel.generator.generate.calculate_new_size")
     @patch("fussel.generator.generate.extract_extension")
-    @patch("fussel.generator.generate.apply_watermark")
+    @patch("fussel.generator.generate.load_watermark")
     def test_watermark_applied_to_new_photo_when_overwrite_false(
-        self, mock_watermark, mock_extract, mock_calc_size, mock_exists, mock_shutil, mock_image, mock_config
+        self, mock_watermark, mock_extract, mock_calc_size, mock_exists, mock_link_file, mock_image, mock_config
     ):
         """Watermark must be applied to new photos even when overwrite=False.
 
@@ -303,6 +279,9 @@ class TestPhoto:
         a brand-new photo the watermark was silently skipped.
         """
         mock_config.instance.return_value.overwrite = False
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
         mock_config.instance.return_value.watermark_enabled = True
         mock_config.instance.return_value.watermark_path = "/path/watermark.png"
         mock_config.instance.return_value.people_enabled = False
@@ -329,52 +308,41 @@ class TestPhoto:
         mock_img.thumbnail.return_value = None
         mock_img.save.return_value = None
 
-        mock_watermark_img = MagicMock()
-        mock_watermark_img.size = (100, 50)
-
         def cm(img):
             return MagicMock(__enter__=Mock(return_value=img), __exit__=Mock())
 
         mock_image.open.side_effect = [
-            cm(mock_img),  # method 1: getexif
-            cm(mock_img),  # method 2: _getexif
-            cm(mock_img),  # method 3: XMP
-            cm(mock_img),  # _extract_exif
-            cm(mock_img),  # verify
-            cm(mock_img),  # transpose
             cm(mock_img),  # get size from new_original_photo
             cm(mock_img),  # thumbnail 500x500
-            cm(mock_watermark_img),  # watermark
         ]
-        mock_shutil.copyfile.return_value = None
-
-        from multiprocessing import Queue
-
-        people_q = Queue()
-
-        result = Photo.process_photo(
+        result, _, _ = Photo.process_photo(
             external_path="/external",
             photo="/path/to/photo.jpg",
             filename="photo.jpg",
             slug="photo",
             output_path="/output",
-            people_q=people_q,
         )
 
         assert result is not None
-        mock_watermark.assert_called_once(), "Watermark must be applied to new photos even when overwrite=False"
+        (
+            mock_watermark.return_value.apply.assert_called_once(),
+            "Watermark must be applied to new photos even when overwrite=False",
+        )
 
     @patch("fussel.generator.generate.Config")
     @patch("fussel.generator.generate.Image")
-    @patch("fussel.generator.generate.shutil")
+    @patch("fussel.generator.generate.link_file")
     @patch("fussel.generator.generate.os.path.exists")
     @patch("fussel.generator.generate.calculate_new_size")
     @patch("fussel.generator.generate.extract_extension")
     def test_process_photo_overwrite_mode(
-        self, mock_extract, mock_calc_size, mock_exists, mock_shutil, mock_image, mock_config
+        self, mock_extract, mock_calc_size, mock_exists, mock_link_file, mock_image, mock_config
     ):
         """Test photo processing in overwrite mode."""
         mock_config.instance.return_value.overwrite = True
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
         mock_config.instance.return_value.watermark_enabled = False
         mock_config.instance.return_value.people_enabled = False
         mock_config.instance.return_value.exif_transpose = False
@@ -394,24 +362,92 @@ class TestPhoto:
         mock_image.open.return_value.__enter__.return_value = mock_img
         mock_image.open.return_value.__exit__.return_value = None
 
-        mock_shutil.copyfile.return_value = None
-
-        from multiprocessing import Queue
-
-        people_q = Queue()
-
-        result = Photo.process_photo(
+        result, _, _ = Photo.process_photo(
             external_path="/external",
             photo="/path/to/photo.jpg",
             filename="photo.jpg",
             slug="photo",
             output_path="/output",
-            people_q=people_q,
         )
 
         assert result is not None
-        # Verify copyfile was called even though file exists (overwrite=True)
-        assert mock_shutil.copyfile.called
+        # Verify the original was copied even though it exists (overwrite=True)
+        assert mock_link_file.called
+
+    @patch("fussel.generator.generate.Config")
+    @patch("fussel.generator.generate.Image")
+    @patch("fussel.generator.generate.link_file")
+    @patch("fussel.generator.generate.os.path.exists")
+    @patch("fussel.generator.generate.os.remove")
+    @patch("fussel.generator.generate.calculate_new_size")
+    @patch("fussel.generator.generate.extract_extension")
+    def test_broken_image_detected_on_decode(
+        self, mock_extract, mock_calc_size, mock_remove, mock_exists, mock_link_file, mock_image, mock_config
+    ):
+        """In on-decode mode a decode error fails the photo without a separate verify pass."""
+        mock_config.instance.return_value.overwrite = False
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
+        mock_config.instance.return_value.validation = "on-decode"
+        mock_config.instance.return_value.photo_sizes = [(500, 500)]
+
+        mock_extract.return_value = ".jpg"
+        mock_calc_size.return_value = (500, 375)
+        mock_exists.side_effect = lambda path: "original_" in path
+
+        mock_img = MagicMock()
+        mock_img.size = (2000, 1500)
+        mock_img.thumbnail.side_effect = OSError("broken data stream when reading image file")
+        mock_image.open.return_value.__enter__.return_value = mock_img
+
+        with pytest.raises(PhotoProcessingFailure, match="Image Verification"):
+            Photo.process_photo(
+                external_path="/external",
+                photo="/path/to/photo.jpg",
+                filename="photo.jpg",
+                slug="photo",
+                output_path="/output",
+            )
+
+        mock_img.verify.assert_not_called()
+        mock_remove.assert_called_once_with("/output/original_photo.jpg")
+        mock_img.save.assert_not_called()
+
+    @patch("fussel.generator.generate.Config")
+    @patch("fussel.generator.generate.Image")
+    @patch("fussel.generator.generate.link_file")
+    @patch("fussel.generator.generate.os.path.exists")
+    @patch("fussel.generator.generate.calculate_new_size")
+    @patch("fussel.generator.generate.extract_extension")
+    def test_validation_off_propagates_decode_errors(
+        self, mock_extract, mock_calc_size, mock_exists, mock_link_file, mock_image, mock_config
+    ):
+        """With validation off, decode errors are not turned into skipped photos."""
+        mock_config.instance.return_value.overwrite = False
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
+        mock_config.instance.return_value.validation = "off"
+        mock_config.instance.return_value.photo_sizes = [(500, 500)]
+
+        mock_extract.return_value = ".jpg"
+        mock_calc_size.return_value = (500, 375)
+        mock_exists.return_value = False
+
+        mock_img = MagicMock()
+        mock_img.size = (2000, 1500)
+        mock_img.thumbnail.side_effect = OSError("broken data stream when reading image file")
+        mock_image.open.return_value.__enter__.return_value = mock_img
+
+        with pytest.raises(OSError):
+            Photo.process_photo(
+                external_path="/external",
+                photo="/path/to/photo.jpg",
+                filename="photo.jpg",
+                slug="photo",
+                output_path="/output",
+            )
 
 
 class TestPhotoProcessingFailure:
@@ -430,52 +466,40 @@ class TestPhotoProcessingFailure:
         assert exception.message == "Failed to process photo"
 
 
+@pytest.mark.usefixtures("mock_atomic_write")
 class TestPhotoUnidentifiedImageError:
     """Tests for the UnidentifiedImageError cleanup path in process_photo."""
 
     @patch("fussel.generator.generate.Config")
     @patch("fussel.generator.generate.Image")
-    @patch("fussel.generator.generate.shutil")
+    @patch("fussel.generator.generate.link_file")
     @patch("fussel.generator.generate.os.path.exists")
     @patch("fussel.generator.generate.os.remove")
     @patch("fussel.generator.generate.extract_extension")
     def test_unidentified_image_removes_file_when_exists(
-        self, mock_extract, mock_remove, mock_exists, mock_shutil, mock_image, mock_config
+        self, mock_extract, mock_remove, mock_exists, mock_link_file, mock_image, mock_config
     ):
         """When Image.open raises UnidentifiedImageError on the copy,
         the copied file is removed and PhotoProcessingFailure is raised."""
         from PIL.Image import UnidentifiedImageError
 
         mock_config.instance.return_value.overwrite = False
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
         mock_extract.return_value = ".jpg"
 
-        mock_img = MagicMock()
-        mock_img.verify.return_value = None
-        mock_img.transpose.return_value = mock_img
-
         bad_cm = MagicMock()
         bad_cm.__enter__ = Mock(side_effect=UnidentifiedImageError("bad image"))
         bad_cm.__exit__ = Mock(return_value=False)
 
-        good_cm = MagicMock(__enter__=Mock(return_value=mock_img), __exit__=Mock())
-
-        # First 3 calls are EXIF date methods, then _extract_exif, then verify, then
-        # transpose, then the copy open raises UnidentifiedImageError.
+        # Metadata is read by the probe module and validation happens on decode,
+        # so the first call is the copy open, which raises UnidentifiedImageError.
         mock_image.open.side_effect = [
-            good_cm,  # method 1 getexif
-            good_cm,  # method 2 _getexif
-            good_cm,  # method 3 XMP
-            good_cm,  # _extract_exif
-            good_cm,  # verify
-            good_cm,  # transpose
             bad_cm,  # open new_original_photo -> UnidentifiedImageError
         ]
         mock_exists.return_value = True  # file exists at cleanup time
 
-        from multiprocessing import Queue
-
-        people_q = Queue()
-
         with pytest.raises(PhotoProcessingFailure):
             Photo.process_photo(
                 external_path="/external",
@@ -483,52 +507,38 @@ class TestPhotoUnidentifiedImageError:
                 filename="photo.jpg",
                 slug="photo",
                 output_path="/output",
-                people_q=people_q,
             )
 
         mock_remove.assert_called_once()
 
     @patch("fussel.generator.generate.Config")
     @patch("fussel.generator.generate.Image")
-    @patch("fussel.generator.generate.shutil")
+    @patch("fussel.generator.generate.link_file")
     @patch("fussel.generator.generate.os.path.exists")
     @patch("fussel.generator.generate.os.remove")
     @patch("fussel.generator.generate.extract_extension")
     def test_unidentified_image_skips_remove_when_not_exists(
-        self, mock_extract, mock_remove, mock_exists, mock_shutil, mock_image, mock_config
+        self, mock_extract, mock_remove, mock_exists, mock_link_file, mock_image, mock_config
     ):
         """When Image.open raises UnidentifiedImageError but the file was
         never written, os.remove is NOT called."""
         from PIL.Image import UnidentifiedImageError
 
         mock_config.instance.return_value.overwrite = False
+        mock_config.instance.return_value.originals_link = "copy"
+        mock_config.instance.return_value.content_addressed = False
+        mock_config.instance.return_value.output_sharding = False
         mock_extract.return_value = ".jpg"
 
-        mock_img = MagicMock()
-        mock_img.verify.return_value = None
-        mock_img.transpose.return_value = mock_img
-
         bad_cm = MagicMock()
         bad_cm.__enter__ = Mock(side_effect=UnidentifiedImageError("bad image"))
         bad_cm.__exit__ = Mock(return_value=False)
 
-        good_cm = MagicMock(__enter__=Mock(return_value=mock_img), __exit__=Mock())
-
         mock_image.open.side_effect = [
-            good_cm,
-            good_cm,
-            good_cm,  # EXIF date methods
-            good_cm,  # _extract_exif
-            good_cm,
-            good_cm,  # verify + transpose
             bad_cm,  # open copy -> UnidentifiedImageError
         ]
         mock_exists.return_value = False  # file was never written
 
-        from multiprocessing import Queue
-
-        people_q = Queue()
-
         with pytest.raises(PhotoProcessingFailure):
             Photo.process_photo(
                 external_path="/external",
@@ -536,7 +546,6 @@ class TestPhotoUnidentifiedImageError:
                 filename="photo.jpg",
                 slug="photo",
                 output_path="/output",
-                people_q=people_q,
             )
 
         mock_remove.assert_not_called()
@@ -0,0 +1,79 @@
+"""
+Tests for fussel.generator.iopool module.
+"""
+
+import os
+import threading
+from unittest.mock import Mock, patch
+
+import pytest
+from PIL import Image
+
+from fussel.generator.iopool import PREFETCH_AHEAD, IOPool, prefetch
+
+
+class TestIOPool:
+    """Tests for the I/O thread pool."""
+
+    @pytest.mark.parametrize("threads", [0, 2])
+    def test_copy_and_save(self, temp_dir, threads):
+        src = os.path.join(temp_dir, "src.jpg")
+        Image.new("RGB", (40, 30), color="red").save(src)
+        pool = IOPool(threads)
+
+        pool.copy(src, os.path.join(temp_dir, "copy.jpg"))
+        pool.save(Image.new("RGB", (20, 15), color="blue"), os.path.join(temp_dir, "small.png"))
+        pool.wait()
+        pool.shutdown()
+
+        with open(src, "rb") as a, open(os.path.join(temp_dir, "copy.jpg"), "rb") as b:
+            assert a.read() == b.read()
+        with Image.open(os.path.join(temp_dir, "small.png")) as im:
+            assert im.format == "PNG"
+            assert im.size == (20, 15)
+
+    @pytest.mark.parametrize("threads", [0, 2])
+    def test_wait_raises_first_error(self, temp_dir, threads):
+        pool = IOPool(threads)
+        pool.copy(os.path.join(temp_dir, "missing.jpg"), os.path.join(temp_dir, "copy.jpg"))
+
+        with pytest.raises(FileNotFoundError):
+            pool.wait()
+        # Errors are only reported once
+        pool.wait()
+        pool.shutdown()
+
+    def test_discard_leaves_other_operations(self, temp_dir):
+        release = threading.Event()
+        pool = IOPool(2)
+        other = pool.submit(release.wait)
+        failed = pool.copy(os.path.join(temp_dir, "missing.jpg"), os.path.join(temp_dir, "copy.jpg"))
+
+        pool.discard([failed])
+
+        assert pool.pending == [other]
+        assert not other.done()
+        release.set()
+        pool.wait()
+        pool.shutdown()
+
+    def test_prefetch_is_bounded(self, temp_dir):
+        release = threading.Event()
+        pool = IOPool(2)
+        pool.executor.submit = Mock(wraps=pool.executor.submit)
+
+        with patch("fussel.generator.iopool.prefetch", side_effect=lambda path: release.wait()):
+            for i in range(PREFETCH_AHEAD + 5):
+                pool.prefetch(os.path.join(temp_dir, "%d.jpg" % i))
+            assert pool.executor.submit.call_count == PREFETCH_AHEAD
+            release.set()
+            pool.executor.shutdown(wait=True)
+
+        # Finished read-ahead frees its slot
+        assert pool.prefetch_slots.acquire(blocking=False)
+
+    def test_prefetch_ignores_missing_files(self, temp_dir):
+        prefetch(os.path.join(temp_dir, "missing.jpg"))
+        pool = IOPool(1)
+        pool.prefetch(os.path.join(temp_dir, "missing.jpg"))
+        pool.shutdown()
@@ -0,0 +1,165 @@
+"""
+Tests for fussel.generator.manifest module.
+"""
+
+import os
+
+from fussel.generator.manifest import (
+    JOURNAL_SUFFIX,
+    Manifest,
+    fingerprint,
+    is_fresh,
+    source_record,
+    watermark_fingerprint,
+)
+
+
+def _touch(path, content=b"data"):
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+class TestManifest:
+    """Tests for Manifest persistence."""
+
+    def test_save_and_load_roundtrip(self, temp_dir):
+        path = os.path.join(temp_dir, "cache", "manifest.json")
+        manifest = Manifest(path)
+        manifest.update("/photos/a.jpg", {"size": 1, "mtime_ns": 2, "hash": None, "outputs": {}})
+        manifest.save()
+
+        loaded = Manifest.load(path)
+        assert loaded.get("/photos/a.jpg") == {"size": 1, "mtime_ns": 2, "hash": None, "outputs": {}}
+        assert not os.path.exists(path + ".tmp")
+
+    def test_load_missing_or_corrupt(self, temp_dir):
+        path = os.path.join(temp_dir, "manifest.json")
+        assert Manifest.load(path).records == {}
+
+        _touch(path, b"{not json")
+        assert Manifest.load(path).records == {}
+
+    def test_load_other_version(self, temp_dir):
+        path = os.path.join(temp_dir, "manifest.json")
+        _touch(path, b'{"version": 0, "sources": {"/a.jpg": {}}}')
+        assert Manifest.load(path).records == {}
+
+    def test_journal_resumes_interrupted_build(self, temp_dir):
+        path = os.path.join(temp_dir, "cache", "manifest.json")
+        Manifest(path, {"/a.jpg": {"outputs": {}}, "/b.jpg": {"outputs": {}}}).save()
+
+        manifest = Manifest.load(path)
+        manifest.open_journal()
+        manifest.update("/b.jpg", {"outputs": {"/b_500.jpg": "x"}})
+        manifest.update("/a.jpg", None)
+        manifest.journal.close()
+        # Killed while journaling the next photo
+        with open(path + JOURNAL_SUFFIX, "a") as f:
+            f.write('[2, "/c.jpg", {"outp')
+
+        resumed = Manifest.load(path)
+        assert resumed.records == {"/b.jpg": {"outputs": {"/b_500.jpg": "x"}}}
+
+        # Interrupted again, the records of both builds are kept
+        resumed.open_journal()
+        resumed.update("/c.jpg", {"outputs": {}})
+        resumed.update("/d.jpg", {"outputs": {}})
+        resumed.journal.close()
+        with open(path + JOURNAL_SUFFIX, "a") as f:
+            f.write('[2, "/e.jpg", {"outp')
+
+        resumed = Manifest.load(path)
+        assert sorted(resumed.records) == ["/b.jpg", "/c.jpg", "/d.jpg"]
+
+        resumed.save()
+        assert not os.path.exists(path + JOURNAL_SUFFIX)
+        assert Manifest.load(path).records == resumed.records
+
+    def test_prune_forgets_unseen_and_failed_sources(self):
+        manifest = Manifest("/unused", {"/a.jpg": {}, "/b.jpg": {}, "/c.jpg": {}})
+        manifest.update("/a.jpg", {"outputs": {}})
+        manifest.update("/b.jpg", None)  # failed this build
+        manifest.prune()
+        assert manifest.records == {"/a.jpg": {"outputs": {}}}
+
+    def test_expected_outputs_only_covers_this_build(self):
+        manifest = Manifest(
+            "/unused",
+            {
+                "/a.jpg": {"outputs": {"/out/original_a.jpg": "x"}},
+                "/old.jpg": {"outputs": {"/out/original_old.jpg": "x"}},
+            },
+        )
+        manifest.update("/b.jpg", {"outputs": {"/out/original_b.jpg": "x", "/out/500x375_b.jpg": "y"}})
+        manifest.update("/a.jpg", manifest.get("/a.jpg"))
+        assert manifest.expected_outputs() == {"/out/original_a.jpg", "/out/original_b.jpg", "/out/500x375_b.jpg"}
+
+
+class TestSourceRecord:
+    """Tests for source change detection."""
+
+    def test_first_build_trusts_existing_outputs(self, temp_dir):
+        photo = _touch(os.path.join(temp_dir, "a.jpg"))
+        record, changed = source_record(photo)
+        assert changed is False
+        assert record["size"] == 4
+        assert record["hash"] is None
+
+    def test_unchanged_stat(self, temp_dir):
+        photo = _touch(os.path.join(temp_dir, "a.jpg"))
+        previous, _ = source_record(photo)
+        _, changed = source_record(photo, previous)
+        assert changed is False
+
+    def test_modified_source(self, temp_dir):
+        photo = _touch(os.path.join(temp_dir, "a.jpg"))
+        previous, _ = source_record(photo)
+        _touch(photo, b"other content")
+        _, changed = source_record(photo, previous)
+        assert changed is True
+
+    def test_content_hash_ignores_touched_files(self, temp_dir):
+        photo = _touch(os.path.join(temp_dir, "a.jpg"))
+        previous, _ = source_record(photo, content_hash=True)
+        os.utime(photo, ns=(0, 0))
+
+        _, changed = source_record(photo, previous, content_hash=True)
+        assert changed is False
+
+        _, changed = source_record(photo, previous, content_hash=False)
+        assert changed is True
+
+
+class TestIsFresh:
+    """Tests for derivative reuse decisions."""
+
+    def test_is_fresh(self, temp_dir):
+        output = _touch(os.path.join(temp_dir, "500x375_a.jpg"))
+        previous = {"outputs": {output: {"size": [500, 500]}}}
+
+        assert is_fresh(output, {"size": [500, 500]}, previous, False) is True
+        assert is_fresh(output, {"size": [500, 500]}, None, False) is True
+        assert is_fresh(output, {"size": [500, 500]}, previous, True) is False
+        assert is_fresh(output, {"size": [800, 800]}, previous, False) is False
+        assert is_fresh(os.path.join(temp_dir, "missing.jpg"), {}, None, False) is False
+
+
+class TestFingerprint:
+    """Tests for settings fingerprints."""
+
+    def test_fingerprint_is_stable(self):
+        assert fingerprint({"size": [500, 500], "fast_decode": True}) == fingerprint(
+            {"fast_decode": True, "size": [500, 500]}
+        )
+        assert fingerprint({"size": [500, 500]}) != fingerprint({"size": [800, 800]})
+
+    def test_watermark_fingerprint_tracks_file_content(self, temp_dir):
+        watermark = _touch(os.path.join(temp_dir, "watermark.png"), b"one")
+        first = watermark_fingerprint(watermark, 0.15)
+
+        _touch(watermark, b"two")
+        watermark_fingerprint.cache_clear()
+        assert watermark_fingerprint(watermark, 0.15) != first
+        assert watermark_fingerprint(watermark, 0.2) != watermark_fingerprint(watermark, 0.15)
+        assert watermark_fingerprint(os.path.join(temp_dir, "missing.png"), 0.15)["hash"] is None
@@ -0,0 +1,69 @@
+"""
+Tests for fussel.generator.memory module.
+"""
+
+import threading
+import time
+
+from fussel.generator.memory import MemoryBudget, estimate_decode_bytes, resident_bytes, trim_memory
+
+
+class TestEstimateDecodeBytes:
+    """Tests for estimate_decode_bytes function."""
+
+    def test_full_decode(self):
+        assert estimate_decode_bytes(4000, 3000, "PNG", (1600, 1200)) == 4000 * 3000 * 5
+
+    def test_jpeg_draft_scale(self):
+        # 8000x6000 can be drafted down to 2000x1500 and still cover 1600x1200
+        assert estimate_decode_bytes(8000, 6000, "JPEG", (1600, 1200)) == 2000 * 1500 * 5
+
+    def test_jpeg_draft_scale_is_capped(self):
+        assert estimate_decode_bytes(16000, 16000, "JPEG", (100, 100)) == 2000 * 2000 * 5
+
+    def test_strict_decode_is_not_scaled(self):
+        assert estimate_decode_bytes(8000, 6000, "JPEG", (1600, 1200), fast_decode=False) == 8000 * 6000 * 5
+
+
+class TestMemoryBudget:
+    """Tests for MemoryBudget admission."""
+
+    def test_waits_for_memory(self):
+        budget = MemoryBudget(100)
+        admitted = []
+
+        def second():
+            with budget.reserve(60):
+                admitted.append(time.monotonic())
+
+        with budget.reserve(60):
+            waiting = threading.Thread(target=second)
+            waiting.start()
+            waiting.join(0.1)
+            assert admitted == []
+            assert budget.used.value == 60
+
+        waiting.join(1)
+        assert len(admitted) == 1
+        assert budget.used.value == 0
+
+    def test_small_jobs_share_budget(self):
+        budget = MemoryBudget(100)
+        with budget.reserve(40), budget.reserve(40):
+            assert budget.used.value == 80
+
+    def test_oversized_job_is_admitted_alone(self):
+        budget = MemoryBudget(100)
+        with budget.reserve(1000) as amount:
+            assert amount == 100
+        assert budget.used.value == 0
+
+
+class TestProcessMemory:
+    """Tests for the worker memory helpers."""
+
+    def test_resident_bytes(self):
+        assert resident_bytes() >= 0
+
+    def test_trim_memory_does_not_fail(self):
+        trim_memory()
@@ -0,0 +1,115 @@
+"""
+Tests for fussel.generator.metadata_cache module.
+"""
+
+import os
+import pickle
+import threading
+from multiprocessing import Pool
+from unittest.mock import patch
+
+from PIL import Image
+
+from fussel.generator.generate import Photo
+from fussel.generator.metadata_cache import MetadataCache
+
+
+def _put_many(args):
+    cache, start = args
+    for i in range(start, start + 20):
+        cache.put("/photos/%d.jpg" % i, i, i, {"width": i})
+    return os.getpid()
+
+
+class TestMetadataCache:
+    """Tests for MetadataCache storage."""
+
+    def test_roundtrip(self, temp_dir):
+        cache = MetadataCache(os.path.join(temp_dir, "cache", "metadata.sqlite"))
+        cache.put("/photos/a.jpg", 10, 20, {"width": 4, "faces": [["Jane", "0.1", "0.2", "0.3", "0.4"]]})
+
+        assert cache.get("/photos/a.jpg", 10, 20) == {"width": 4, "faces": [["Jane", "0.1", "0.2", "0.3", "0.4"]]}
+        assert cache.get("/photos/b.jpg", 10, 20) is None
+        cache.close()
+
+    def test_stale_entries_are_ignored(self, temp_dir):
+        cache = MetadataCache(os.path.join(temp_dir, "metadata.sqlite"))
+        cache.put("/photos/a.jpg", 10, 20, {"width": 4})
+
+        assert cache.get("/photos/a.jpg", 11, 20) is None
+        assert cache.get("/photos/a.jpg", 10, 21) is None
+
+    def test_pickles_without_connection(self, temp_dir):
+        cache = MetadataCache(os.path.join(temp_dir, "metadata.sqlite"))
+        cache.put("/photos/a.jpg", 10, 20, {"width": 4})
+
+        copy = pickle.loads(pickle.dumps(cache))
+        assert copy.path == cache.path
+        assert copy.get("/photos/a.jpg", 10, 20) == {"width": 4}
+
+    def test_concurrent_writers(self, temp_dir):
+        cache = MetadataCache(os.path.join(temp_dir, "metadata.sqlite"))
+        cache.get("/photos/none.jpg", 0, 0)  # connection opened in the parent before forking
+
+        with Pool(processes=3) as P:
+            P.map(_put_many, [(cache, start) for start in (0, 20, 40)])
+
+        assert all(cache.get("/photos/%d.jpg" % i, i, i) == {"width": i} for i in range(60))
+
+    def test_shared_between_threads(self, temp_dir):
+        cache = MetadataCache(os.path.join(temp_dir, "metadata.sqlite"))
+        cache.put("/photos/a.jpg", 10, 20, {"width": 4})
+        results = []
+
+        # The pool's task handler thread reads the connection opened by the main thread
+        reader = threading.Thread(target=lambda: results.append(cache.get("/photos/a.jpg", 10, 20)))
+        reader.start()
+        reader.join()
+
+        assert results == [{"width": 4}]
+        cache.close()
+
+    def test_unusable_path(self, temp_dir):
+        blocker = os.path.join(temp_dir, "file")
+        open(blocker, "w").close()
+        cache = MetadataCache(os.path.join(blocker, "metadata.sqlite"))
+
+        cache.put("/photos/a.jpg", 1, 1, {})
+        assert cache.get("/photos/a.jpg", 1, 1) is None
+
+
+class TestProbeWithCache:
+    """Tests for Photo._probe reading unchanged photos from the cache."""
+
+    def test_unchanged_photo_is_not_opened(self, temp_dir):
+        path = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (120, 80), color="red").save(path)
+        cache = MetadataCache(os.path.join(temp_dir, "metadata.sqlite"))
+
+        with patch("fussel.generator.generate.Config") as mock_config:
+            mock_config.instance.return_value.people_enabled = True
+            first = Photo._probe(path, cache, os.stat(path))
+            with patch("fussel.generator.probe.Image.open") as mock_open:
+                second = Photo._probe(path, cache, os.stat(path))
+
+        mock_open.assert_not_called()
+        assert second.size == first.size == (120, 80)
+        assert second.format == "JPEG"
+        assert second.date == first.date
+        assert second.exif_data == first.exif_data
+        assert second.faces == first.faces
+
+    def test_modified_photo_is_read_again(self, temp_dir):
+        path = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (120, 80), color="red").save(path)
+        cache = MetadataCache(os.path.join(temp_dir, "metadata.sqlite"))
+
+        with patch("fussel.generator.generate.Config") as mock_config:
+            mock_config.instance.return_value.people_enabled = False
+            Photo._probe(path, cache, os.stat(path))
+            Image.new("RGB", (60, 40), color="red").save(path)
+            st = os.stat(path)
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+            probe = Photo._probe(path, cache, os.stat(path))
+
+        assert probe.size == (60, 40)
@@ -2,10 +2,13 @@
 Tests for People class in fussel.generator.generate module.
 """
 
+import os
 from unittest.mock import MagicMock, Mock, patch
 
 import pytest
+from PIL import Image
 
+from fussel.generator.config import Config
 from fussel.generator.generate import Face, FaceGeometry, People, Person
 
 
@@ -42,9 +45,15 @@ class TestPeopleDetectFaces:
     """Tests for People.detect_faces method."""
 
     def setup_method(self):
-        """Reset People singleton before each test."""
+        """Reset People singleton and configure photo sizes before each test."""
         People._instance = None
+        values = {"gallery.input_path": "/input", "gallery.photo_sizes": [(500, 500), (1600, 1600)]}
+        Config.init(Mock(getKey=Mock(side_effect=lambda key, default=None: values.get(key, default))))
+
+    def teardown_method(self):
+        Config._instance = None
 
+    @pytest.mark.usefixtures("mock_atomic_write")
     @patch("fussel.generator.generate.People.extract_faces")
     @patch("fussel.generator.generate.Image")
     @patch("fussel.generator.generate.find_unique_slug")
@@ -72,7 +81,6 @@ class TestPeopleDetectFaces:
         result = people.detect_faces(
             photo=mock_photo,
             original_src="/path/original.jpg",
-            largest_src="/path/largest.jpg",
             output_path="/output",
             external_path="/external",
         )
@@ -82,6 +90,7 @@ class TestPeopleDetectFaces:
         assert people.people["John Doe"].name == "John Doe"
         assert people.people["John Doe"].slug == "john-doe"
 
+    @pytest.mark.usefixtures("mock_atomic_write")
     @patch("fussel.generator.generate.People.extract_faces")
     @patch("fussel.generator.generate.Image")
     def test_detect_faces_existing_person(self, mock_image, mock_extract):
@@ -110,7 +119,6 @@ class TestPeopleDetectFaces:
         result = people.detect_faces(
             photo=mock_photo,
             original_src="/path/original.jpg",
-            largest_src="/path/largest.jpg",
             output_path="/output",
             external_path="/external",
         )
@@ -140,7 +148,6 @@ class TestPeopleDetectFaces:
         result = people.detect_faces(
             photo=mock_photo,
             original_src="/path/original.jpg",
-            largest_src="/path/largest.jpg",
             output_path="/output",
             external_path="/external",
         )
@@ -153,6 +160,64 @@ class TestPeopleDetectFaces:
         # find_unique_slug should not be called for existing person
         mock_find_slug.assert_not_called()
 
+    @patch("fussel.generator.generate.atomic_write")
+    @patch("fussel.generator.generate.Image")
+    @patch("fussel.generator.generate.find_unique_slug")
+    def test_detect_faces_uses_worker_crop(self, mock_find_slug, mock_image, mock_atomic_write):
+        """Test a crop made by the worker is written as is, without reopening the photo."""
+        people = People.instance()
+        mock_find_slug.return_value = "john-doe"
+        face = Face(name="John Doe", geometry=FaceGeometry(w="0.2", h="0.3", x="0.5", y="0.5"), crop=b"jpeg")
+
+        people.detect_faces(Mock(), "/input/photo.jpg", "/output", "/external", [face])
+
+        mock_image.open.assert_not_called()
+        mock_atomic_write.assert_called_once_with("/output/john-doe_photo.jpg")
+        mock_atomic_write.return_value.__enter__.return_value.write.assert_called_once_with(b"jpeg")
+        assert people.people["John Doe"].src == "/external/john-doe_photo.jpg"
+
+    @patch("fussel.generator.generate.find_unique_slug")
+    def test_detect_faces_crops_largest_size_once(self, mock_find_slug, temp_dir):
+        """Test a photo the worker did not resize gets its thumbnail from its largest size, kept while up to date."""
+        people = People.instance()
+        mock_find_slug.return_value = "john-doe"
+        largest = os.path.join(temp_dir, "1600x1067_photo.jpg")
+        Image.new("RGB", (1600, 1067), color="blue").save(largest)
+        face = Face(name="John Doe", geometry=FaceGeometry(w="0.2", h="0.3", x="0.5", y="0.5"), source=largest)
+
+        people.detect_faces(Mock(), "/input/photo.jpg", temp_dir, "/external", [face])
+
+        crop_path = os.path.join(temp_dir, "john-doe_photo.jpg")
+        with Image.open(crop_path) as crop:
+            assert crop.format == "JPEG"
+            assert crop.size[0] < 1600 and crop.size[1] < 1067
+        assert people.people["John Doe"].src == "/external/john-doe_photo.jpg"
+        assert people.face_crops == {crop_path}
+
+        People._instance = None
+        with patch("fussel.generator.generate.Image.open") as mock_open:
+            People.instance().detect_faces(Mock(), "/input/photo.jpg", temp_dir, "/external", [face])
+        mock_open.assert_not_called()
+        assert People.instance().face_crops == {crop_path}
+
+    @patch("fussel.generator.generate.find_unique_slug")
+    def test_detect_faces_unreadable_largest_size(self, mock_find_slug, temp_dir):
+        """Test a thumbnail that cannot be cut is looked for in the next photo of the person."""
+        people = People.instance()
+        mock_find_slug.return_value = "john-doe"
+        broken = os.path.join(temp_dir, "broken.jpg")
+        with open(broken, "wb") as f:
+            f.write(b"\xff\xd8\xff\xe0garbage-garbage")
+        geometry = FaceGeometry(w="0.2", h="0.3", x="0.5", y="0.5")
+
+        people.detect_faces(Mock(), "/input/a.jpg", temp_dir, "/external", [Face("John Doe", geometry, source=broken)])
+        assert not people.people["John Doe"].has_thumbnail()
+        assert people.face_crops == set()
+
+        people.detect_faces(Mock(), "/input/b.jpg", temp_dir, "/external", [Face("John Doe", geometry, crop=b"jpeg")])
+        assert people.people["John Doe"].src == "/external/john-doe_b.jpg"
+        assert len(people.people["John Doe"].photos) == 2
+
 
 class TestPeopleExtractFaces:
     """Tests for People.extract_faces method."""
@@ -168,7 +233,7 @@ class TestPeopleExtractFaces:
         mock_img = MagicMock()
         del mock_img.applist  # Remove applist attribute
 
-        with patch("fussel.generator.generate.Image") as mock_image:
+        with patch("fussel.generator.probe.Image") as mock_image:
             mock_image.open.return_value.__enter__.return_value = mock_img
             mock_image.open.return_value.__exit__.return_value = None
 
@@ -193,7 +258,7 @@ class TestPeopleExtractFaces:
         xmp_bytes = bytes("\x00http://ns.adobe.com/xap/1.0/\x00" + xmp_body, "utf-8")
         mock_img.applist = [("APP1", xmp_bytes)]
 
-        with patch("fussel.generator.generate.Image") as mock_image:
+        with patch("fussel.generator.probe.Image") as mock_image:
             mock_image.open.return_value.__enter__.return_value = mock_img
             mock_image.open.return_value.__exit__.return_value = None
 
@@ -222,7 +287,7 @@ class TestPeopleExtractFaces:
         xmp_bytes = bytes("\x00http://ns.adobe.com/xap/1.0/\x00" + xmp_body, "utf-8")
         mock_img.applist = [("APP1", xmp_bytes)]
 
-        with patch("fussel.generator.generate.Image") as mock_image:
+        with patch("fussel.generator.probe.Image") as mock_image:
             mock_image.open.return_value.__enter__.return_value = mock_img
             mock_image.open.return_value.__exit__.return_value = None
 
@@ -247,7 +312,7 @@ class TestPeopleExtractFaces:
         xmp_bytes = bytes("\x00http://ns.adobe.com/xap/1.0/\x00" + xmp_body, "utf-8")
         mock_img.applist = [("APP1", xmp_bytes)]
 
-        with patch("fussel.generator.generate.Image") as mock_image:
+        with patch("fussel.generator.probe.Image") as mock_image:
             mock_image.open.return_value.__enter__.return_value = mock_img
             mock_image.open.return_value.__exit__.return_value = None
 
@@ -264,7 +329,7 @@ class TestPeopleExtractFaces:
         # Invalid segment that will cause ValueError
         mock_img.applist = [("APP1", b"invalid data without null byte")]
 
-        with patch("fussel.generator.generate.Image") as mock_image:
+        with patch("fussel.generator.probe.Image") as mock_image:
             mock_image.open.return_value.__enter__.return_value = mock_img
             mock_image.open.return_value.__exit__.return_value = None
 
@@ -0,0 +1,165 @@
+"""
+Tests for fussel.generator.probe module.
+"""
+
+import io
+import os
+from unittest.mock import patch
+
+from PIL import Image, PngImagePlugin
+
+from fussel.generator.generate import Photo
+from fussel.generator.probe import PhotoProbe, probe_photo, scan_headers, split_xmp_segment
+
+XMP_BODY = """<?xml version="1.0"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+    <rdf:Description xmlns:xmp="http://ns.adobe.com/xap/1.0/" xmp:CreateDate="2021-05-04T10:20:30">
+    </rdf:Description>
+    <rdf:Description type="Face" name="Jane Doe">
+        <Area x="0.3" y="0.4" w="0.15" h="0.25"/>
+    </rdf:Description>
+</rdf:RDF>
+</x:xmpmeta>"""
+
+
+def _photo_with_metadata(temp_dir):
+    path = os.path.join(temp_dir, "probe.jpg")
+    exif = Image.Exif()
+    exif[271] = "Fussel Camera"
+    exif.get_ifd(0x8769)[36867] = "2019:01:02 03:04:05"
+    Image.new("RGB", (120, 80), color="red").save(path, exif=exif, xmp=XMP_BODY.encode("utf-8"))
+    return path
+
+
+class TestSplitXmpSegment:
+    """Tests for split_xmp_segment function."""
+
+    def test_leading_null(self):
+        content = b"\x00http://ns.adobe.com/xap/1.0/\x00<body/>"
+        assert split_xmp_segment("APP1", content) == "<body/>"
+
+    def test_without_leading_null(self):
+        content = b"http://ns.adobe.com/xap/1.0/\x00<body/>"
+        assert split_xmp_segment("APP1", content) == "<body/>"
+
+    def test_not_xmp(self):
+        assert split_xmp_segment("APP1", b"Exif\x00\x00data") is None
+        assert split_xmp_segment("APP2", b"http://ns.adobe.com/xap/1.0/\x00<body/>") is None
+        assert split_xmp_segment("APP1", b"no null byte") is None
+
+
+class TestProbePhoto:
+    """Tests for probe_photo function."""
+
+    def test_reads_dimensions_exif_and_xmp(self, temp_dir):
+        probe = probe_photo(_photo_with_metadata(temp_dir))
+
+        assert probe.format == "JPEG"
+        assert probe.size == (120, 80)
+        assert probe.exif[271] == "Fussel Camera"
+        assert len(probe.xmp) == 1
+
+    def test_missing_file_gives_empty_probe(self):
+        probe = probe_photo("/path/does/not/exist.jpg")
+
+        assert probe == PhotoProbe("/path/does/not/exist.jpg")
+
+    def test_photo_probe_does_not_open_image(self, temp_dir):
+        """Date, EXIF summary and faces all come from the scanned JPEG headers."""
+        path = _photo_with_metadata(temp_dir)
+
+        with (
+            patch("fussel.generator.probe.Image.open", wraps=Image.open) as mock_open,
+            patch("fussel.generator.generate.Config") as mock_config,
+        ):
+            mock_config.instance.return_value.people_enabled = True
+            probe = Photo._probe(path)
+
+        assert mock_open.call_count == 0
+        assert probe.date == "2019-01-02T03:04:05"
+        assert probe.exif_data["camera"] == {"make": "Fussel Camera"}
+        assert [face.name for face in probe.faces] == ["Jane Doe"]
+
+    def test_xmp_date_used_without_exif(self, temp_dir):
+        path = os.path.join(temp_dir, "xmp_only.jpg")
+        Image.new("RGB", (10, 10)).save(path, xmp=XMP_BODY.encode("utf-8"))
+
+        assert Photo._extract_date(path, probe_photo(path)) == "2021-05-04T10:20:30"
+
+
+class TestScanHeaders:
+    """Tests for the mmap based JPEG/PNG segment scanner."""
+
+    def test_jpeg_segments(self, temp_dir):
+        path = _photo_with_metadata(temp_dir)
+
+        with scan_headers(path) as header:
+            assert (header.format, header.width, header.height) == ("JPEG", 120, 80)
+            assert isinstance(header.exif, memoryview)
+            assert bytes(header.exif[:2]) in (b"II", b"MM")
+            assert bytes(header.xmp[0]).decode("utf-8") == XMP_BODY
+
+    def test_stops_at_image_data(self, temp_dir):
+        """Metadata is found even when the image data itself is cut off."""
+        path = _photo_with_metadata(temp_dir)
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[: data.index(b"\xff\xda") + 4])
+
+        probe = probe_photo(path)
+        assert probe.size == (120, 80)
+        assert probe.exif[271] == "Fussel Camera"
+
+    def test_png_chunks(self, temp_dir):
+        path = os.path.join(temp_dir, "probe.png")
+        exif = Image.Exif()
+        exif[271] = "Fussel Camera"
+        info = PngImagePlugin.PngInfo()
+        info.add_itxt("XML:com.adobe.xmp", XMP_BODY, zip=True)
+        Image.new("RGB", (64, 48), color="red").save(path, exif=exif, pnginfo=info)
+
+        with patch("fussel.generator.probe.Image.open") as mock_open:
+            probe = probe_photo(path)
+
+        mock_open.assert_not_called()
+        assert (probe.format, probe.size) == ("PNG", (64, 48))
+        assert probe.exif[271] == "Fussel Camera"
+        assert len(probe.xmp) == 1
+
+    def test_other_formats_use_pillow(self, temp_dir):
+        path = os.path.join(temp_dir, "probe.gif")
+        Image.new("RGB", (30, 20), color="red").save(path)
+
+        with scan_headers(path) as header:
+            assert header is None
+        probe = probe_photo(path)
+        assert (probe.format, probe.size) == ("GIF", (30, 20))
+
+
+class TestWorkerFaces:
+    """Faces are cropped in the worker from the image it is resizing."""
+
+    def test_process_photo_returns_face_crops(self, temp_dir):
+        path = _photo_with_metadata(temp_dir)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        with patch("fussel.generator.generate.Config") as mock_config:
+            config = mock_config.instance.return_value
+            config.people_enabled = True
+            config.watermark_enabled = False
+            config.overwrite = False
+            config.exif_transpose = False
+            config.fast_decode = True
+            config.validation = "on-decode"
+            config.manifest_content_hash = False
+            config.photo_sizes = [(60, 60), (100, 100)]
+
+            _, _, faces = Photo.process_photo("/external", path, "probe.jpg", "probe", output_path)
+
+        assert [face.name for face in faces] == ["Jane Doe"]
+        with Image.open(io.BytesIO(faces[0].crop)) as crop:
+            assert crop.format == "JPEG"
+            assert crop.size[0] <= 100 and crop.size[1] <= 67
@@ -1,12 +1,30 @@
 """
-Tests for _process_photo and _proces_photo_init functions.
+Tests for Photo.process_photo and the _process_photo and _proces_photo_init functions.
 """
 
+import os
+import shutil
 from unittest.mock import Mock, patch
 
 import pytest
+from PIL import Image
 
-from fussel.generator.generate import Photo, PhotoProcessingFailure, _proces_photo_init, _process_photo
+from fussel.generator.config import Config
+from fussel.generator.generate import (
+    Photo,
+    PhotoProcessingFailure,
+    _proces_photo_init,
+    _process_photo,
+    _process_photos,
+)
+from fussel.generator.iopool import IOPool
+from fussel.generator.util import Watermark, resize_cascade, save_image, shard_dir
+
+
+def _touch(path, content=b"data"):
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
 
 
 class TestProcessPhoto:
@@ -16,15 +34,12 @@ class TestProcessPhoto:
     def test_process_photo_success(self, mock_process_photo):
         """Test _process_photo with successful processing."""
         mock_photo = Mock(spec=Photo)
-        mock_process_photo.return_value = mock_photo
-
-        # Set up the people_q attribute
-        mock_queue = Mock()
-        _process_photo.people_q = mock_queue
+        record = {"outputs": {}}
+        mock_process_photo.return_value = (mock_photo, record, [])
 
-        result = _process_photo(("/external", "/path/to/photo.jpg", "photo.jpg", "photo", "/output"))
+        result = _process_photo(("/external", "/path/to/photo.jpg", "photo.jpg", "photo", "/output", None, None, None))
 
-        assert result == ("/path/to/photo.jpg", mock_photo)
+        assert result == ("/path/to/photo.jpg", mock_photo, record, [])
         mock_process_photo.assert_called_once()
 
     @patch("fussel.generator.generate.Photo.process_photo")
@@ -32,23 +47,36 @@ class TestProcessPhoto:
         """Test _process_photo with PhotoProcessingFailure."""
         mock_process_photo.side_effect = PhotoProcessingFailure(message="Test error")
 
-        mock_queue = Mock()
-        _process_photo.people_q = mock_queue
+        result = _process_photo(
+            ("/external", "/path/to/bad_photo.jpg", "bad_photo.jpg", "bad-photo", "/output", None, None, None)
+        )
 
-        result = _process_photo(("/external", "/path/to/bad_photo.jpg", "bad_photo.jpg", "bad-photo", "/output"))
-
-        assert result == ("/path/to/bad_photo.jpg", None)
+        assert result == ("/path/to/bad_photo.jpg", None, None, [])
 
     @patch("fussel.generator.generate.Photo.process_photo")
     def test_process_photo_unexpected_exception(self, mock_process_photo):
         """Test _process_photo with unexpected exception (should propagate)."""
         mock_process_photo.side_effect = ValueError("Unexpected error")
 
-        mock_queue = Mock()
-        _process_photo.people_q = mock_queue
-
         with pytest.raises(ValueError):
-            _process_photo(("/external", "/path/to/photo.jpg", "photo.jpg", "photo", "/output"))
+            _process_photo(("/external", "/path/to/photo.jpg", "photo.jpg", "photo", "/output", None, None, None))
+
+
+class TestProcessPhotos:
+    """Tests for _process_photos, one pool task."""
+
+    @patch("fussel.generator.generate.Photo.process_photo")
+    def test_waits_for_io_once_per_task(self, mock_process_photo):
+        """The writes of a batch overlap the next photos and are all done when the task returns."""
+        io_pool = Mock()
+        mock_process_photo.side_effect = lambda *args: io_pool.wait.assert_not_called() or (Mock(), {}, [])
+        jobs = [("/external", "/in/%d.jpg" % i, "%d.jpg" % i, str(i), "/output", None, None, None) for i in range(3)]
+
+        with patch.object(_process_photo, "io_pool", io_pool, create=True):
+            results = _process_photos(jobs)
+
+        assert [r[0] for r in results] == ["/in/0.jpg", "/in/1.jpg", "/in/2.jpg"]
+        io_pool.wait.assert_called_once()
 
 
 class TestProcessPhotoInit:
@@ -56,14 +84,330 @@ class TestProcessPhotoInit:
 
     def test_proces_photo_init(self):
         """Test _proces_photo_init sets up worker process."""
-        mock_queue = Mock()
         mock_yaml_config = Mock()
 
         with patch("fussel.generator.generate.Config") as mock_config_class:
-            _proces_photo_init(mock_queue, mock_yaml_config)
-
-            # Verify people_q is set
-            assert _process_photo.people_q == mock_queue
+            mock_config_class.instance.return_value.io_threads = 2
+            _proces_photo_init(mock_yaml_config)
 
             # Verify Config.init was called
             mock_config_class.init.assert_called_once_with(mock_yaml_config)
+            assert _process_photo.io_pool.executor._max_workers == 2
+            _process_photo.io_pool.shutdown()
+
+
+class TestPhotoProcessPhoto:
+    """Tests for Photo.process_photo on real files: reuse of recorded outputs, validation and placement."""
+
+    def setup_method(self):
+        Config._instance = None
+
+    def _init_config(self, **overrides):
+        values = {
+            "gallery.input_path": "/test/input",
+            "gallery.output_path": "/test/output",
+            "gallery.people.enable": False,
+            "gallery.watermark.enable": False,
+        }
+        values.update(overrides)
+        mock_yaml_config = Mock()
+        mock_yaml_config.getKey = Mock(side_effect=lambda key, default=None: values.get(key, default))
+        Config.init(mock_yaml_config)
+
+    def _process(self, photo, output_path, record=None):
+        return Photo.process_photo(
+            external_path="/external",
+            photo=photo,
+            filename="photo.jpg",
+            slug="photo",
+            output_path=output_path,
+            manifest_record=record,
+        )
+
+    def test_unchanged_photo_is_not_decoded_again(self, temp_dir):
+        self._init_config()
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (2000, 1500), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        photo_obj, record, _ = self._process(photo, output_path)
+        assert set(record["outputs"]) == {os.path.join(output_path, name) for name in os.listdir(output_path)}
+
+        with patch("fussel.generator.generate.resize_cascade") as mock_cascade:
+            again, _, _ = self._process(photo, output_path, record)
+
+        mock_cascade.assert_not_called()
+        assert again.srcSet == photo_obj.srcSet
+        assert (again.width, again.height) == (2000, 1500)
+
+    def test_listed_outputs_are_not_stat_again(self, temp_dir):
+        self._init_config()
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (2000, 1500), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+        _, record, _ = self._process(photo, output_path)
+        derivative = next(p for p in record["outputs"] if not os.path.basename(p).startswith("original_"))
+
+        with (
+            patch("fussel.generator.generate.resize_cascade", wraps=resize_cascade) as mock_cascade,
+            patch("os.path.exists") as mock_exists,
+        ):
+            Photo.process_photo(
+                "/external", photo, "photo.jpg", "photo", output_path, record, existing=frozenset(record["outputs"])
+            )
+            mock_cascade.assert_not_called()
+            mock_exists.assert_not_called()
+
+            # An output missing from the listing is generated again
+            Photo.process_photo(
+                "/external",
+                photo,
+                "photo.jpg",
+                "photo",
+                output_path,
+                record,
+                existing=frozenset(record["outputs"]) - {derivative},
+            )
+            mock_exists.assert_not_called()
+        assert len(mock_cascade.call_args.args[1]) == 1
+
+    def test_changing_link_strategy_relinks_original_only(self, temp_dir):
+        self._init_config()
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (2000, 1500), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+        _, record, _ = self._process(photo, output_path)
+
+        self._init_config(**{"gallery.originals.link": "hardlink"})
+        with patch("fussel.generator.generate.resize_cascade") as mock_cascade:
+            _, record, _ = self._process(photo, output_path, record)
+
+        mock_cascade.assert_not_called()
+        assert os.path.samefile(photo, os.path.join(output_path, "original_photo.jpg"))
+
+    def test_modified_photo_is_regenerated(self, temp_dir):
+        self._init_config()
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (2000, 1500), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        _, record, _ = self._process(photo, output_path)
+        Image.new("RGB", (2000, 1500), color="red").save(photo)
+        os.utime(photo, ns=(record["mtime_ns"] + 10**9, record["mtime_ns"] + 10**9))
+
+        self._process(photo, output_path, record)
+
+        with Image.open(os.path.join(output_path, "original_photo.jpg")) as im:
+            assert im.getpixel((0, 0))[0] > 200
+
+    def test_changed_settings_regenerate_affected_sizes(self, temp_dir):
+        self._init_config()
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (2000, 1500), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        _, record, _ = self._process(photo, output_path)
+
+        Config._instance = None
+        self._init_config(**{"gallery.fast_decode": False})
+        with patch("fussel.generator.generate.resize_cascade", wraps=resize_cascade) as mock_cascade:
+            self._process(photo, output_path, record)
+
+        assert len(mock_cascade.call_args.args[1]) == len(Config.instance().photo_sizes)
+
+    def test_small_original_is_passed_through(self, temp_dir):
+        self._init_config()
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (900, 600), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        photo_obj, record, _ = self._process(photo, output_path)
+
+        assert sorted(os.listdir(output_path)) == ["500x333_photo.jpg", "800x533_photo.jpg", "original_photo.jpg"]
+        assert set(record["outputs"]) == {os.path.join(output_path, name) for name in os.listdir(output_path)}
+        assert photo_obj.srcSet["(1024, 1024)w"] == ["/external/original_photo.jpg"]
+        assert photo_obj.srcSet["(1600, 1600)w"] == ["/external/original_photo.jpg"]
+        assert photo_obj.src == "/external/original_photo.jpg"
+
+    @pytest.mark.parametrize("threads", [0, 2])
+    def test_unidentified_image_leaves_nothing_behind(self, temp_dir, threads):
+        self._init_config()
+        photo = os.path.join(temp_dir, "bad.jpg")
+        _touch(photo, os.urandom(4096))
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+        io_pool = IOPool(threads)
+
+        with pytest.raises(PhotoProcessingFailure):
+            Photo.process_photo("/external", photo, "bad.jpg", "bad", output_path, io_pool=io_pool)
+        io_pool.shutdown()
+
+        assert os.listdir(output_path) == []
+        assert io_pool.pending == []
+
+    @pytest.mark.parametrize("validation", ["on-decode", "strict"])
+    def test_truncated_file_is_skipped(self, temp_dir, validation):
+        self._init_config(**{"gallery.validation": validation})
+        photo = os.path.join(temp_dir, "broken.jpg")
+        # A JPEG signature with nothing readable behind it fails as soon as it is opened
+        _touch(photo, b"\xff\xd8\xff\xe0garbage-garbage")
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        with pytest.raises(PhotoProcessingFailure, match="Image Verification"):
+            Photo.process_photo("/external", photo, "broken.jpg", "broken", output_path)
+        assert os.listdir(output_path) == []
+
+        self._init_config(**{"gallery.validation": "off"})
+        with pytest.raises(Exception) as excinfo:
+            Photo.process_photo("/external", photo, "broken.jpg", "broken", output_path)
+        assert not isinstance(excinfo.value, PhotoProcessingFailure)
+
+    def test_passed_through_original_is_validated(self, temp_dir):
+        self._init_config()
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (400, 300), color="blue").save(photo)
+        with open(photo, "rb") as f:
+            data = f.read()
+        # Valid header, the image data is cut off
+        with open(photo, "wb") as f:
+            f.write(data[: len(data) // 2])
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        with patch("fussel.generator.generate.ImageFile.LOAD_TRUNCATED_IMAGES", False):
+            with pytest.raises(PhotoProcessingFailure, match="Image Verification"):
+                self._process(photo, output_path)
+        assert os.listdir(output_path) == []
+
+    def test_duplicate_sizes_are_encoded_once(self, temp_dir):
+        watermark = os.path.join(temp_dir, "watermark.png")
+        Image.new("RGBA", (100, 50), color=(255, 255, 255, 128)).save(watermark)
+        self._init_config(**{"gallery.watermark.enable": True, "gallery.watermark.path": watermark})
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (900, 600), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        with patch.object(Watermark, "apply", autospec=True, side_effect=Watermark.apply) as mock_watermark:
+            photo_obj, _, _ = self._process(photo, output_path)
+
+        # Sizes above 900px all serve the watermarked largest file, never the bare original
+        assert photo_obj.srcSet["(1024, 1024)w"] == photo_obj.srcSet["(1600, 1600)w"] == ["/external/900x600_photo.jpg"]
+        mock_watermark.assert_called_once()
+        with Image.open(os.path.join(output_path, "900x600_photo.jpg")) as im:
+            assert im.getpixel((450, 300)) != (0, 0, 255)
+
+        self._init_config(**{"gallery.exif_transpose": True})
+        shutil.rmtree(output_path)
+        os.makedirs(output_path)
+        with patch("fussel.generator.generate.save_image", wraps=save_image) as mock_save:
+            photo_obj, _, _ = self._process(photo, output_path)
+
+        # Rotation has to be baked in, the two sizes above 900px share one file
+        assert photo_obj.srcSet["(1024, 1024)w"] == photo_obj.srcSet["(1600, 1600)w"] == ["/external/900x600_photo.jpg"]
+        assert [c.args[1] for c in mock_save.call_args_list].count(os.path.join(output_path, "900x600_photo.jpg")) == 1
+
+    def test_unrelated_size_change_keeps_collapsed_sizes(self, temp_dir):
+        self._init_config(**{"gallery.exif_transpose": True, "gallery.photo_sizes": [(500, 500), (1024, 1024)]})
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (900, 600), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+        _, record, _ = self._process(photo, output_path)
+
+        self._init_config(
+            **{"gallery.exif_transpose": True, "gallery.photo_sizes": [(500, 500), (1024, 1024), (2000, 2000)]}
+        )
+        with patch("fussel.generator.generate.resize_cascade") as mock_cascade:
+            _, again, _ = self._process(photo, output_path, record)
+
+        # The 900x600 file does not depend on which sizes above 900px produce it
+        mock_cascade.assert_not_called()
+        assert again["outputs"] == record["outputs"]
+
+    def test_content_addressed_outputs_survive_renames(self, temp_dir):
+        self._init_config(**{"gallery.content_addressed": True})
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (2000, 1500), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "albums", "album")
+        os.makedirs(output_path)
+
+        photo_obj, record, _ = self._process(photo, output_path)
+
+        store = os.path.join(temp_dir, "albums", "_store")
+        assert os.listdir(output_path) == []
+        assert set(record["outputs"]) == {os.path.join(store, name) for name in os.listdir(store)}
+        assert photo_obj.originalSrc == "/_store/%s.jpg" % record["hash"]
+        assert all(url.startswith("/_store/") for urls in photo_obj.srcSet.values() for url in urls)
+
+        # Moved to another album under another name, nothing is rendered again
+        moved = os.path.join(temp_dir, "renamed.jpg")
+        os.rename(photo, moved)
+        os.makedirs(os.path.join(temp_dir, "albums", "other"))
+        with patch("fussel.generator.generate.resize_cascade") as mock_cascade:
+            again, _, _ = Photo.process_photo(
+                "/other", moved, "renamed.jpg", "renamed", os.path.join(temp_dir, "albums", "other")
+            )
+
+        mock_cascade.assert_not_called()
+        assert again.srcSet == photo_obj.srcSet
+
+    def test_sharded_layout_adopts_flat_outputs(self, temp_dir):
+        self._init_config()
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (2000, 1500), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+        _, record, _ = self._process(photo, output_path)
+        flat = sorted(os.listdir(output_path))
+
+        self._init_config(**{"gallery.output_sharding": True})
+        with patch("fussel.generator.generate.resize_cascade") as mock_cascade:
+            photo_obj, record, _ = self._process(photo, output_path, record)
+
+        mock_cascade.assert_not_called()
+        # All the files of the photo share one shard
+        assert os.listdir(output_path) == [shard_dir("photo")]
+        for name in flat:
+            path = os.path.join(output_path, shard_dir("photo"), name)
+            assert os.path.isfile(path)
+            assert path in record["outputs"]
+        assert photo_obj.originalSrc == "/external/%s/original_photo.jpg" % shard_dir("photo")
+        assert photo_obj.srcSet["(500, 500)w"] == ["/external/%s/500x375_photo.jpg" % shard_dir("photo")]
+
+    def test_watermark_change_regenerates_largest_size_only(self, temp_dir):
+        watermark = os.path.join(temp_dir, "watermark.png")
+        Image.new("RGBA", (100, 50), color=(255, 255, 255, 128)).save(watermark)
+        self._init_config(**{"gallery.watermark.enable": True, "gallery.watermark.path": watermark})
+        photo = os.path.join(temp_dir, "photo.jpg")
+        Image.new("RGB", (2000, 1500), color="blue").save(photo)
+        output_path = os.path.join(temp_dir, "out")
+        os.makedirs(output_path)
+
+        _, record, _ = self._process(photo, output_path)
+
+        Config._instance = None
+        self._init_config(
+            **{
+                "gallery.watermark.enable": True,
+                "gallery.watermark.path": watermark,
+                "gallery.watermark.size_ratio": 0.5,
+            }
+        )
+        with (
+            patch("fussel.generator.generate.resize_cascade", wraps=resize_cascade) as mock_cascade,
+            patch.object(Watermark, "apply", autospec=True, side_effect=Watermark.apply) as mock_watermark,
+        ):
+            self._process(photo, output_path, record)
+
+        assert mock_cascade.call_args.args[1] == [(1600, 1200)]
+        mock_watermark.assert_called_once()
+        assert mock_watermark.call_args.args[0].ratio == 0.5
+        assert mock_watermark.call_args.args[1].size == (1600, 1200)
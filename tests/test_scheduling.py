@@ -0,0 +1,96 @@
+"""
+Tests for fussel.generator.scheduling module.
+"""
+
+import os
+from unittest.mock import patch
+
+from fussel.generator.metadata_cache import MetadataCache
+from fussel.generator.scheduling import BASE_COST, SMALL_JOB_BATCH, Scheduler, job_cost
+
+
+def _write(path, size):
+    with open(path, "wb") as f:
+        f.write(b"\0" * size)
+    return path
+
+
+class TestJobCost:
+    """Tests for the per-photo cost model."""
+
+    def test_missing_file(self, temp_dir):
+        assert job_cost(os.path.join(temp_dir, "missing.jpg")) == BASE_COST
+
+    def test_unchanged_source_costs_overhead_only(self, temp_dir):
+        path = _write(os.path.join(temp_dir, "a.jpg"), 1000)
+        st = os.stat(path)
+        record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "outputs": {}}
+
+        assert job_cost(path, record) == BASE_COST
+        assert job_cost(path, {"size": 1, "mtime_ns": 1}) > BASE_COST
+
+    def test_grows_with_file_size_format_and_sizes(self, temp_dir):
+        small = _write(os.path.join(temp_dir, "small.jpg"), 1000)
+        large = _write(os.path.join(temp_dir, "large.jpg"), 100000)
+        png = _write(os.path.join(temp_dir, "large.png"), 100000)
+
+        assert job_cost(large) > job_cost(small)
+        assert job_cost(large, sizes=4) > job_cost(large, sizes=1)
+        assert job_cost(png) != job_cost(large)
+
+    def test_uses_cached_dimensions(self, temp_dir):
+        path = _write(os.path.join(temp_dir, "a.jpg"), 10)
+        st = os.stat(path)
+        cache = MetadataCache(os.path.join(temp_dir, "metadata.sqlite"))
+        cache.put(path, st.st_size, st.st_mtime_ns, {"width": 6000, "height": 4000})
+
+        assert job_cost(path, metadata_cache=cache) == BASE_COST + 6000 * 4000
+
+    def test_uses_listed_stat(self, temp_dir):
+        path = _write(os.path.join(temp_dir, "a.jpg"), 1000)
+        st = os.stat(path)
+        record = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "outputs": {}}
+
+        expected = job_cost(path)
+        with patch("fussel.generator.scheduling.os.stat") as mock_stat:
+            assert job_cost(path, record, st=st) == BASE_COST
+            assert job_cost(path, st=st) == expected
+        mock_stat.assert_not_called()
+
+
+class TestScheduler:
+    """Tests for longest job first ordering, batching and progress."""
+
+    def _jobs(self, costs):
+        return [("/external", "/photos/%d.jpg" % i, costs[i]) for i in range(len(costs))]
+
+    def test_largest_first_within_lookahead(self):
+        scheduler = Scheduler(lambda job: job[2], lookahead=3)
+        costs = [BASE_COST * 100, BASE_COST * 300, BASE_COST * 200, BASE_COST * 400]
+
+        order = [task[0][2] for task in scheduler.tasks(self._jobs(costs))]
+
+        # The last job only enters the window once the first one is dispatched
+        assert order == [BASE_COST * 300, BASE_COST * 400, BASE_COST * 200, BASE_COST * 100]
+        assert scheduler.listed
+        assert scheduler.total_jobs == 4
+
+    def test_small_jobs_are_batched(self):
+        scheduler = Scheduler(lambda job: job[2])
+        costs = [BASE_COST * 100] + [BASE_COST] * (SMALL_JOB_BATCH + 3)
+
+        tasks = list(scheduler.tasks(self._jobs(costs)))
+
+        assert [len(task) for task in tasks] == [1, SMALL_JOB_BATCH, 3]
+        assert sorted(job[1] for task in tasks for job in task) == sorted(j[1] for j in self._jobs(costs))
+
+    def test_progress(self):
+        scheduler = Scheduler(lambda job: job[2])
+        tasks = scheduler.tasks(self._jobs([100, 300]))
+
+        next(tasks)
+        assert scheduler.progress() == "0/2 photos"
+
+        scheduler.started -= 10
+        scheduler.done("/photos/0.jpg")
+        assert scheduler.progress().startswith("1/2 photos, ETA 0m")
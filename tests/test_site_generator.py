@@ -34,6 +34,8 @@ class TestSiteGenerator:
         assert generator.unique_person_slugs == {}
         assert Config.instance() is not None
 
+    @patch("fussel.generator.generate.remove_orphans")
+    @patch("fussel.generator.generate.Manifest")
     @patch("fussel.generator.generate.os.path.dirname")
     @patch("fussel.generator.generate.os.path.realpath")
     @patch("fussel.generator.generate.os.makedirs")
@@ -56,6 +58,8 @@ class TestSiteGenerator:
         mock_makedirs,
         mock_realpath,
         mock_dirname,
+        mock_manifest_class,
+        mock_remove_orphans,
     ):
         """Test full generate workflow with all mocks."""
         # Setup path mocks
@@ -67,6 +71,10 @@ class TestSiteGenerator:
         mock_config.input_photos_dir = "/test/input"
         mock_config.http_root = "/"
         mock_config.overwrite = False
+        mock_config.preview = False
+        mock_config.cleanup_enabled = True
+        mock_config.cleanup_dry_run = False
+        mock_remove_orphans.return_value = ([], 0)
         mock_config_class.instance.return_value = mock_config
 
         # Setup singleton mocks
@@ -102,13 +110,24 @@ class TestSiteGenerator:
         # Verify directories were created
         assert mock_makedirs.called
 
-        # Verify Albums.process_path was called
+        # Verify Albums.process_path was called with the build manifest
         mock_albums.process_path.assert_called_once()
+        mock_manifest_class.load.assert_called_once_with("/fussel/fussel/cache/manifest.json")
+        manifest = mock_manifest_class.load.return_value
+        assert mock_albums.process_path.call_args.args[4] is manifest
+        assert mock_albums.process_path.call_args.args[5].path == "/fussel/fussel/cache/metadata.sqlite"
+        manifest.prune.assert_called_once()
+        manifest.save.assert_called_once()
+
+        # Verify stale files were cleaned up against what this build produced
+        mock_remove_orphans.assert_called_once()
+        assert mock_remove_orphans.call_args.args[0] == "/fussel/fussel/web/public/static/_gallery/albums"
 
         # Verify files were written
         assert mock_file.called
         assert mock_json_dumps.called
 
+    @patch("fussel.generator.generate.Manifest")
     @patch("fussel.generator.generate.os.path.dirname")
     @patch("fussel.generator.generate.os.path.realpath")
     @patch("fussel.generator.generate.os.makedirs")
@@ -116,7 +135,14 @@ class TestSiteGenerator:
     @patch("fussel.generator.generate.Albums")
     @patch("fussel.generator.generate.Config")
     def test_generate_with_overwrite(
-        self, mock_config_class, mock_albums_class, mock_rmtree, mock_makedirs, mock_realpath, mock_dirname
+        self,
+        mock_config_class,
+        mock_albums_class,
+        mock_rmtree,
+        mock_makedirs,
+        mock_realpath,
+        mock_dirname,
+        mock_manifest_class,
     ):
         """Test generate with overwrite enabled."""
         mock_dirname.return_value = "/fussel/fussel/generator"
@@ -126,6 +152,7 @@ class TestSiteGenerator:
         mock_config.input_photos_dir = "/test/input"
         mock_config.http_root = "/"
         mock_config.overwrite = True
+        mock_config.preview = False
         mock_config_class.instance.return_value = mock_config
 
         mock_albums = Mock()
@@ -153,3 +180,54 @@ class TestSiteGenerator:
 
         # Verify rmtree was called for overwrite
         assert mock_rmtree.called
+
+    @patch("fussel.generator.generate.Manifest")
+    @patch("fussel.generator.generate.os.path.dirname")
+    @patch("fussel.generator.generate.os.path.realpath")
+    @patch("fussel.generator.generate.os.makedirs")
+    @patch("fussel.generator.generate.shutil.rmtree")
+    @patch("fussel.generator.generate.Albums")
+    @patch("fussel.generator.generate.Config")
+    def test_generate_preview(
+        self,
+        mock_config_class,
+        mock_albums_class,
+        mock_rmtree,
+        mock_makedirs,
+        mock_realpath,
+        mock_dirname,
+        mock_manifest_class,
+    ):
+        """Test a preview build writes photos and cache apart from the production ones."""
+        mock_dirname.return_value = "/fussel/fussel/generator"
+        mock_realpath.return_value = "/fussel/fussel/generator/generate.py"
+
+        mock_config = Mock()
+        mock_config.input_photos_dir = "/test/input"
+        mock_config.http_root = "/"
+        mock_config.overwrite = False
+        mock_config.preview = True
+        mock_config.metadata_cache_enabled = False
+        mock_config.cleanup_enabled = False
+        mock_config_class.instance.return_value = mock_config
+
+        mock_albums = Mock()
+        mock_albums.albums = {}
+        mock_albums_class.instance.return_value = mock_albums
+
+        generator = SiteGenerator(Mock())
+
+        with (
+            patch("builtins.open", mock_open()),
+            patch("fussel.generator.generate.json.dumps", return_value="{}"),
+            patch("fussel.generator.generate.People"),
+            patch("fussel.generator.generate.Site"),
+        ):
+            generator.generate()
+
+        mock_manifest_class.load.assert_called_once_with("/fussel/fussel/cache/preview/manifest.json")
+        args = mock_albums.process_path.call_args.args
+        assert args[1] == "/fussel/fussel/web/public/static/_preview/albums"
+        assert args[2] == "/static/_preview/albums"
+        # Production photos are left alone
+        assert all("_gallery" not in c.args[0] or "/src/" in c.args[0] for c in mock_rmtree.call_args_list)
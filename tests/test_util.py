@@ -10,7 +10,9 @@ import pytest
 from PIL import Image
 
 from fussel.generator.util import (
-    apply_watermark,
+    DirectoryIndex,
+    Watermark,
+    atomic_write,
     calculate_face_crop_dimensions,
     calculate_new_size,
     extract_extension,
@@ -18,39 +20,18 @@ from fussel.generator.util import (
     increase_h,
     increase_size,
     increase_w,
-    is_supported_album,
     is_supported_photo,
+    link_file,
+    load_watermark,
     pick_album_thumbnail,
+    remove_orphans,
+    resize_cascade,
+    save_image,
+    shard_dir,
+    sync_file,
 )
 
 
-class TestIsSupportedAlbum:
-    """Tests for is_supported_album function."""
-
-    def test_valid_directory(self, temp_dir):
-        """Test that a valid directory is supported."""
-        test_dir = os.path.join(temp_dir, "valid_album")
-        os.makedirs(test_dir)
-        assert is_supported_album(test_dir) is True
-
-    def test_hidden_directory(self, temp_dir):
-        """Test that hidden directories (starting with .) are not supported."""
-        test_dir = os.path.join(temp_dir, ".hidden")
-        os.makedirs(test_dir)
-        assert is_supported_album(test_dir) is False
-
-    def test_file_not_directory(self, temp_dir):
-        """Test that files are not supported."""
-        test_file = os.path.join(temp_dir, "not_a_dir.txt")
-        with open(test_file, "w") as f:
-            f.write("test")
-        assert is_supported_album(test_file) is False
-
-    def test_nonexistent_path(self):
-        """Test that nonexistent paths are not supported."""
-        assert is_supported_album("/nonexistent/path") is False
-
-
 class TestExtractExtension:
     """Tests for extract_extension function."""
 
@@ -198,6 +179,94 @@ class TestCalculateNewSize:
         assert result[1] == 1500  # Maintains aspect ratio
 
 
+class TestResizeCascade:
+    """Tests for resize_cascade function."""
+
+    def test_yields_sizes_largest_first(self):
+        """Each distinct size is produced once, from largest to smallest."""
+        im = Image.new("RGB", (2000, 1500), color="red")
+        sizes = [(500, 375), (1600, 1200), (800, 600), (500, 375)]
+
+        result = [(size, resized.size) for size, resized in resize_cascade(im, sizes)]
+
+        assert result == [((1600, 1200), (1600, 1200)), ((800, 600), (800, 600)), ((500, 375), (500, 375))]
+
+    def test_no_sizes(self):
+        """Nothing is yielded (and nothing is decoded) when no size is requested."""
+        im = Mock()
+        assert list(resize_cascade(im, [])) == []
+        im.thumbnail.assert_not_called()
+
+    def test_fast_decode_drafts_to_largest_size(self):
+        """JPEG draft mode is requested for the largest target size only, with room for the resampling."""
+        im = Mock()
+        list(resize_cascade(im, [(500, 375), (1600, 1200)], fast_decode=True))
+
+        im.draft.assert_called_once_with(None, (3200, 2400))
+
+    def test_strict_quality_skips_draft(self):
+        """Without fast_decode the source is fully decoded before resampling."""
+        im = Mock()
+        list(resize_cascade(im, [(500, 375)], fast_decode=False))
+
+        im.draft.assert_not_called()
+        im.thumbnail.assert_called_once_with((500, 375), resample=Image.Resampling.BICUBIC, reducing_gap=None)
+
+    @pytest.mark.parametrize(
+        "quality, resample, reducing_gap",
+        [
+            ("fast", Image.Resampling.BILINEAR, 1.0),
+            ("balanced", Image.Resampling.BICUBIC, 2.0),
+            ("best", Image.Resampling.LANCZOS, None),
+            ("unknown", Image.Resampling.BICUBIC, 2.0),
+        ],
+    )
+    def test_resize_quality(self, quality, resample, reducing_gap):
+        """Each quality maps to a resampling filter and reducing gap."""
+        im = Mock()
+        list(resize_cascade(im, [(500, 375)], quality=quality))
+
+        im.thumbnail.assert_called_once_with((500, 375), resample=resample, reducing_gap=reducing_gap)
+
+    @pytest.mark.parametrize(
+        "quality, decoded",
+        [("fast", (500, 375)), ("balanced", (1000, 750)), ("best", (4000, 3000))],
+    )
+    def test_draft_follows_resize_quality(self, temp_dir, quality, decoded):
+        """A real JPEG is decoded at the scale of its quality, best decodes it fully."""
+        path = os.path.join(temp_dir, "large.jpg")
+        Image.new("RGB", (4000, 3000), color="blue").save(path)
+
+        with Image.open(path) as im:
+            resized = []
+            with patch.object(im, "thumbnail", side_effect=lambda *a, **kw: resized.append(im.size)):
+                list(resize_cascade(im, [(500, 375)], quality=quality))
+
+        assert resized == [decoded]
+
+    def test_fast_decode_jpeg(self, temp_dir):
+        """A real JPEG is decoded at a reduced scale and still reaches every size."""
+        path = os.path.join(temp_dir, "large.jpg")
+        Image.new("RGB", (4000, 3000), color="blue").save(path)
+
+        with Image.open(path) as im:
+            result = [resized.size for _, resized in resize_cascade(im, [(1000, 750), (500, 375)])]
+
+        assert result == [(1000, 750), (500, 375)]
+
+    def test_exif_transpose_applied_once(self):
+        """Orientation is applied once and later sizes keep the rotated frame."""
+        im = Image.new("RGB", (2000, 1000), color="red")
+
+        # Simulate an EXIF orientation of 6 (rotate 90 CW)
+        with patch("fussel.generator.util.ImageOps.exif_transpose") as mock_transpose:
+            mock_transpose.side_effect = lambda i: i.transpose(Image.Transpose.ROTATE_270)
+            result = [(size, resized.size) for size, resized in resize_cascade(im, [(1000, 500), (500, 250)], True)]
+
+        mock_transpose.assert_called_once()
+        assert result == [((1000, 500), (500, 1000)), ((500, 250), (250, 500))]
+
+
 class TestIncreaseW:
     """Tests for increase_w function."""
 
@@ -363,26 +432,44 @@ class TestCalculateFaceCropDimensions:
         assert 0.8 < calculated_ratio < 2.0  # Reasonable range after processing
 
 
-class TestApplyWatermark:
-    """Tests for apply_watermark function."""
+class TestWatermark:
+    """Tests for the Watermark composited in memory."""
+
+    def test_apply_returns_marked_copy(self):
+        """The watermark lands in the bottom right corner of a copy."""
+        base = Image.new("RGB", (200, 100), color=(0, 0, 0))
+        watermark = Watermark(Image.new("RGBA", (100, 50), color=(255, 255, 255, 255)), 0.25)
 
-    def test_apply_watermark(self, temp_dir, mock_image_file):
-        """Test watermark application."""
-        watermark = Image.new("RGBA", (100, 50), color=(255, 255, 255, 128))
-        watermark_ratio = 0.2
+        marked = watermark.apply(base)
 
-        # Copy the mock image to a new path for watermarking
-        watermarked_path = os.path.join(temp_dir, "watermarked.jpg")
-        import shutil
+        assert marked.size == (200, 100)
+        assert marked.getpixel((199, 99)) == (255, 255, 255)
+        assert marked.getpixel((0, 0)) == (0, 0, 0)
+        assert base.getpixel((199, 99)) == (0, 0, 0)
 
-        shutil.copy(mock_image_file, watermarked_path)
+    def test_scaled_once_per_width(self):
+        """Resized watermarks are memoised by target width."""
+        image = Mock()
+        image.size = (100, 50)
+        watermark = Watermark(image, 0.5)
 
-        apply_watermark(watermarked_path, watermark, watermark_ratio)
+        first = watermark.scaled_to(400)
+        assert watermark.scaled_to(400) is first
+        watermark.scaled_to(300)
 
-        # Verify file was modified
-        assert os.path.exists(watermarked_path)
-        with Image.open(watermarked_path) as img:
-            assert img.size == (100, 100)  # Original size maintained
+        assert [c.args for c in image.resize.call_args_list] == [((200, 100),), ((150, 75),)]
+
+    def test_load_watermark_reads_file_once(self, temp_dir):
+        """The watermark file is only opened once per path and ratio."""
+        path = os.path.join(temp_dir, "watermark.png")
+        Image.new("RGBA", (100, 50), color=(255, 255, 255, 128)).save(path)
+        load_watermark.cache_clear()
+
+        with patch("fussel.generator.util.Image.open", wraps=Image.open) as mock_open:
+            first = load_watermark(path, 0.3)
+            assert load_watermark(path, 0.3) is first
+        mock_open.assert_called_once()
+        assert first.image.size == (100, 50)
 
 
 class TestPickAlbumThumbnail:
@@ -422,3 +509,219 @@ class TestPickAlbumThumbnail:
 
         result = pick_album_thumbnail(album_photos)
         assert result is None
+
+
+class TestRemoveOrphans:
+    """Tests for remove_orphans function."""
+
+    def _tree(self, temp_dir):
+        paths = {}
+        for rel in ("album/original_a.jpg", "album/500x375_a.jpg", "album/500x375_b.jpg", "gone/original_c.jpg"):
+            path = os.path.join(temp_dir, rel)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"1234")
+            paths[rel] = path
+        return paths
+
+    def test_removes_unexpected_files_and_empty_dirs(self, temp_dir):
+        """Test orphans are deleted and emptied album folders removed."""
+        paths = self._tree(temp_dir)
+        expected = {paths["album/original_a.jpg"], paths["album/500x375_a.jpg"]}
+
+        orphans, total_size = remove_orphans(temp_dir, expected)
+
+        assert sorted(orphans) == sorted([paths["album/500x375_b.jpg"], paths["gone/original_c.jpg"]])
+        assert total_size == 8
+        assert all(os.path.exists(p) for p in expected)
+        assert not os.path.exists(paths["album/500x375_b.jpg"])
+        assert not os.path.exists(os.path.join(temp_dir, "gone"))
+        assert os.path.isdir(temp_dir)
+
+    def test_dry_run_keeps_files(self, temp_dir):
+        """Test dry run only reports orphans."""
+        paths = self._tree(temp_dir)
+
+        orphans, _ = remove_orphans(temp_dir, set(), dry_run=True)
+
+        assert len(orphans) == 4
+        assert all(os.path.exists(p) for p in paths.values())
+
+    def test_missing_root(self, temp_dir):
+        """Test a missing output folder has no orphans."""
+        assert remove_orphans(os.path.join(temp_dir, "missing"), set()) == ([], 0)
+
+
+class TestShardDir:
+    """Tests for shard_dir function."""
+
+    def test_one_stable_level(self):
+        assert len(shard_dir("photo-jpg")) == 2
+        assert os.sep not in shard_dir("photo-jpg")
+        assert shard_dir("photo-jpg") == shard_dir("photo-jpg")
+
+    def test_spreads_keys(self):
+        assert len({shard_dir("%d.jpg" % i) for i in range(1000)}) > 200
+
+
+class TestDirectoryIndex:
+    """Tests for DirectoryIndex class."""
+
+    def test_lists_each_directory_once(self, temp_dir):
+        for name in ("a.jpg", "b.jpg"):
+            open(os.path.join(temp_dir, name), "w").close()
+        index = DirectoryIndex()
+
+        with patch("os.scandir", wraps=os.scandir) as mock_scandir:
+            assert index.exists(os.path.join(temp_dir, "a.jpg"))
+            assert index.exists(os.path.join(temp_dir, "b.jpg"))
+            assert not index.exists(os.path.join(temp_dir, "c.jpg"))
+            assert not index.exists(os.path.join(temp_dir, "missing", "a.jpg"))
+
+        assert mock_scandir.call_count == 2
+
+    def test_forget(self, temp_dir):
+        index = DirectoryIndex()
+        assert not index.exists(os.path.join(temp_dir, "sub", "a.jpg"))
+        assert not index.exists(os.path.join(temp_dir + "x", "a.jpg"))
+        os.makedirs(os.path.join(temp_dir, "sub"))
+        open(os.path.join(temp_dir, "sub", "a.jpg"), "w").close()
+
+        index.forget(temp_dir)
+
+        assert index.exists(os.path.join(temp_dir, "sub", "a.jpg"))
+        assert list(index.dirs) == [temp_dir + "x", os.path.join(temp_dir, "sub")]
+
+
+class TestLinkFile:
+    """Tests for link_file function."""
+
+    def _source(self, temp_dir):
+        src = os.path.join(temp_dir, "src.jpg")
+        with open(src, "wb") as f:
+            f.write(b"photo")
+        return src
+
+    @pytest.mark.parametrize("strategy", ["copy", "hardlink", "reflink", "symlink"])
+    def test_strategies(self, temp_dir, strategy):
+        """Every strategy gives the content of the source, reflink may fall back to copy."""
+        src = self._source(temp_dir)
+        dst = os.path.join(temp_dir, "dst.jpg")
+
+        used = link_file(src, dst, strategy)
+
+        with open(dst, "rb") as f:
+            assert f.read() == b"photo"
+        assert used in (strategy, "copy")
+        assert os.path.islink(dst) == (used == "symlink")
+        assert os.path.samefile(src, dst) == (used in ("hardlink", "symlink"))
+
+    def test_fallback_to_copy(self, temp_dir):
+        """A link refused by the filesystem falls back to a copy."""
+        src = self._source(temp_dir)
+        dst = os.path.join(temp_dir, "dst.jpg")
+
+        with patch("fussel.generator.util.os.link", side_effect=OSError(18, "Invalid cross-device link")):
+            assert link_file(src, dst, "hardlink") == "copy"
+        assert not os.path.samefile(src, dst)
+
+    def test_replaces_link_without_touching_source(self, temp_dir):
+        """Switching strategy replaces the link instead of writing through it."""
+        src = self._source(temp_dir)
+        dst = os.path.join(temp_dir, "dst.jpg")
+        link_file(src, dst, "hardlink")
+
+        assert link_file(src, dst, "copy") == "copy"
+        assert not os.path.samefile(src, dst)
+        with open(src, "rb") as f:
+            assert f.read() == b"photo"
+
+    def test_interrupted_copy_leaves_no_file(self, temp_dir):
+        """A copy failing halfway leaves neither a truncated destination nor its temporary file."""
+        src = self._source(temp_dir)
+        dst = os.path.join(temp_dir, "dst.jpg")
+
+        def partial_copy(src, dst):
+            with open(dst, "wb") as f:
+                f.write(b"ph")
+            raise OSError(28, "No space left on device")
+
+        with patch("fussel.generator.util.shutil.copyfile", side_effect=partial_copy), pytest.raises(OSError):
+            link_file(src, dst)
+        assert sorted(os.listdir(temp_dir)) == ["src.jpg"]
+
+
+class TestAtomicWrite:
+    """Tests for atomic_write and save_image functions."""
+
+    def test_replaces_once_complete(self, temp_dir):
+        path = os.path.join(temp_dir, "a.jpg")
+        with open(path, "wb") as f:
+            f.write(b"old")
+
+        with atomic_write(path) as f:
+            f.write(b"new")
+            assert sorted(os.listdir(temp_dir)) == sorted(["a.jpg", os.path.basename(f.name)])
+            with open(path, "rb") as current:
+                assert current.read() == b"old"
+
+        with open(path, "rb") as f:
+            assert f.read() == b"new"
+        assert os.listdir(temp_dir) == ["a.jpg"]
+
+    def test_interrupted_write_keeps_previous_content(self, temp_dir):
+        path = os.path.join(temp_dir, "a.jpg")
+        with open(path, "wb") as f:
+            f.write(b"old")
+
+        with pytest.raises(KeyboardInterrupt):
+            with atomic_write(path) as f:
+                f.write(b"ne")
+                raise KeyboardInterrupt
+
+        with open(path, "rb") as f:
+            assert f.read() == b"old"
+        assert os.listdir(temp_dir) == ["a.jpg"]
+
+    def test_save_image_uses_extension_format(self, temp_dir):
+        path = os.path.join(temp_dir, "a.png")
+        save_image(Image.new("RGB", (4, 4)), path)
+
+        with Image.open(path) as im:
+            assert im.format == "PNG"
+
+
+class TestSyncFile:
+    """Tests for sync_file function."""
+
+    def test_skips_unchanged_files(self, temp_dir):
+        """A file published with the same size and mtime is not copied again."""
+        src = os.path.join(temp_dir, "src.jpg")
+        dst = os.path.join(temp_dir, "dst.jpg")
+        with open(src, "wb") as f:
+            f.write(b"photo")
+        sync_file(src, dst)
+        assert os.stat(dst).st_mtime_ns == os.stat(src).st_mtime_ns
+
+        with patch("fussel.generator.util.link_file") as mock_link:
+            sync_file(src, dst)
+        mock_link.assert_not_called()
+
+        with open(src, "wb") as f:
+            f.write(b"edited photo")
+        sync_file(src, dst)
+        with open(dst, "rb") as f:
+            assert f.read() == b"edited photo"
+
+    def test_recreates_symlinks(self, temp_dir):
+        """With the symlink strategy published originals keep pointing at the source."""
+        photo = os.path.join(temp_dir, "photo.jpg")
+        with open(photo, "wb") as f:
+            f.write(b"photo")
+        src = os.path.join(temp_dir, "original.jpg")
+        os.symlink(photo, src)
+        dst = os.path.join(temp_dir, "published.jpg")
+
+        sync_file(src, dst, "symlink")
+
+        assert os.readlink(dst) == photo
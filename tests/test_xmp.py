@@ -0,0 +1,100 @@
+"""
+Tests for fussel.generator.xmp module.
+"""
+
+from fussel.generator.xmp import XmpData, parse_xmp
+
+MWG_PACKET = """<?xpacket begin="﻿" id="W5M0MpCehiHzreSzNTczkc9d"?>
+<x:xmpmeta xmlns:x="adobe:ns:meta/">
+ <rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+  <rdf:Description rdf:about=""
+    xmlns:xmp="http://ns.adobe.com/xap/1.0/"
+    xmlns:photoshop="http://ns.adobe.com/photoshop/1.0/"
+    xmlns:mwg-rs="http://www.metadataworkinggroup.com/schemas/regions/"
+    xmlns:stArea="http://ns.adobe.com/xmp/sType/Area#"
+    xmp:ModifyDate="2022-02-02T02:02:02"
+    photoshop:DateCreated="2021-01-01T01:01:01">
+   <mwg-rs:Regions rdf:parseType="Resource">
+    <mwg-rs:RegionList>
+     <rdf:Bag>
+      <rdf:li>
+       <rdf:Description mwg-rs:Name="Jane Doe" mwg-rs:Type="Face">
+        <mwg-rs:Area stArea:x="0.5" stArea:y="0.4" stArea:w="0.1" stArea:h="0.2" stArea:unit="normalized"/>
+       </rdf:Description>
+      </rdf:li>
+      <rdf:li>
+       <rdf:Description rdf:parseType="Resource">
+        <mwg-rs:Name>John Doe</mwg-rs:Name>
+        <mwg-rs:Type>Face</mwg-rs:Type>
+        <mwg-rs:Area rdf:parseType="Resource">
+         <stArea:x>0.25</stArea:x>
+         <stArea:y>0.35</stArea:y>
+         <stArea:w>0.05</stArea:w>
+         <stArea:h>0.06</stArea:h>
+        </mwg-rs:Area>
+       </rdf:Description>
+      </rdf:li>
+     </rdf:Bag>
+    </mwg-rs:RegionList>
+   </mwg-rs:Regions>
+  </rdf:Description>
+ </rdf:RDF>
+</x:xmpmeta>
+<?xpacket end="w"?>"""
+
+
+class TestParseXmp:
+    """Tests for parse_xmp function."""
+
+    def test_mwg_regions(self):
+        """Regions are found with attribute and element forms, in document order."""
+        data = parse_xmp(MWG_PACKET)
+
+        assert data.regions == [
+            ("Jane Doe", "0.1", "0.2", "0.5", "0.4"),
+            ("John Doe", "0.05", "0.06", "0.25", "0.35"),
+        ]
+
+    def test_dates_in_preference_order(self):
+        """DateCreated is preferred over ModifyDate regardless of attribute order."""
+        data = parse_xmp(MWG_PACKET.encode("utf-8"))
+
+        assert data.dates == ["2021-01-01T01:01:01", "2022-02-02T02:02:02"]
+
+    def test_date_as_element(self):
+        packet = """<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">
+            <rdf:Description><exif:DateTimeOriginal>2020:03:04 05:06:07</exif:DateTimeOriginal></rdf:Description>
+        </rdf:RDF>"""
+
+        assert parse_xmp(packet).dates == ["2020:03:04 05:06:07"]
+
+    def test_undeclared_prefixes(self):
+        """Writers that omit namespace declarations are still understood."""
+        packet = """<rdf:RDF>
+            <rdf:Description type="Face" name="Jane Doe">
+                <Area x="0.3" y="0.4" w="0.15" h="0.25"/>
+            </rdf:Description>
+        </rdf:RDF>"""
+
+        assert parse_xmp(packet).regions == [("Jane Doe", "0.15", "0.25", "0.3", "0.4")]
+
+    def test_unnamed_region_without_type_is_ignored(self):
+        packet = """<rdf:RDF><rdf:Description><Area x="0.3" y="0.4" w="0.15" h="0.25"/></rdf:Description></rdf:RDF>"""
+
+        assert parse_xmp(packet).regions == []
+
+    def test_incomplete_area_is_ignored(self):
+        packet = (
+            """<rdf:RDF><rdf:Description type="Face" name="Jane"><Area x="0.3" y="0.4"/></rdf:Description></rdf:RDF>"""
+        )
+
+        assert parse_xmp(packet).regions == []
+
+    def test_malformed_packet_keeps_partial_results(self):
+        packet = """<rdf:RDF><rdf:Description type="Face" name="Jane"><Area x="1" y="2" w="3" h="4"/></rdf:Description>
+            <rdf:Description name="Broken"><Area x="1" y="""
+
+        assert parse_xmp(packet).regions == [("Jane", "3", "4", "1", "2")]
+
+    def test_empty_packet(self):
+        assert parse_xmp("") == XmpData()